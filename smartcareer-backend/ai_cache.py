@@ -0,0 +1,250 @@
+"""
+Response cache for the AI services
+
+Two tiers:
+  - an in-process TTL cache bounded to config.MAX_CACHE_SIZE entries
+  - an optional MySQL table (AI_PERSISTENT_CACHE=true) shared by every web and
+    worker process, which also provides cross-process locks through MySQL's
+    GET_LOCK()
+
+Failed calls can be remembered briefly in a separate in-process negative tier,
+so a prompt that just failed is not sent again straight away.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from cachetools import TTLCache
+import mysql.connector
+import config
+import metrics
+
+logger = logging.getLogger('ai_cache')
+
+CREATE_AI_RESPONSE_CACHE_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_response_cache (
+        cache_key CHAR(64) PRIMARY KEY,
+        value MEDIUMTEXT NOT NULL,
+        expires_at DATETIME NOT NULL,
+        KEY idx_ai_response_cache_expires (expires_at)
+    )
+"""
+
+def get_db_connection():
+    try:
+        return metrics.connect_mysql('ai_cache', **config.DB_CONFIG)
+    except mysql.connector.Error as err:
+        logger.error("Database connection error: %s", err)
+        raise
+
+def normalize_prompt(prompt):
+    """Prompt text with line endings and trailing whitespace normalized"""
+    lines = str(prompt).replace('\r\n', '\n').replace('\r', '\n').strip().split('\n')
+    return '\n'.join(line.rstrip() for line in lines)
+
+def make_cache_key(provider, model_name, prompt, parameters=None):
+    """
+    Stable cache key: a SHA-256 digest of the normalized prompt, the model and
+    the generation parameters. It is the same in every process, so entries can
+    be shared through the persistent tier.
+    """
+    canonical = json.dumps({
+        "provider": provider,
+        "model": model_name,
+        "prompt": normalize_prompt(prompt),
+        "parameters": parameters or {},
+    }, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """Thread-safe two-tier cache for model responses"""
+
+    def __init__(self, name, maxsize=None, ttl=None, persistent=None, negative_ttl=None):
+        self.name = name
+        self.ttl = ttl or config.CACHE_TIMEOUT
+        self.persistent = config.AI_PERSISTENT_CACHE if persistent is None else persistent
+        self.negative_ttl = config.AI_NEGATIVE_CACHE_TTL if negative_ttl is None else negative_ttl
+        self._memory = TTLCache(maxsize=maxsize or config.MAX_CACHE_SIZE, ttl=self.ttl)
+        self._negative = TTLCache(maxsize=maxsize or config.MAX_CACHE_SIZE, ttl=max(self.negative_ttl, 0.001))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def get(self, key):
+        """Return the cached value for a key, or None"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        if self.persistent:
+            value = self._get_persistent(key)
+            if value is not None:
+                with self._lock:
+                    self._memory[key] = value
+                    self.persistent_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+        if self.persistent:
+            self._set_persistent(key, value)
+
+    def set_negative(self, key):
+        """Remember that computing this key just failed (in-process, for negative_ttl seconds)"""
+        if self.negative_ttl > 0:
+            with self._lock:
+                self._negative[key] = True
+
+    def is_negative(self, key):
+        """True while a recent failure for this key is remembered"""
+        with self._lock:
+            if key in self._negative:
+                self.negative_hits += 1
+                return True
+            return False
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._negative.pop(key, None)
+        if self.persistent:
+            self._delete_persistent(key)
+
+    def clear(self):
+        """Clear the in-process tier"""
+        with self._lock:
+            self._memory.clear()
+            self._negative.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._memory),
+                "maxsize": self._memory.maxsize,
+                "ttl": self.ttl,
+                "persistent": self.persistent,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "negative_size": len(self._negative),
+                "negative_ttl": self.negative_ttl,
+                "negative_hits": self.negative_hits,
+                "hit_ratio": round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0
+            }
+
+    @contextmanager
+    def lock(self, key, timeout=None):
+        """
+        Hold a cross-process lock for a key while the block runs.
+
+        Without the persistent tier there is nothing to share across processes,
+        so this is a no-op. If the lock can't be taken in time the block still
+        runs; a duplicate model call is better than failing the request.
+        """
+        if not self.persistent:
+            yield False
+            return
+
+        timeout = config.AI_CROSS_PROCESS_LOCK_TIMEOUT if timeout is None else timeout
+        lock_name = f"{self.name}:{key}"[:64]
+        conn = None
+        acquired = False
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            # GET_LOCK takes whole seconds
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (lock_name, max(int(timeout), 0)))
+            acquired = cursor.fetchone()[0] == 1
+            cursor.close()
+            if not acquired:
+                logger.warning("Timed out waiting for cross-process lock %s", lock_name)
+        except mysql.connector.Error as err:
+            logger.warning("Could not take cross-process lock %s: %s", lock_name, err)
+
+        try:
+            yield acquired
+        finally:
+            if conn is not None:
+                try:
+                    if acquired:
+                        cursor = conn.cursor()
+                        cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                        cursor.fetchone()
+                        cursor.close()
+                finally:
+                    # Closing the session releases the lock as well
+                    conn.close()
+
+    def _get_persistent(self, key):
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT value FROM ai_response_cache
+                    WHERE cache_key = %s AND expires_at > NOW()
+                """, (key,))
+                row = cursor.fetchone()
+                cursor.close()
+            finally:
+                conn.close()
+            return row[0] if row else None
+        except mysql.connector.Error as err:
+            logger.warning("Persistent cache read failed: %s", err)
+            return None
+
+    def _set_persistent(self, key, value):
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO ai_response_cache (cache_key, value, expires_at)
+                    VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+                    ON DUPLICATE KEY UPDATE value = VALUES(value), expires_at = VALUES(expires_at)
+                """, (key, value, self.ttl))
+                conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+        except mysql.connector.Error as err:
+            logger.warning("Persistent cache write failed: %s", err)
+
+    def _delete_persistent(self, key):
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM ai_response_cache WHERE cache_key = %s", (key,))
+                conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+        except mysql.connector.Error as err:
+            logger.warning("Persistent cache delete failed: %s", err)
+
+def purge_expired_entries():
+    """Delete expired rows from the persistent tier"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ai_response_cache WHERE expires_at <= NOW()")
+        deleted = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    return deleted
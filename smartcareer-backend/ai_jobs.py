@@ -0,0 +1,294 @@
+"""
+Durable AI job queue for SmartCareer
+
+AI generation requests are stored in the `ai_jobs` MySQL table by the web tier
+and executed by ai_worker.py. The web tier only ever inserts a row or reads one
+back, so a slow Gemini call never holds a web worker.
+
+Job lifecycle:
+  pending -> running -> done
+                     -> pending (retry, until AI_JOB_MAX_ATTEMPTS)
+                     -> failed
+"""
+
+import json
+import hashlib
+import logging
+import uuid
+import mysql.connector
+import config
+import metrics
+
+logger = logging.getLogger('ai_jobs')
+
+# Task names match the keys of config.FALLBACK_RESPONSES
+AI_TASKS = ('resume_feedback', 'career_advice', 'detailed_roadmap')
+
+TERMINAL_STATUSES = ('done', 'failed')
+
+# `active_key` holds the dedupe key while a job is pending or running and is
+# cleared once it finishes. The UNIQUE index on it (NULLs are allowed to repeat)
+# guarantees at most one live job per identical request, even when two web
+# workers submit at the same moment.
+CREATE_AI_JOBS_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_jobs (
+        id CHAR(32) PRIMARY KEY,
+        task VARCHAR(32) NOT NULL,
+        dedupe_key CHAR(64) NOT NULL,
+        active_key CHAR(64) NULL,
+        payload MEDIUMTEXT NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        attempts INT NOT NULL DEFAULT 0,
+        result MEDIUMTEXT,
+        error TEXT,
+        claimed_by CHAR(32) NULL,
+        visible_at DATETIME NOT NULL,
+        expires_at DATETIME NULL,
+        created_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL,
+        UNIQUE KEY uq_ai_jobs_active_key (active_key),
+        KEY idx_ai_jobs_claim (status, visible_at),
+        KEY idx_ai_jobs_expires (expires_at)
+    )
+"""
+
+def get_db_connection():
+    try:
+        return metrics.connect_mysql('ai_jobs', **config.DB_CONFIG)
+    except mysql.connector.Error as err:
+        logger.error("Database connection error: %s", err)
+        raise
+
+def ensure_jobs_table():
+    """Create the ai_jobs table if it does not exist yet"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(CREATE_AI_JOBS_TABLE)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+def get_dedupe_key(task, payload):
+    """Build a stable key for a task and its (JSON serializable) payload"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f"{task}:{canonical}".encode()).hexdigest()
+
+def submit_job(task, payload, delay=0):
+    """
+    Queue an AI job and return (job_id, status, created).
+
+    If an identical job is already pending or running, its id is returned
+    (with created False) instead of queueing a duplicate. With `delay` the job only becomes visible
+    to workers after that many seconds, and submitting it again while it is
+    still pending pushes that back (debouncing a burst of submissions into
+    one job).
+    """
+    if task not in AI_TASKS:
+        raise ValueError(f"Unknown AI task: {task}")
+
+    dedupe_key = get_dedupe_key(task, payload)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id, status FROM ai_jobs WHERE active_key = %s", (dedupe_key,))
+        existing = cursor.fetchone()
+        if existing:
+            if delay and existing['status'] == 'pending':
+                cursor.execute("""
+                    UPDATE ai_jobs
+                    SET visible_at = GREATEST(visible_at, NOW() + INTERVAL %s SECOND),
+                        updated_at = NOW()
+                    WHERE id = %s AND status = 'pending'
+                """, (delay, existing['id']))
+                conn.commit()
+            logger.info("Reusing in-flight AI job %s for task %s", existing['id'], task)
+            cursor.close()
+            return existing['id'], existing['status'], False
+
+        job_id = uuid.uuid4().hex
+        try:
+            cursor.execute("""
+                INSERT INTO ai_jobs (
+                    id, task, dedupe_key, active_key, payload, status,
+                    visible_at, created_at, updated_at
+                ) VALUES (%s, %s, %s, %s, %s, 'pending', NOW() + INTERVAL %s SECOND, NOW(), NOW())
+            """, (job_id, task, dedupe_key, dedupe_key, json.dumps(payload, default=str), delay))
+            conn.commit()
+        except mysql.connector.IntegrityError as e:
+            if e.errno != 1062:
+                raise
+            # Another request queued the same job between our SELECT and INSERT
+            conn.rollback()
+            cursor.execute("SELECT id, status FROM ai_jobs WHERE active_key = %s", (dedupe_key,))
+            existing = cursor.fetchone()
+            if not existing:
+                raise
+            cursor.close()
+            return existing['id'], existing['status'], False
+
+        cursor.close()
+        logger.info("Queued AI job %s for task %s", job_id, task)
+        return job_id, 'pending', True
+    finally:
+        conn.close()
+
+# Also run by async_db.get_job()
+GET_JOB_SQL = """
+    SELECT id, task, status, attempts, result, error, created_at, updated_at
+    FROM ai_jobs
+    WHERE id = %s AND (expires_at IS NULL OR expires_at > NOW())
+"""
+
+def decode_job(job):
+    """A row read with GET_JOB_SQL with its result decoded, or None"""
+    if job and job['result'] is not None:
+        job['result'] = json.loads(job['result'])
+    return job
+
+def get_job(job_id):
+    """Return a job as a dict, or None if it is unknown or its result expired"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(GET_JOB_SQL, (job_id,))
+        job = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    return decode_job(job)
+
+def claim_job(visibility_timeout=None, max_attempts=None):
+    """
+    Claim the oldest visible job for this worker.
+
+    The claimed job stays invisible to other workers for `visibility_timeout`
+    seconds. If the worker dies before completing it, the job becomes visible
+    again and is picked up by another worker. Returns (job, claim_token) or
+    (None, None) when the queue is empty.
+    """
+    visibility_timeout = visibility_timeout or config.AI_JOB_VISIBILITY_TIMEOUT
+    max_attempts = max_attempts or config.AI_JOB_MAX_ATTEMPTS
+    claim_token = uuid.uuid4().hex
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            UPDATE ai_jobs
+            SET status = 'running',
+                claimed_by = %s,
+                attempts = attempts + 1,
+                visible_at = NOW() + INTERVAL %s SECOND,
+                updated_at = NOW()
+            WHERE status IN ('pending', 'running')
+              AND visible_at <= NOW()
+              AND attempts < %s
+            ORDER BY visible_at, created_at
+            LIMIT 1
+        """, (claim_token, visibility_timeout, max_attempts))
+        conn.commit()
+
+        if cursor.rowcount == 0:
+            cursor.close()
+            return None, None
+
+        cursor.execute("""
+            SELECT id, task, payload, attempts, created_at
+            FROM ai_jobs
+            WHERE claimed_by = %s
+        """, (claim_token,))
+        job = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+
+    if not job:
+        return None, None
+    job['payload'] = json.loads(job['payload'])
+    return job, claim_token
+
+def complete_job(job_id, claim_token, result, result_ttl=None):
+    """Store the result of a job; it stays readable for `result_ttl` seconds"""
+    result_ttl = result_ttl or config.AI_JOB_RESULT_TTL
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ai_jobs
+            SET status = 'done',
+                result = %s,
+                error = NULL,
+                active_key = NULL,
+                expires_at = NOW() + INTERVAL %s SECOND,
+                updated_at = NOW()
+            WHERE id = %s AND claimed_by = %s
+        """, (json.dumps(result), result_ttl, job_id, claim_token))
+        conn.commit()
+        updated = cursor.rowcount
+        cursor.close()
+    finally:
+        conn.close()
+
+    if updated == 0:
+        logger.warning("AI job %s was reclaimed by another worker, result discarded", job_id)
+    return updated > 0
+
+def fail_job(job_id, claim_token, error, max_attempts=None, result_ttl=None):
+    """
+    Release a failed job for retry, or mark it failed once out of attempts.
+    Returns False if another worker reclaimed the job in the meantime.
+    """
+    max_attempts = max_attempts or config.AI_JOB_MAX_ATTEMPTS
+    result_ttl = result_ttl or config.AI_JOB_RESULT_TTL
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ai_jobs
+            SET status = IF(attempts >= %s, 'failed', 'pending'),
+                active_key = IF(attempts >= %s, NULL, active_key),
+                expires_at = IF(attempts >= %s, NOW() + INTERVAL %s SECOND, NULL),
+                visible_at = NOW(),
+                error = %s,
+                updated_at = NOW()
+            WHERE id = %s AND claimed_by = %s
+        """, (max_attempts, max_attempts, max_attempts, result_ttl, str(error)[:1000], job_id, claim_token))
+        conn.commit()
+        updated = cursor.rowcount
+        cursor.close()
+    finally:
+        conn.close()
+    return updated > 0
+
+def purge_expired_jobs(max_attempts=None, result_ttl=None):
+    """
+    Delete finished jobs whose result TTL has passed and fail jobs that ran out
+    of attempts without ever completing (e.g. the worker kept crashing).
+    """
+    max_attempts = max_attempts or config.AI_JOB_MAX_ATTEMPTS
+    result_ttl = result_ttl or config.AI_JOB_RESULT_TTL
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ai_jobs
+            SET status = 'failed',
+                active_key = NULL,
+                error = COALESCE(error, 'Visibility timeout exceeded'),
+                expires_at = NOW() + INTERVAL %s SECOND,
+                updated_at = NOW()
+            WHERE status = 'running' AND visible_at <= NOW() AND attempts >= %s
+        """, (result_ttl, max_attempts))
+        abandoned = cursor.rowcount
+        cursor.execute("DELETE FROM ai_jobs WHERE expires_at IS NOT NULL AND expires_at <= NOW()")
+        deleted = cursor.rowcount
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    if abandoned or deleted:
+        logger.info("Purged %s expired AI jobs, failed %s abandoned jobs", deleted, abandoned)
+    return deleted, abandoned
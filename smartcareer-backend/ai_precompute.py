@@ -0,0 +1,302 @@
+"""
+Precomputed AI results for SmartCareer
+
+A user's feedback, advice and roadmap only change when their profile changes,
+so they are generated when the profile is edited instead of when they are
+requested:
+  - add/delete internship or milestone and profile updates call
+    profile_changed() on a background thread (schedule_profile_changed()),
+    which stores a fingerprint of the profile content in `ai_profile_state`
+    and queues one regeneration job per task in ai_jobs. The jobs become
+    visible after AI_PRECOMPUTE_DEBOUNCE seconds and every further change in
+    that window pushes them back, so a burst of edits costs one generation.
+    Each new round of jobs is charged to the user's quota.PRECOMPUTE quota;
+    once that is used up, results are generated on request instead.
+  - ai_worker.py runs those jobs through run_precompute(), which stores each
+    result in `ai_precomputed_results` under the fingerprint it was made from.
+  - the AI endpoints compute the fingerprint of the profile they were asked
+    about and serve the stored result when it matches; only a miss generates
+    live (and stores the answer for next time).
+
+Skills are not kept in the database; the skills of the user's last AI request
+are remembered in `ai_profile_state` so precomputed results use them too.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+import config
+import metrics
+import ai_jobs
+import quota
+from prompt_builder import get_skills, normalize_text
+
+logger = logging.getLogger('ai_precompute')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+CREATE_AI_PROFILE_STATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_profile_state (
+        email VARCHAR(255) PRIMARY KEY,
+        fingerprint CHAR(64) NOT NULL,
+        skills TEXT,
+        changed_at DATETIME NOT NULL,
+        updated_at DATETIME NOT NULL
+    )
+"""
+
+CREATE_AI_PRECOMPUTED_RESULTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_precomputed_results (
+        email VARCHAR(255) NOT NULL,
+        task VARCHAR(32) NOT NULL,
+        fingerprint CHAR(64) NOT NULL,
+        result MEDIUMTEXT NOT NULL,
+        created_at DATETIME NOT NULL,
+        PRIMARY KEY (email, task)
+    )
+"""
+
+class ProfileChanged(Exception):
+    """The profile changed while its results were being generated; the job is retried"""
+
+def get_db_connection():
+    try:
+        return metrics.connect_mysql('ai_precompute', **config.DB_CONFIG)
+    except mysql.connector.Error as err:
+        logger.error("Database connection error: %s", err)
+        raise
+
+def profile_content(user_data):
+    """The parts of a profile the AI results depend on, in a canonical order"""
+    internships = []
+    milestones = []
+    for exp in user_data.get('internships') or []:
+        if isinstance(exp, dict):
+            internships.append([normalize_text(exp.get(field)) for field in ('company', 'role', 'dates', 'description')])
+        else:
+            internships.append([normalize_text(exp)])
+    for exp in user_data.get('milestones') or []:
+        if isinstance(exp, dict):
+            milestones.append([normalize_text(exp.get(field)) for field in ('title', 'date', 'description')])
+        else:
+            milestones.append([normalize_text(exp)])
+
+    return {
+        "internships": sorted(internships),
+        "milestones": sorted(milestones),
+        "skills": sorted(skill.lower() for skill in get_skills(user_data)),
+    }
+
+def profile_fingerprint(user_data):
+    canonical = json.dumps(profile_content(user_data), sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def is_fallback(task, result):
+    return result == config.FALLBACK_RESPONSES[task]
+
+def load_profile(email, cursor):
+    """The user_data the AI generators need, read from the database, or None for an unknown user"""
+    cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
+    user = cursor.fetchone()
+    if not user:
+        return None
+
+    cursor.execute("""
+        SELECT company, role, dates, description
+        FROM internships
+        WHERE user_id = %s
+    """, (user['id'],))
+    internships = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT title, date, description
+        FROM milestones
+        WHERE user_id = %s
+    """, (user['id'],))
+    milestones = cursor.fetchall()
+    for milestone in milestones:
+        if hasattr(milestone['date'], 'strftime'):
+            milestone['date'] = milestone['date'].strftime('%Y-%m-%d')
+
+    cursor.execute("SELECT skills FROM ai_profile_state WHERE email = %s", (email,))
+    state = cursor.fetchone()
+    skills = json.loads(state['skills']) if state and state['skills'] else []
+
+    return {
+        "email": email,
+        "internships": internships,
+        "milestones": milestones,
+        "skills": skills,
+    }
+
+def read_profile(email):
+    """load_profile() on its own connection"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        user_data = load_profile(email, cursor)
+        cursor.close()
+    finally:
+        conn.close()
+    return user_data
+
+def profile_changed(email, debounce=None):
+    """
+    Record the current fingerprint of a user's profile and, if it changed,
+    queue debounced regeneration jobs. Returns the fingerprint, or None if the
+    user does not exist.
+    """
+    debounce = config.AI_PRECOMPUTE_DEBOUNCE if debounce is None else debounce
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        user_data = load_profile(email, cursor)
+        if user_data is None:
+            cursor.close()
+            return None
+
+        fingerprint = profile_fingerprint(user_data)
+        cursor.execute("SELECT fingerprint FROM ai_profile_state WHERE email = %s", (email,))
+        state = cursor.fetchone()
+        changed = not state or state['fingerprint'] != fingerprint
+
+        cursor.execute("""
+            INSERT INTO ai_profile_state (email, fingerprint, changed_at, updated_at)
+            VALUES (%s, %s, NOW(), NOW())
+            ON DUPLICATE KEY UPDATE
+                changed_at = IF(fingerprint = VALUES(fingerprint), changed_at, NOW()),
+                fingerprint = VALUES(fingerprint),
+                updated_at = NOW()
+        """, (email, fingerprint))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    if changed and queue_regeneration(email, debounce):
+        logger.info("Profile of %s changed, regeneration queued in %ss", email, debounce)
+    return fingerprint
+
+def queue_regeneration(email, debounce):
+    """
+    Queue one debounced regeneration job per task. A round that queues a new
+    job costs one unit of the user's precompute quota; a round that only
+    pushes back jobs already pending is refunded. Returns False when the
+    quota is used up and nothing was queued.
+    """
+    if config.AI_QUOTA:
+        try:
+            quota.ledger.consume(email, quota.PRECOMPUTE)
+        except quota.QuotaExceeded:
+            logger.info("Precompute quota of %s is used up, results will be generated on request", email)
+            return False
+
+    created = False
+    try:
+        for task in ai_jobs.AI_TASKS:
+            created = ai_jobs.submit_job(task, {"email": email, "precompute": True}, delay=debounce)[2] or created
+    finally:
+        if config.AI_QUOTA and not created:
+            quota.ledger.refund(email, quota.PRECOMPUTE)
+    return True
+
+def get_executor():
+    """Threads running profile_changed() for the web tier, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.AI_PRECOMPUTE_THREADS, thread_name_prefix='precompute')
+        return _executor
+
+def after_fork():
+    """Drop the executor inherited from the parent process; its threads did not survive the fork"""
+    global _executor, _executor_lock
+    _executor_lock = threading.Lock()
+    _executor = None
+
+def _profile_changed_logged(email):
+    try:
+        profile_changed(email)
+    except Exception as e:
+        logger.error("Could not queue AI regeneration for %s: %s", email, e)
+
+def schedule_profile_changed(email):
+    """Run profile_changed() on a background thread, so a profile edit doesn't wait on its queries"""
+    get_executor().submit(_profile_changed_logged, email)
+
+def get_result(email, task, fingerprint, max_age=None):
+    """The stored result for this exact profile content, or None"""
+    max_age = config.AI_PRECOMPUTE_MAX_AGE if max_age is None else max_age
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+            SELECT result
+            FROM ai_precomputed_results
+            WHERE email = %s AND task = %s AND fingerprint = %s
+              AND created_at > NOW() - INTERVAL %s SECOND
+        """, (email, task, fingerprint, max_age))
+        row = cursor.fetchone()
+        cursor.close()
+    finally:
+        conn.close()
+    return json.loads(row['result']) if row else None
+
+def store_result(user_data, task, fingerprint, result):
+    """Store a generated result and remember the skills it was generated with"""
+    if is_fallback(task, result):
+        return False
+
+    email = user_data['email']
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO ai_precomputed_results (email, task, fingerprint, result, created_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE
+                fingerprint = VALUES(fingerprint),
+                result = VALUES(result),
+                created_at = NOW()
+        """, (email, task, fingerprint, json.dumps(result)))
+        cursor.execute("""
+            INSERT INTO ai_profile_state (email, fingerprint, skills, changed_at, updated_at)
+            VALUES (%s, %s, %s, NOW(), NOW())
+            ON DUPLICATE KEY UPDATE skills = VALUES(skills), updated_at = NOW()
+        """, (email, fingerprint, json.dumps(get_skills(user_data))))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    return True
+
+def run_precompute(task, email, handler, deadline):
+    """
+    Generate and store one task's result for a user's current profile (the
+    ai_worker handler for precompute jobs). Raises so the job is retried when
+    generation fails or the profile changed while it ran.
+    """
+    user_data = read_profile(email)
+    if user_data is None:
+        logger.info("Skipping %s precompute for deleted user %s", task, email)
+        return None
+
+    fingerprint = profile_fingerprint(user_data)
+    if get_result(email, task, fingerprint) is not None:
+        logger.info("%s for %s is already up to date", task, email)
+        return {"fingerprint": fingerprint, "skipped": True}
+
+    result = handler(user_data, deadline=deadline)
+    if is_fallback(task, result):
+        raise RuntimeError(f"Generation of {task} for {email} returned the fallback response")
+    store_result(user_data, task, fingerprint, result)
+
+    current = read_profile(email)
+    if current is not None and profile_fingerprint(current) != fingerprint:
+        raise ProfileChanged(f"Profile of {email} changed during {task} precompute")
+
+    return {"fingerprint": fingerprint, "skipped": False}
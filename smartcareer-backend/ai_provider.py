@@ -0,0 +1,104 @@
+"""
+AI provider selection
+
+A provider is a module implementing the AI interface below. The web app, the
+job worker and the batch tools only talk to get_provider(), so the backend is
+chosen with AI_PROVIDER instead of a hard-coded import:
+  gemini       ai_service_gemini against the Gemini API (default)
+  huggingface  ai_service_hf against the Hugging Face Inference API
+  mock         ai_service_gemini against a local mock model (no network)
+  record       ai_service_gemini against Gemini, saving answers as fixtures
+  replay       ai_service_gemini answering from saved fixtures (no network)
+
+mock, record and replay keep the whole Gemini pipeline (prompts, caching, rate
+limits, breakers, parsing) and only swap the model client underneath it; see
+model_clients.py.
+"""
+
+import asyncio
+import importlib
+import threading
+import config
+
+PROVIDER_MODULES = {
+    'gemini': 'ai_service_gemini',
+    'huggingface': 'ai_service_hf',
+    'mock': 'ai_service_gemini',
+    'record': 'ai_service_gemini',
+    'replay': 'ai_service_gemini',
+}
+
+# The AI interface. Every generator takes (user_data, deadline=None) and
+# returns the result, or the task's fallback response on failure. Every stream
+# function yields (event, data) pairs ending with one ("result", data) event.
+# status() returns a JSON-serializable dict for /api/ai/status. A provider may
+# also offer coroutine versions of the generators (agenerate_*) for asgi.py.
+PROVIDER_INTERFACE = (
+    'generate_resume_feedback',
+    'generate_career_advice',
+    'generate_detailed_roadmap',
+    'stream_resume_feedback',
+    'stream_career_advice',
+    'stream_detailed_roadmap',
+    'status',
+)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def load_provider(name=None):
+    """Import the module for a provider name and check it implements the interface"""
+    name = name or config.AI_PROVIDER
+    if name not in PROVIDER_MODULES:
+        raise ValueError(f"Unknown AI provider: {name} (expected one of {', '.join(PROVIDER_MODULES)})")
+
+    module = importlib.import_module(PROVIDER_MODULES[name])
+    missing = [attr for attr in PROVIDER_INTERFACE if not callable(getattr(module, attr, None))]
+    if missing:
+        raise TypeError(f"AI provider {name} is missing {', '.join(missing)}")
+    return module
+
+def get_provider():
+    """The configured provider, imported on first use"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = load_provider()
+    return _provider
+
+def loaded_provider():
+    """The provider if it has been loaded already, otherwise None (never imports one)"""
+    return _provider
+
+def after_fork():
+    """Let a provider loaded before a fork rebuild its network clients in the new process"""
+    if _provider is not None and callable(getattr(_provider, 'after_fork', None)):
+        _provider.after_fork()
+
+def get_task_handlers():
+    """Map AI task names to the provider's generator functions"""
+    provider = get_provider()
+    return {
+        'resume_feedback': provider.generate_resume_feedback,
+        'career_advice': provider.generate_career_advice,
+        'detailed_roadmap': provider.generate_detailed_roadmap,
+    }
+
+def _in_thread(func):
+    """Coroutine running a blocking generator on the default thread pool"""
+    async def run(user_data, deadline=None):
+        return await asyncio.to_thread(func, user_data, deadline=deadline)
+    return run
+
+def get_async_task_handlers():
+    """
+    Map AI task names to coroutine functions: the provider's agenerate_*
+    functions where it has them, otherwise its blocking generators run on a thread
+    """
+    provider = get_provider()
+    handlers = {}
+    for task, func in get_task_handlers().items():
+        native = getattr(provider, f"a{func.__name__}", None)
+        handlers[task] = native if callable(native) else _in_thread(func)
+    return handlers
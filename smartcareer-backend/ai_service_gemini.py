@@ -1,11 +1,22 @@
+import asyncio
+import os
 import time
 import logging
 import json
-from functools import wraps
-import google.generativeai as genai
-import os
+from typing import TypedDict
 from dotenv import load_dotenv
 import config
+from rate_limiter import RateLimiter, RateLimitExceeded
+import resilience
+import hedging
+import quota
+import prompt_builder
+import json_extract
+from deadline import Deadline, DeadlineExceeded
+import ai_cache
+from single_flight import SingleFlight, AsyncSingleFlight
+import model_clients
+from similarity_cache import SimilarityCache
 
 # Configure logger
 logging.basicConfig(
@@ -17,61 +28,51 @@ logger = logging.getLogger('ai_service_gemini')
 # Load environment variables
 load_dotenv()
 
-# Initialize Gemini client
+# Initialize the model client (the Gemini API, or a mock/record/replay client per AI_PROVIDER)
 try:
-    api_key = os.getenv('GEMINI_API_KEY')
-    if not api_key:
-        logger.error("Gemini API key not found in environment variables")
-        raise ValueError("Missing GEMINI_API_KEY in .env file")
-    elif api_key == 'your_api_key_here':
-        logger.error("Default API key detected. Please update with actual Gemini API key")
-        raise ValueError("Please update GEMINI_API_KEY in .env file with your actual API key")
-    
-    genai.configure(api_key=api_key)
-    
-    # Test the API key by making a simple request
-    model = genai.GenerativeModel('models/gemini-1.5-flash-8b')
-    test_response = model.generate_content("Test")
-    if test_response and test_response.text:
-        logger.info("Gemini client initialized and tested successfully")
-    else:
-        raise ValueError("API key validation failed")
+    model_client = model_clients.create_model_client()
 except Exception as e:
-    logger.error(f"Failed to initialize Gemini client: {e}")
+    logger.error("Failed to initialize Gemini client: %s", e)
     raise
 
-# Simple in-memory cache
-cache = {}
-cache_timestamps = {}  # To track when entries were added
-
-# Rate limiting setup
-request_timestamps = []
-MAX_REQUESTS = config.MAX_REQUESTS_PER_MINUTE
-REQUEST_WINDOW = 60  # 1 minute in seconds
-CACHE_TIMEOUT = config.CACHE_TIMEOUT  # Cache timeout in seconds
-
-def rate_limited(func):
-    """Decorator to apply rate limiting to a function"""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        global request_timestamps
-        
-        current_time = time.time()
-        # Clean up old timestamps
-        request_timestamps = [ts for ts in request_timestamps if current_time - ts < REQUEST_WINDOW]
-        
-        # Check if we're over the limit
-        if len(request_timestamps) >= MAX_REQUESTS:
-            logger.warning(f"Rate limit exceeded ({MAX_REQUESTS} requests per minute)")
-            raise Exception("Rate limit exceeded. Please try again later.")
-        
-        # Add current timestamp
-        request_timestamps.append(current_time)
-        
-        # Call the actual function
-        return func(*args, **kwargs)
-    
-    return wrapper
+def after_fork():
+    """gRPC channels don't survive a fork, so each worker builds its own model client"""
+    global model_client
+    model_client = model_clients.create_model_client()
+    logger.info("Model client re-created in process %s", os.getpid())
+
+# Response cache (bounded in-memory tier, optional MySQL tier)
+response_cache = ai_cache.ResponseCache('ai_service_gemini')
+
+# Results reused across users with near-identical profiles
+similar_results = {
+    task: SimilarityCache(task)
+    for task in ('resume_feedback', 'career_advice', 'detailed_roadmap')
+}
+
+def find_similar_result(task, user_data):
+    """A stored result for a near-identical profile, or None"""
+    if not config.AI_SIMILARITY_CACHE:
+        return None
+    match = similar_results[task].lookup(user_data)
+    return match[0] if match else None
+
+def remember_result(task, user_data, result):
+    if config.AI_SIMILARITY_CACHE:
+        similar_results[task].store(user_data, result)
+
+# Coalesces identical in-flight requests so concurrent callers share one model call
+in_flight = SingleFlight()
+async_in_flight = AsyncSingleFlight()
+
+# Rate limiting setup: global and per-user token buckets with a bounded wait queue
+limiter = RateLimiter(
+    'gemini',
+    per_minute=config.MAX_REQUESTS_PER_MINUTE,
+    per_user_per_minute=config.AI_USER_REQUESTS_PER_MINUTE,
+    max_queue=config.AI_RATE_LIMIT_MAX_QUEUE,
+    max_wait=config.AI_RATE_LIMIT_MAX_WAIT
+)
 
 def get_cache_key(prompt, model_name):
     """Generate a cache key based on request parameters"""
@@ -80,107 +81,328 @@ def get_cache_key(prompt, model_name):
     key_string = f"{prompt}:{model_name}"
     return hashlib.md5(key_string.encode()).hexdigest()
 
-@rate_limited
-def generate_completion(prompt, model_name='models/gemini-1.5-flash-8b', validate_json=True):
+def get_cached_response(prompt, model_name):
+    """Return the cached response text for a prompt, or None if missing or expired"""
+    return response_cache.get(get_cache_key(prompt, model_name))
+
+def cache_response(prompt, model_name, response_text):
+    """Store a response text in the cache"""
+    response_cache.set(get_cache_key(prompt, model_name), response_text)
+
+def evict_cached_response(prompt, model_name):
+    """Drop a cached response that turned out to be unusable"""
+    response_cache.delete(get_cache_key(prompt, model_name))
+
+# Generation parameters shared by the blocking and streaming calls
+GENERATION_CONFIG = {
+    "temperature": 0.7,  # Lower temperature for more structured output
+    "top_p": 0.8,
+    "top_k": 40,
+    "max_output_tokens": 2048,
+}
+
+def supports_structured_output(model_name):
+    """JSON mode with a response schema is a Gemini feature; Gemma models don't have it"""
+    return config.AI_STRUCTURED_OUTPUT and model_name.startswith('models/gemini')
+
+def get_generation_config(model_name, response_schema=None):
+    """Generation parameters for one call, asking for schema-shaped JSON when the model supports it"""
+    if response_schema is None or not supports_structured_output(model_name):
+        return GENERATION_CONFIG
+    return dict(
+        GENERATION_CONFIG,
+        response_mime_type="application/json",
+        response_schema=response_schema
+    )
+
+def clean_response_text(response_text):
+    """Strip whitespace and markdown code fences from a model response"""
+    response_text = response_text.strip()
+    if response_text.startswith("```json"):
+        response_text = response_text.replace("```json", "").replace("```", "")
+    elif response_text.startswith("```"):
+        response_text = response_text.replace("```", "")
+    return response_text.strip()
+
+def generate_completion(prompt, model_name=config.DEFAULT_MODEL, validate_json=True, user_key=None, deadline=None,
+                        response_schema=None):
     """
     Send a request to Gemini API and handle caching, rate limiting, and errors
+    
+    `user_key` (the user's email) selects the per-user rate limit bucket.
+    Waiting, retries and the API call itself all stop at `deadline`.
+    `response_schema` turns on structured output for models that support it.
     """
-    try:
-        logger.info(f"Sending request to Gemini API with model: {model_name}")
+    deadline = deadline or Deadline()
+    cache_key = get_cache_key(prompt, model_name)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Cache hit - returning cached response")
+        return cached
+    
+    # Identical concurrent requests wait for the first one instead of calling Gemini again
+    return in_flight.do(cache_key, _complete_and_cache, cache_key, prompt, model_name, validate_json,
+                        user_key, deadline, response_schema, timeout=deadline.remaining())
+
+def _complete_and_cache(cache_key, prompt, model_name, validate_json, user_key, deadline, response_schema):
+    """Call the model once per cache key across processes and cache the response"""
+    lock_timeout = deadline.timeout(config.AI_CROSS_PROCESS_LOCK_TIMEOUT)
+    with response_cache.lock(cache_key, timeout=lock_timeout) as locked:
+        if locked:
+            # Another process may have filled the cache while we waited for the lock
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Cache filled by another process - returning cached response")
+                return cached
         
-        # Create a generative model
-        model = genai.GenerativeModel(model_name)
+        def call(model):
+            return _request_completion(prompt, model, validate_json, deadline, response_schema,
+                                       user_key=user_key, wait_timeout=deadline.remaining())
         
-        # Generate content with safety settings and specific parameters
-        generation_config = {
-            "temperature": 0.7,  # Lower temperature for more structured output
-            "top_p": 0.8,
-            "top_k": 40,
-            "max_output_tokens": 2048,
-        }
+        # Retries with backoff, and routes to the fallback model while the primary's circuit is open
+        def primary():
+            return resilience.call_with_resilience(call, model_name, fallback_model=config.FALLBACK_MODEL,
+                                                   deadline=deadline)
         
-        response = model.generate_content(
-            prompt,
-            generation_config=generation_config
-        )
+        if config.AI_HEDGE:
+            # A slow primary gets raced against one call to the hedge model
+            hedge_model = config.AI_HEDGE_MODEL or model_name
+            response_text, model_used = hedging.hedged_call(
+                primary,
+                lambda: resilience.call_with_resilience(call, hedge_model, max_attempts=1, deadline=deadline),
+                model_name,
+                deadline=deadline
+            )
+        else:
+            response_text, model_used = primary()
         
-        # Extract response text
-        if not response or not response.text:
-            logger.error("Empty response received from Gemini API")
-            raise Exception("Empty response from AI service")
-            
-        response_text = response.text.strip()
-        if not response_text:
-            logger.error("Empty text in response")
-            raise Exception("Empty text in AI response")
-            
-        # Log the raw response for debugging
-        logger.debug(f"Raw response from Gemini API: {response_text}")
+        # Fallback answers are served but not cached, so the primary model replaces them once it recovers
+        if model_used == model_name:
+            response_cache.set(cache_key, response_text)
+        return response_text
+
+def _finish_response(response_text, model_name, validate_json):
+    """Check, clean and (for JSON) repair a raw model answer"""
+    response_text = response_text.strip()
+    if not response_text:
+        logger.error("Empty text in response")
+        raise Exception("Empty text in AI response")
         
-        # Try to clean the response text
-        # Remove any potential markdown formatting
-        if response_text.startswith("```json"):
-            response_text = response_text.replace("```json", "").replace("```", "")
-        elif response_text.startswith("```"):
-            response_text = response_text.replace("```", "")
-            
-        response_text = response_text.strip()
+    # Log the raw response for debugging
+    logger.debug("Raw response from Gemini API: %s", response_text)
+    
+    # Try to clean the response text
+    # Remove any potential markdown formatting
+    response_text = clean_response_text(response_text)
+    
+    # Only validate JSON if required; repairs happen here once, so the cache holds clean JSON.
+    # An answer cut off at max_output_tokens fails here, so it is retried rather than cached.
+    if validate_json:
+        data = json_extract.loads(response_text, model_name, expect='{', allow_truncated=False)
+        response_text = json.dumps(data, ensure_ascii=False)
+    
+    logger.info("Successfully received response from Gemini API")
+    return response_text
+
+@limiter.limit
+def _request_completion(prompt, model_name, validate_json, deadline, response_schema=None):
+    """Call the Gemini API; only cache misses count against the rate limit"""
+    try:
+        logger.info("Sending request to Gemini API with model: %s", model_name)
         
-        # Only validate JSON if required
-        if validate_json:
-            try:
-                json.loads(response_text)
-            except json.JSONDecodeError:
-                logger.warning("Response is not valid JSON, attempting repair")
-                # Try to extract JSON structure
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    response_text = response_text[json_start:json_end]
-                    # Validate the extracted JSON
-                    try:
-                        json.loads(response_text)
-                    except json.JSONDecodeError:
-                        raise Exception("Could not repair JSON response")
-                else:
-                    raise Exception("Could not find JSON structure in response")
+        response_text = model_client.generate(
+            prompt,
+            model_name,
+            get_generation_config(model_name, response_schema),
+            deadline.timeout()
+        )
+        return _finish_response(response_text, model_name, validate_json)
         
-        logger.info("Successfully received response from Gemini API")
-        return response_text
+    except Exception as e:
+        logger.error("Gemini API Error with model %s: %s", model_name, e)
+        raise
+
+# Async variants for the ASGI endpoints (asgi.py). They share the caches, rate
+# limiter, breakers and parsing with the functions above but await the model
+# instead of holding a thread. Hedging and the cross-process cache lock are
+# not used on this path.
+
+async def _cache_call(func, *args):
+    """Run a response cache operation; only the MySQL tier needs a thread"""
+    if response_cache.persistent:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+async def agenerate_completion(prompt, model_name=config.DEFAULT_MODEL, validate_json=True, user_key=None,
+                               deadline=None, response_schema=None):
+    """generate_completion() for coroutines"""
+    deadline = deadline or Deadline()
+    cache_key = get_cache_key(prompt, model_name)
+    cached = await _cache_call(response_cache.get, cache_key)
+    if cached is not None:
+        logger.info("Cache hit - returning cached response")
+        return cached
+    
+    return await async_in_flight.do(cache_key, _acomplete_and_cache, cache_key, prompt, model_name, validate_json,
+                                    user_key, deadline, response_schema, timeout=deadline.remaining())
+
+async def _acomplete_and_cache(cache_key, prompt, model_name, validate_json, user_key, deadline, response_schema):
+    async def call(model):
+        return await _arequest_completion(prompt, model, validate_json, deadline, response_schema, user_key=user_key)
+    
+    response_text, model_used = await resilience.acall_with_resilience(
+        call, model_name, fallback_model=config.FALLBACK_MODEL, deadline=deadline
+    )
+    if model_used == model_name:
+        await _cache_call(response_cache.set, cache_key, response_text)
+    return response_text
+
+async def _arequest_completion(prompt, model_name, validate_json, deadline, response_schema=None, user_key=None):
+    """_request_completion() for coroutines"""
+    await limiter.acquire_async(user_key, timeout=deadline.remaining())
+    try:
+        logger.info("Sending request to Gemini API with model: %s", model_name)
+        
+        response_text = await model_client.agenerate(
+            prompt,
+            model_name,
+            get_generation_config(model_name, response_schema),
+            deadline.timeout()
+        )
+        return _finish_response(response_text, model_name, validate_json)
         
     except Exception as e:
-        logger.error(f"Gemini API Error with model {model_name}: {e}")
+        logger.error("Gemini API Error with model %s: %s", model_name, e)
         raise
 
-def generate_resume_feedback(user_data):
-    """Generate resume feedback based on user data"""
+async def _agenerate_task(task, user_data, deadline, build_prompt, parse_func, max_attempts,
+                          validate_json=True, response_schema=None):
+    """One AI task on the async path: similarity cache, model call, parse, retries on unusable output"""
+    deadline = deadline or Deadline()
     try:
-        # Construct a detailed prompt for resume feedback
-        prompt = f"""You are a professional resume reviewer. Your task is to provide resume feedback in JSON format.
+        # The NumPy work of the similarity cache runs on a thread, off the event loop
+        similar = await asyncio.to_thread(find_similar_result, task, user_data)
+        if similar is not None:
+            return similar
+        
+        prompt = build_prompt(user_data)
+        for attempt in range(max_attempts):
+            try:
+                response_text = await agenerate_completion(prompt, validate_json=validate_json,
+                                                           user_key=user_data.get('email'), deadline=deadline,
+                                                           response_schema=response_schema)
+                result = parse_func(response_text)
+                await asyncio.to_thread(remember_result, task, user_data, result)
+                return result
+            
+            except Exception as e:
+                logger.warning("%s attempt %s failed: %s", task, attempt + 1, e)
+                # Don't let the retry hit the same unusable cached response
+                await _cache_call(evict_cached_response, prompt, config.DEFAULT_MODEL)
+                if attempt == max_attempts - 1 or not is_output_error(e):
+                    break
+                if not await deadline.asleep(resilience.backoff_delay(attempt)):
+                    logger.error("Deadline reached while generating %s", task)
+                    break
+    
+    except Exception as e:
+        logger.error("Error generating %s: %s", task, e)
+    return config.FALLBACK_RESPONSES[task]
+
+@limiter.limit
+def _start_stream(prompt, model_name, timeout, response_schema=None):
+    """Open a streaming Gemini request; counts against the rate limit like a blocking call"""
+    logger.info("Streaming request to Gemini API with model: %s", model_name)
+    return model_client.stream(prompt, model_name, get_generation_config(model_name, response_schema), timeout)
 
-USER PROFILE:
-Email: {user_data.get('email', 'Not provided')}
+def stream_completion(prompt, model_name=config.DEFAULT_MODEL, user_key=None, info=None, deadline=None,
+                      response_schema=None):
+    """
+    Yield response text chunks as they arrive from the Gemini API.
+    
+    A cached response is yielded as a single chunk. Callers are responsible for
+    caching the complete text once they have validated it. If `info` is a dict,
+    info['model'] is set to the model that served the stream.
+    """
+    cached = get_cached_response(prompt, model_name)
+    if cached is not None:
+        logger.info("Cache hit - returning cached response")
+        if info is not None:
+            info['model'] = model_name
+        yield cached
+        return
+    
+    deadline = deadline or Deadline()
+    deadline.check("streaming")
+    model_used = resilience.select_model(model_name, config.FALLBACK_MODEL)
+    if info is not None:
+        info['model'] = model_used
+    breaker = resilience.get_breaker(model_used)
+    
+    # Breakers judge streams by time to first chunk; total duration depends on output length
+    started = time.monotonic()
+    first_chunk_latency = None
+    healthy = None
+    received = False
+    try:
+        stream = _start_stream(prompt, model_used, deadline.timeout(), response_schema,
+                               user_key=user_key, wait_timeout=deadline.remaining())
+        for chunk in stream:
+            if first_chunk_latency is None:
+                first_chunk_latency = time.monotonic() - started
+            if deadline.expired():
+                raise DeadlineExceeded(f"Deadline of {deadline.budget:.1f}s exceeded while streaming")
+            if chunk:
+                received = True
+                yield chunk
+        healthy = True
+        quota.record_model_call()
+    except Exception as e:
+        logger.error("Gemini API streaming error with model %s: %s", model_used, e)
+        if resilience.is_retryable(e):
+            healthy = False
+        raise
+    finally:
+        latency = first_chunk_latency if first_chunk_latency is not None else time.monotonic() - started
+        if healthy is True:
+            breaker.record_success(latency)
+        elif healthy is False:
+            breaker.record_failure(latency)
+        else:
+            breaker.release()
+    
+    if not received:
+        logger.error("Empty streaming response received from Gemini API")
+        raise Exception("Empty response from AI service")
 
-INTERNSHIPS:
-{format_experiences(user_data.get('internships', []))}
+def is_output_error(error):
+    """
+    True if the model answered but its output was unusable, so asking again may help.
+    Provider errors were already retried by generate_completion and are not retried again.
+    """
+    return not (
+        resilience.is_retryable(error)
+        or isinstance(error, (resilience.CircuitOpenError, RateLimitExceeded, DeadlineExceeded))
+    )
 
-SKILLS:
-{', '.join(user_data.get('skills', ['Not provided']))}
+class ResumeFeedbackSchema(TypedDict):
+    general: str
+    strengths: str
+    improvements: str
 
-MILESTONES:
-{format_experiences(user_data.get('milestones', []))}
+RESUME_FEEDBACK_PREAMBLE = """You are a professional resume reviewer. Your task is to provide resume feedback in JSON format."""
 
-INSTRUCTIONS:
+RESUME_FEEDBACK_INSTRUCTIONS = """INSTRUCTIONS:
 1. Analyze the information above
 2. Respond with ONLY a JSON object
 3. Do not include any other text, markdown, or formatting
 4. Use exactly this format:
 
-{{
+{
     "general": "Write a detailed paragraph about overall assessment",
     "strengths": "• First strength\\n• Second strength\\n• Third strength",
     "improvements": "• First improvement\\n• Second improvement\\n• Third improvement"
-}}
+}
 
 Remember:
 - Only output valid JSON
@@ -188,113 +410,74 @@ Remember:
 - Use proper escaping for newlines (\\n)
 - Start each bullet point with •
 """
+
+def build_resume_feedback_prompt(user_data):
+    """Build the prompt for resume feedback"""
+    return prompt_builder.build_prompt(
+        'resume_feedback', RESUME_FEEDBACK_PREAMBLE, user_data, RESUME_FEEDBACK_INSTRUCTIONS
+    )
+
+def parse_resume_feedback(response_text):
+    """Parse and validate a resume feedback response, raising ValueError if unusable"""
+    # Log the response we're trying to parse
+    logger.debug("Attempting to parse JSON from: %s", response_text)
+    
+    result = json_extract.loads(response_text, expect='{')
+    
+    # Validate the structure and content
+    if not isinstance(result, dict):
+        raise ValueError("Response is not a JSON object")
+    
+    required_fields = ["general", "strengths", "improvements"]
+    for field in required_fields:
+        if field not in result:
+            raise ValueError(f"Missing required field: {field}")
+        if not isinstance(result[field], str) or not result[field].strip():
+            raise ValueError(f"Invalid or empty content for field: {field}")
+    
+    # Ensure bullet points are properly formatted
+    for field in ["strengths", "improvements"]:
+        if not result[field].startswith("•"):
+            result[field] = "• " + result[field].replace("\n", "\n• ")
+    
+    return result
+
+def generate_resume_feedback(user_data, deadline=None):
+    """Generate resume feedback based on user data"""
+    deadline = deadline or Deadline()
+    try:
+        similar = find_similar_result('resume_feedback', user_data)
+        if similar is not None:
+            return similar
         
-        response_text = generate_completion(prompt)
-        
-        # Log the response we're trying to parse
-        logger.debug(f"Attempting to parse JSON from: {response_text}")
+        # Construct a detailed prompt for resume feedback
+        prompt = build_resume_feedback_prompt(user_data)
         
-        try:
-            # First try to parse the entire response as JSON
-            result = json.loads(response_text)
-            logger.info("Successfully parsed JSON response")
-            
-            # Validate the structure and content
-            if not isinstance(result, dict):
-                raise ValueError("Response is not a JSON object")
-                
-            required_fields = ["general", "strengths", "improvements"]
-            for field in required_fields:
-                if field not in result:
-                    raise ValueError(f"Missing required field: {field}")
-                if not isinstance(result[field], str) or not result[field].strip():
-                    raise ValueError(f"Invalid or empty content for field: {field}")
-            
-            # Ensure bullet points are properly formatted
-            for field in ["strengths", "improvements"]:
-                if not result[field].startswith("•"):
-                    result[field] = "• " + result[field].replace("\n", "\n• ")
-            
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing error: {e}")
-            logger.debug(f"Failed to parse JSON: {str(e)}")
-            
-            # Try to extract and clean JSON
-            try:
-                # Find JSON-like structure
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    
-                    # Clean up the JSON string
-                    json_str = (
-                        json_str
-                        .replace('\n', ' ')  # Remove newlines
-                        .replace('\\n', '\\\\n')  # Properly escape \n
-                        .replace('\\', '\\\\')  # Escape backslashes
-                        .replace('"', '\\"')  # Escape quotes
-                        .replace("'", '"')  # Replace single quotes with double quotes
-                    )
-                    
-                    # Ensure proper JSON structure
-                    if not json_str.startswith('{'): json_str = '{' + json_str
-                    if not json_str.endswith('}'): json_str = json_str + '}'
-                    
-                    # Log the cleaned JSON string
-                    logger.debug(f"Cleaned JSON string: {json_str}")
-                    
-                    # Try parsing the cleaned JSON
-                    result = json.loads(json_str)
-                    
-                    # Validate and format the result
-                    for field in required_fields:
-                        if field not in result or not result[field].strip():
-                            result[field] = config.FALLBACK_RESPONSES['resume_feedback'][field]
-                    
-                    return result
-                    
-                else:
-                    logger.error("Could not find valid JSON structure in response")
-                    raise Exception("Could not find valid JSON in response")
-                    
-            except Exception as e:
-                logger.error(f"Failed to repair JSON: {e}")
-                return config.FALLBACK_RESPONSES['resume_feedback']
+        response_text = generate_completion(prompt, user_key=user_data.get('email'), deadline=deadline,
+                                            response_schema=ResumeFeedbackSchema)
+        result = parse_resume_feedback(response_text)
+        remember_result('resume_feedback', user_data, result)
+        return result
                 
     except Exception as e:
-        logger.error(f"Error generating resume feedback: {e}")
+        logger.error("Error generating resume feedback: %s", e)
         return config.FALLBACK_RESPONSES['resume_feedback']
 
-def generate_career_advice(user_data):
-    """Generate career advice based on user data"""
-    try:
-        # Construct a detailed prompt for career advice with strict formatting
-        prompt = f"""You are a career advisor. Based on the following user information, provide CONCISE career advice in EXACTLY the requested JSON format.
-
-USER PROFILE:
-Email: {user_data.get('email', 'Not provided')}
-
-INTERNSHIPS:
-{format_experiences(user_data.get('internships', []))}
+class CareerAdviceSchema(TypedDict):
+    certifications: str
+    skills: str
+    tips: str
 
-SKILLS:
-{', '.join(user_data.get('skills', ['Not provided']))}
+CAREER_ADVICE_PREAMBLE = """You are a career advisor. Based on the following user information, provide CONCISE career advice in EXACTLY the requested JSON format."""
 
-MILESTONES:
-{format_experiences(user_data.get('milestones', []))}
-
-INSTRUCTIONS:
+CAREER_ADVICE_INSTRUCTIONS = """INSTRUCTIONS:
 1. Analyze the information above
 2. Provide advice in EXACTLY this JSON format, with no other text:
-{{
+{
     "certifications": "2-3 specific certification recommendations, max 100 chars",
     "skills": "3-4 specific skills to develop, max 100 chars",
     "tips": "3 bullet points for job success, use • for bullets, max 150 chars"
-}}
+}
 
 REQUIREMENTS:
 - Response must be ONLY valid JSON
@@ -304,61 +487,75 @@ REQUIREMENTS:
 - Be specific and actionable
 - Focus on user's field/experience"""
 
+def build_career_advice_prompt(user_data):
+    """Build the prompt for career advice"""
+    return prompt_builder.build_prompt(
+        'career_advice', CAREER_ADVICE_PREAMBLE, user_data, CAREER_ADVICE_INSTRUCTIONS
+    )
+
+def parse_career_advice(response_text):
+    """Parse and validate a career advice response, raising ValueError if unusable"""
+    result = json_extract.loads(response_text, expect='{')
+    
+    # Validate and format the response
+    required_fields = ["certifications", "skills", "tips"]
+    
+    # Ensure all required fields exist and are properly formatted
+    for field in required_fields:
+        if field not in result or not isinstance(result[field], str):
+            raise ValueError(f"Missing or invalid field: {field}")
+        
+        # Trim responses to max length
+        if field == "tips":
+            if not result[field].startswith("•"):
+                result[field] = "• " + result[field].replace("\n", "\n• ")
+            result[field] = result[field][:150]
+        else:
+            result[field] = result[field][:100]
+    
+    return result
+
+def generate_career_advice(user_data, deadline=None):
+    """Generate career advice based on user data"""
+    deadline = deadline or Deadline()
+    try:
+        similar = find_similar_result('career_advice', user_data)
+        if similar is not None:
+            return similar
+        
+        # Construct a detailed prompt for career advice with strict formatting
+        prompt = build_career_advice_prompt(user_data)
+
         # Try up to 3 times to get a valid response
         max_retries = 3
         for attempt in range(max_retries):
             try:
-                response_text = generate_completion(prompt)
-                result = json.loads(response_text)
-                
-                # Validate and format the response
-                required_fields = ["certifications", "skills", "tips"]
-                
-                # Ensure all required fields exist and are properly formatted
-                for field in required_fields:
-                    if field not in result or not isinstance(result[field], str):
-                        raise ValueError(f"Missing or invalid field: {field}")
-                    
-                    # Trim responses to max length
-                    if field == "tips":
-                        if not result[field].startswith("•"):
-                            result[field] = "• " + result[field].replace("\n", "\n• ")
-                        result[field] = result[field][:150]
-                    else:
-                        result[field] = result[field][:100]
+                response_text = generate_completion(prompt, user_key=user_data.get('email'), deadline=deadline,
+                                                    response_schema=CareerAdviceSchema)
+                result = parse_career_advice(response_text)
                 
-                logger.info(f"Successfully generated career advice on attempt {attempt + 1}")
+                logger.info("Successfully generated career advice on attempt %s", attempt + 1)
+                remember_result('career_advice', user_data, result)
                 return result
                 
             except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt == max_retries - 1:
+                logger.warning("Attempt %s failed: %s", attempt + 1, str(e))
+                # Don't let the retry hit the same unusable cached response
+                evict_cached_response(prompt, config.DEFAULT_MODEL)
+                if attempt == max_retries - 1 or not is_output_error(e):
                     logger.error("All attempts to generate career advice failed")
                     return config.FALLBACK_RESPONSES['career_advice']
+                if not deadline.sleep(resilience.backoff_delay(attempt)):
+                    logger.error("Deadline reached while generating career advice")
+                    return config.FALLBACK_RESPONSES['career_advice']
                 
     except Exception as e:
-        logger.error(f"Error generating career advice: {e}")
+        logger.error("Error generating career advice: %s", e)
         return config.FALLBACK_RESPONSES['career_advice']
 
-def generate_detailed_roadmap(user_data):
-    """Generate a detailed career roadmap based on user data"""
-    try:
-        # Construct a detailed prompt with exact format requirements
-        prompt = f"""You are a career advisor. Based on the following user information, generate THREE career roadmap steps showing a clear progression path.
-
-USER PROFILE:
-Email: {user_data.get('email', 'Not provided')}
+DETAILED_ROADMAP_PREAMBLE = """You are a career advisor. Based on the following user information, generate THREE career roadmap steps showing a clear progression path."""
 
-INTERNSHIPS:
-{format_experiences(user_data.get('internships', []))}
-
-SKILLS:
-{', '.join(user_data.get('skills', ['Not provided']))}
-
-MILESTONES:
-{format_experiences(user_data.get('milestones', []))}
-
-INSTRUCTIONS:
+DETAILED_ROADMAP_INSTRUCTIONS = """INSTRUCTIONS:
 Generate THREE career steps in this format:
 [Job Title 1]
 
@@ -388,121 +585,211 @@ REQUIREMENTS:
 - Do not include any instructions or user profile in the response
 - ONLY output the job titles and descriptions, nothing else"""
 
+def build_detailed_roadmap_prompt(user_data):
+    """Build the prompt for a detailed career roadmap"""
+    return prompt_builder.build_prompt(
+        'detailed_roadmap', DETAILED_ROADMAP_PREAMBLE, user_data, DETAILED_ROADMAP_INSTRUCTIONS
+    )
+
+def format_roadmap_step(title, description):
+    """Clean up one title/description pair of a roadmap response"""
+    title = title.strip()
+    description = description.strip()
+    
+    # Clean up the description to remove any prompt/instruction text
+    description = description.replace('USER PROFILE:', '').replace('INTERNSHIPS:', '')
+    description = description.replace('SKILLS:', '').replace('MILESTONES:', '')
+    description = description.replace('INSTRUCTIONS:', '').replace('REQUIREMENTS:', '')
+    description = description.replace('EXAMPLE FORMAT:', '').replace('Example format:', '')
+    
+    # Validate content length
+    if len(title) > 50:
+        title = title[:50]
+    if len(description) > 150:
+        description = description[:147] + "..."
+    
+    return {
+        "title": title,
+        "description": description.strip()
+    }
+
+def parse_detailed_roadmap(response_text):
+    """Parse a roadmap response into exactly 3 steps, raising ValueError if too short"""
+    # Split response into sections (job entries)
+    sections = [section.strip() for section in response_text.split('\n\n') if section.strip()]
+    
+    # Group sections into pairs of title and description
+    roadmap = []
+    for i in range(0, len(sections), 2):
+        if i + 1 < len(sections):
+            roadmap.append(format_roadmap_step(sections[i], sections[i + 1]))
+    
+    # Ensure we have exactly 3 steps
+    if len(roadmap) < 3:
+        raise ValueError(f"Generated only {len(roadmap)} steps, need exactly 3")
+    
+    return roadmap[:3]  # Take only first 3 if we got more
+
+def generate_detailed_roadmap(user_data, deadline=None):
+    """Generate a detailed career roadmap based on user data"""
+    deadline = deadline or Deadline()
+    try:
+        similar = find_similar_result('detailed_roadmap', user_data)
+        if similar is not None:
+            return similar
+        
+        # Construct a detailed prompt with exact format requirements
+        prompt = build_detailed_roadmap_prompt(user_data)
+
         # Try up to 3 times to get a valid response
         max_retries = 3
         for attempt in range(max_retries):
             try:
                 # Use validate_json=False since we want plain text
-                response_text = generate_completion(prompt, validate_json=False)
-                
-                # Split response into sections (job entries)
-                sections = [section.strip() for section in response_text.split('\n\n') if section.strip()]
+                response_text = generate_completion(prompt, validate_json=False, user_key=user_data.get('email'),
+                                                    deadline=deadline)
+                roadmap = parse_detailed_roadmap(response_text)
                 
-                # Group sections into pairs of title and description
-                roadmap = []
-                for i in range(0, len(sections), 2):
-                    if i + 1 < len(sections):
-                        title = sections[i].strip()
-                        description = sections[i + 1].strip()
-                        
-                        # Clean up the description to remove any prompt/instruction text
-                        description = description.replace('USER PROFILE:', '').replace('INTERNSHIPS:', '')
-                        description = description.replace('SKILLS:', '').replace('MILESTONES:', '')
-                        description = description.replace('INSTRUCTIONS:', '').replace('REQUIREMENTS:', '')
-                        description = description.replace('EXAMPLE FORMAT:', '').replace('Example format:', '')
-                        
-                        # Validate content length
-                        if len(title) > 50:
-                            title = title[:50]
-                        if len(description) > 150:
-                            description = description[:147] + "..."
-                        
-                        roadmap.append({
-                            "title": title,
-                            "description": description.strip()
-                        })
-                
-                # Ensure we have exactly 3 steps
-                if len(roadmap) >= 3:
-                    roadmap = roadmap[:3]  # Take only first 3 if we got more
-                    logger.info(f"Successfully generated roadmap with {len(roadmap)} steps on attempt {attempt + 1}")
-                    return roadmap
-                else:
-                    raise ValueError(f"Generated only {len(roadmap)} steps, need exactly 3")
+                logger.info("Successfully generated roadmap with %s steps on attempt %s", len(roadmap), attempt + 1)
+                remember_result('detailed_roadmap', user_data, roadmap)
+                return roadmap
                 
             except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                if attempt == max_retries - 1:
+                logger.warning("Attempt %s failed: %s", attempt + 1, str(e))
+                # Don't let the retry hit the same unusable cached response
+                evict_cached_response(prompt, config.DEFAULT_MODEL)
+                if attempt == max_retries - 1 or not is_output_error(e):
                     logger.error("All attempts to generate roadmap failed")
                     return config.FALLBACK_RESPONSES['detailed_roadmap']
+                if not deadline.sleep(resilience.backoff_delay(attempt)):
+                    logger.error("Deadline reached while generating roadmap")
+                    return config.FALLBACK_RESPONSES['detailed_roadmap']
                 
     except Exception as e:
-        logger.error(f"Error generating detailed roadmap: {e}")
+        logger.error("Error generating detailed roadmap: %s", e)
         return config.FALLBACK_RESPONSES['detailed_roadmap']
 
-def format_experiences(experiences):
-    """Format a list of experiences (internships or milestones) into a string"""
-    if not experiences or len(experiences) == 0:
-        return "None"
-    
-    formatted = []
-    for idx, exp in enumerate(experiences, 1):
-        if isinstance(exp, dict):
-            if 'company' in exp:  # It's an internship
-                company = exp.get('company', 'Unknown')
-                role = exp.get('role', 'Unknown')
-                dates = exp.get('dates', 'Unknown')
-                description = exp.get('description', 'No description provided')
-                formatted.append(f"{idx}. {role} at {company} ({dates}): {description}")
-            elif 'title' in exp:  # It's a milestone
-                title = exp.get('title', 'Unknown')
-                date = exp.get('date', 'Unknown')
-                description = exp.get('description', 'No description provided')
-                formatted.append(f"{idx}. {title} ({date}): {description}")
-    
-    return "\n".join(formatted) if formatted else "None" 
-
-def clean_cache():
-    """Clean expired entries from the cache"""
-    current_time = time.time()
-    expired_keys = [
-        key for key, timestamp in cache_timestamps.items()
-        if current_time - timestamp > CACHE_TIMEOUT
-    ]
-    
-    for key in expired_keys:
-        del cache[key]
-        del cache_timestamps[key]
-    
-    # If cache is still too large, remove oldest entries
-    if len(cache) > config.MAX_CACHE_SIZE:
-        sorted_entries = sorted(cache_timestamps.items(), key=lambda x: x[1])
-        entries_to_remove = sorted_entries[:len(cache) - config.MAX_CACHE_SIZE]
+def _stream_json_task(task, user_data, build_prompt, parse_func, response_schema, deadline=None):
+    """Stream a JSON task as ("delta", text) events followed by one ("result", data) event"""
+    extractor = json_extract.JsonExtractor(expect='{')
+    info = {}
+    try:
+        similar = find_similar_result(task, user_data)
+        if similar is not None:
+            yield 'result', similar
+            return
+        
+        prompt = build_prompt(user_data)
+        for chunk in stream_completion(prompt, user_key=user_data.get('email'), info=info, deadline=deadline,
+                                       response_schema=response_schema):
+            extractor.feed(chunk)
+            yield 'delta', chunk
         
-        for key, _ in entries_to_remove:
-            del cache[key]
-            del cache_timestamps[key]
-    
-    logger.info(f"Cache cleaned. Current size: {len(cache)} entries")
-
-def clear_invalid_cache_entries():
-    """Remove any invalid entries from the cache"""
-    invalid_keys = []
-    
-    for key, value in cache.items():
         try:
-            # Try to parse the cached value as JSON
-            json.loads(value)
-        except json.JSONDecodeError:
-            invalid_keys.append(key)
-    
-    for key in invalid_keys:
-        del cache[key]
-        if key in cache_timestamps:
-            del cache_timestamps[key]
-    
-    if invalid_keys:
-        logger.info(f"Removed {len(invalid_keys)} invalid cache entries")
+            data = extractor.result(allow_truncated=False)
+        except ValueError:
+            json_extract.record_parse(info.get('model'), extractor.repairs, False)
+            raise
+        json_extract.record_parse(info.get('model'), extractor.repairs, True)
+        response_text = json.dumps(data, ensure_ascii=False)
+        result = parse_func(response_text)
+        
+        # Populate the same cache entries the blocking endpoint reads
+        if info.get('model') == config.DEFAULT_MODEL:
+            cache_response(prompt, config.DEFAULT_MODEL, response_text)
+        remember_result(task, user_data, result)
+        yield 'result', result
+        
+    except Exception as e:
+        logger.error("Error streaming %s: %s", task, e)
+        yield 'result', config.FALLBACK_RESPONSES[task]
 
-# Clear any invalid cache entries on module load
-clear_invalid_cache_entries() 
\ No newline at end of file
+def stream_resume_feedback(user_data, deadline=None):
+    """Streaming variant of generate_resume_feedback"""
+    return _stream_json_task('resume_feedback', user_data, build_resume_feedback_prompt, parse_resume_feedback,
+                             ResumeFeedbackSchema, deadline=deadline)
+
+def stream_career_advice(user_data, deadline=None):
+    """Streaming variant of generate_career_advice"""
+    return _stream_json_task('career_advice', user_data, build_career_advice_prompt, parse_career_advice,
+                             CareerAdviceSchema, deadline=deadline)
+
+def stream_detailed_roadmap(user_data, deadline=None):
+    """
+    Streaming variant of generate_detailed_roadmap.
+    
+    Yields a ("step", step) event as soon as each title/description pair is
+    complete, then one ("result", roadmap) event with the full roadmap (or the
+    fallback roadmap if generation failed).
+    """
+    text_parts = []
+    sections = []
+    roadmap = []
+    pending = ""
+    info = {}
+    try:
+        similar = find_similar_result('detailed_roadmap', user_data)
+        if similar is not None:
+            for step in similar:
+                yield 'step', step
+            yield 'result', similar
+            return
+        
+        prompt = build_detailed_roadmap_prompt(user_data)
+        for chunk in stream_completion(prompt, user_key=user_data.get('email'), info=info, deadline=deadline):
+            text_parts.append(chunk)
+            pending += chunk
+            
+            # Every blank line closes a section; the text after the last one is still arriving
+            *complete, pending = pending.split('\n\n')
+            sections.extend(clean_response_text(section) for section in complete if section.strip())
+            
+            while len(sections) >= 2 and len(roadmap) < 3:
+                step = format_roadmap_step(sections.pop(0), sections.pop(0))
+                roadmap.append(step)
+                yield 'step', step
+        
+        if pending.strip():
+            sections.append(clean_response_text(pending))
+        while len(sections) >= 2 and len(roadmap) < 3:
+            step = format_roadmap_step(sections.pop(0), sections.pop(0))
+            roadmap.append(step)
+            yield 'step', step
+        
+        if len(roadmap) < 3:
+            raise ValueError(f"Generated only {len(roadmap)} steps, need exactly 3")
+        
+        # Populate the same cache entry the blocking endpoint reads
+        if info.get('model') == config.DEFAULT_MODEL:
+            cache_response(prompt, config.DEFAULT_MODEL, clean_response_text("".join(text_parts)))
+        remember_result('detailed_roadmap', user_data, roadmap)
+        logger.info("Successfully streamed roadmap with 3 steps")
+        yield 'result', roadmap
+        
+    except Exception as e:
+        logger.error("Error streaming detailed roadmap: %s", e)
+        yield 'result', config.FALLBACK_RESPONSES['detailed_roadmap']
+
+async def agenerate_resume_feedback(user_data, deadline=None):
+    return await _agenerate_task('resume_feedback', user_data, deadline, build_resume_feedback_prompt,
+                                 parse_resume_feedback, max_attempts=1, response_schema=ResumeFeedbackSchema)
+
+async def agenerate_career_advice(user_data, deadline=None):
+    return await _agenerate_task('career_advice', user_data, deadline, build_career_advice_prompt,
+                                 parse_career_advice, max_attempts=3, response_schema=CareerAdviceSchema)
+
+async def agenerate_detailed_roadmap(user_data, deadline=None):
+    return await _agenerate_task('detailed_roadmap', user_data, deadline, build_detailed_roadmap_prompt,
+                                 parse_detailed_roadmap, max_attempts=3, validate_json=False)
+
+def status():
+    """Rate limiter, cache and request coalescing state for /api/ai/status"""
+    return {
+        "model_client": model_client.name,
+        "rate_limiter": limiter.stats(),
+        "cache": response_cache.stats(),
+        "single_flight": in_flight.stats(),
+        "async_single_flight": async_in_flight.stats(),
+        "similarity_cache": {task: cache.stats() for task, cache in similar_results.items()},
+        "hedging": hedging.hedge_stats() if config.AI_HEDGE else None
+    }
@@ -1,11 +1,17 @@
 import time
 import logging
-import json
 import requests
-from functools import wraps
 import os
 from dotenv import load_dotenv
 import config
+import ai_cache
+import metrics
+import quota
+from rate_limiter import RateLimiter
+from micro_batcher import MicroBatcher
+from deadline import Deadline, DeadlineExceeded
+import prompt_builder
+import json_extract
 
 # Configure logger
 logging.basicConfig(
@@ -26,178 +32,245 @@ try:
     
     logger.info("Hugging Face API credentials loaded successfully")
 except Exception as e:
-    logger.error(f"Failed to initialize Hugging Face API: {e}")
+    logger.error("Failed to initialize Hugging Face API: %s", e)
 
-# Simple in-memory cache
-cache = {}
+# Response cache (bounded in-memory tier, optional MySQL tier, brief negative caching)
+response_cache = ai_cache.ResponseCache('ai_service_hf')
 
-# Rate limiting setup
-request_timestamps = []
-MAX_REQUESTS = config.MAX_REQUESTS_PER_MINUTE
-REQUEST_WINDOW = 60  # 1 minute in seconds
+DEFAULT_MODEL = 'google/flan-t5-xxl'
 
-def rate_limited(func):
-    """Decorator to apply rate limiting to a function"""
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        global request_timestamps
-        
-        current_time = time.time()
-        # Clean up old timestamps
-        request_timestamps = [ts for ts in request_timestamps if current_time - ts < REQUEST_WINDOW]
-        
-        # Check if we're over the limit
-        if len(request_timestamps) >= MAX_REQUESTS:
-            logger.warning(f"Rate limit exceeded ({MAX_REQUESTS} requests per minute)")
-            raise Exception("Rate limit exceeded. Please try again later.")
-        
-        # Add current timestamp
-        request_timestamps.append(current_time)
-        
-        # Call the actual function
-        return func(*args, **kwargs)
-    
-    return wrapper
+# How long to wait before asking again while the model is loading (HTTP 503)
+MODEL_LOADING_RETRY_SECONDS = 10
+MODEL_LOADING_MAX_RETRIES = 3
 
-def get_cache_key(prompt, model_name):
-    """Generate a cache key based on request parameters"""
-    return f"{hash(prompt)}:{model_name}"
+# Rate limiting setup: global and per-user token buckets with a bounded wait queue
+limiter = RateLimiter(
+    'huggingface',
+    per_minute=config.MAX_REQUESTS_PER_MINUTE,
+    per_user_per_minute=config.AI_USER_REQUESTS_PER_MINUTE,
+    max_queue=config.AI_RATE_LIMIT_MAX_QUEUE,
+    max_wait=config.AI_RATE_LIMIT_MAX_WAIT
+)
 
-@rate_limited
-def generate_completion(prompt, model_name='google/flan-t5-xxl'):
+# Generation parameters sent with every request (and part of the cache key)
+GENERATION_PARAMETERS = {
+    "max_length": 1024,
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "do_sample": True
+}
+
+def get_cache_key(prompt, model_name, parameters=None):
+    """Generate a cache key based on request parameters, the same in every process"""
+    return ai_cache.make_cache_key(
+        'huggingface', model_name, prompt, GENERATION_PARAMETERS if parameters is None else parameters
+    )
+
+def generate_completion(prompt, model_name=DEFAULT_MODEL, user_key=None, deadline=None):
     """
     Send a request to Hugging Face API and handle caching, rate limiting, and errors
+    
+    The rate limit wait, the HTTP request and any model-loading retries all
+    stop at `deadline`; None is returned once it runs out.
+    
+    With batching enabled (AI_HF_BATCH_MAX_SIZE > 1), concurrent prompts for the
+    same model are sent together in one request. Each caller still takes a
+    token from its own per-user bucket; the global bucket is charged once per
+    HTTP request.
     """
+    deadline = deadline or Deadline()
+    
     # Check cache first
     cache_key = get_cache_key(prompt, model_name)
-    if cache_key in cache:
+    cached = response_cache.get(cache_key)
+    if cached is not None:
         logger.info("Cache hit - returning cached response")
-        return cache[cache_key]
+        return cached
+    if response_cache.is_negative(cache_key):
+        logger.info("Prompt failed moments ago - using fallback response without calling the API")
+        return None
     
-    api_key = os.getenv('HF_API_KEY')
-    if not api_key:
-        logger.error("Hugging Face API key not properly initialized or missing")
-        raise Exception("Hugging Face integration is not properly configured")
+    limiter.acquire(user_key, timeout=deadline.remaining(), include_global=batcher is None)
     
     try:
-        logger.info(f"Sending request to Hugging Face API with model: {model_name}")
-        
-        API_URL = f"https://api-inference.huggingface.co/models/{model_name}"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
+        if batcher is None:
+            response_text = request_completions(model_name, [prompt], deadline)[0]
+        else:
+            response_text = batcher.submit(model_name, prompt, deadline)
+        quota.record_model_call()
         
-        payload = {
-            "inputs": prompt,
-            "parameters": {
-                "max_length": 1024,
-                "temperature": 0.7,
-                "top_p": 0.9,
-                "do_sample": True
-            }
-        }
+        # Cache the result
+        response_cache.set(cache_key, response_text)
         
-        # Send request to Hugging Face API
-        response = requests.post(API_URL, headers=headers, json=payload)
-        
-        # Check response status
-        if response.status_code == 200:
-            # Parse response based on model output format
-            result = response.json()
-            
-            # Different models return different response structures
-            if isinstance(result, list) and len(result) > 0:
-                if "generated_text" in result[0]:
-                    # Text generation models
-                    response_text = result[0]["generated_text"]
-                else:
-                    # Other response formats
-                    response_text = str(result)
-            else:
-                response_text = str(result)
-            
-            logger.info("Successfully received response from Hugging Face API")
-            
-            # Cache the result
-            cache[cache_key] = response_text
-            
-            return response_text
-        else:
-            # If we got a model loading error, wait and retry
-            if response.status_code == 503 and "Loading" in response.text:
-                logger.info("Model is loading, waiting for 10 seconds and retrying...")
-                time.sleep(10)
-                return generate_completion(prompt, model_name)
-            
-            # Handle error responses
-            error_msg = f"Hugging Face API Error: Status {response.status_code} - {response.text}"
-            logger.error(error_msg)
-            # Fall back to default responses rather than raising an exception
-            logger.info("Using fallback response due to API error")
-            return None
+        return response_text
         
+    except (DeadlineExceeded, TimeoutError) as e:
+        # This caller ran out of time; the next one may well succeed
+        logger.error("Hugging Face API Error: %s", e)
+        logger.info("Using fallback response due to timeout")
+        return None
     except Exception as e:
-        logger.error(f"Hugging Face API Error: {e}")
+        logger.error("Hugging Face API Error: %s", e)
+        response_cache.set_negative(cache_key)
         # Fall back to default responses rather than raising an exception
         logger.info("Using fallback response due to exception")
         return None
 
-def generate_resume_feedback(user_data):
+def parse_generated_texts(result, count):
+    """
+    Pull one generated text per input out of an Inference API response. A
+    batched request answers with a list per input or a flat list of dicts.
+    """
+    if not isinstance(result, list) or not result:
+        result = [result]
+    if count == 1:
+        # A single prompt may come back with several candidates; use the first
+        result = result[:1]
+    
+    texts = []
+    for item in result:
+        if isinstance(item, list):
+            item = item[0] if item else {}
+        if isinstance(item, dict) and "generated_text" in item:
+            # Text generation models
+            texts.append(item["generated_text"])
+        else:
+            # Other response formats
+            texts.append(str(item))
+    return texts
+
+def request_completions(model_name, prompts, deadline):
+    """
+    POST one or more prompts to the Inference API and return the generated
+    texts in the same order. Raises on errors.
+    """
+    api_key = os.getenv('HF_API_KEY')
+    if not api_key:
+        logger.error("Hugging Face API key not properly initialized or missing")
+        raise Exception("Hugging Face integration is not properly configured")
+    
+    logger.info("Sending request with %s prompt(s) to Hugging Face API with model: %s", len(prompts), model_name)
+    
+    API_URL = f"{config.AI_HF_API_URL}/{model_name}"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "inputs": prompts[0] if len(prompts) == 1 else prompts,
+        "parameters": GENERATION_PARAMETERS
+    }
+    
+    # Send request to Hugging Face API, waiting a bounded number of times
+    # for the model to load
+    for loading_retry in range(MODEL_LOADING_MAX_RETRIES + 1):
+        deadline.check(f"calling {model_name}")
+        started = time.monotonic()
+        try:
+            response = requests.post(API_URL, headers=headers, json=payload, timeout=deadline.timeout())
+        except Exception:
+            metrics.observe_ai_call(model_name, 'error', time.monotonic() - started)
+            raise
+        metrics.observe_ai_call(model_name, 'ok' if response.status_code == 200 else 'error', time.monotonic() - started)
+        if not (response.status_code == 503 and "Loading" in response.text):
+            break
+        if loading_retry == MODEL_LOADING_MAX_RETRIES:
+            break
+        wait = min(MODEL_LOADING_RETRY_SECONDS, deadline.remaining() - config.AI_MIN_CALL_BUDGET)
+        if wait <= 0:
+            break
+        logger.info("Model is loading, waiting for %.1f seconds and retrying...", wait)
+        time.sleep(wait)
+    
+    # Check response status (a model that is still loading is an error too)
+    if response.status_code != 200:
+        raise Exception(f"Status {response.status_code} - {response.text}")
+    
+    texts = parse_generated_texts(response.json(), len(prompts))
+    if len(texts) != len(prompts):
+        raise Exception(f"Expected {len(prompts)} generated texts, got {len(texts)}")
+    
+    logger.info("Successfully received response from Hugging Face API")
+    return texts
+
+def send_batch(model_name, prompts, deadline):
+    """MicroBatcher callback: one global rate limit token and one request per batch"""
+    deadline = deadline or Deadline()
+    limiter.acquire(None, timeout=deadline.remaining())
+    return request_completions(model_name, prompts, deadline)
+
+# Concurrent prompts for the same model share one request
+batcher = None
+if config.AI_HF_BATCH_MAX_SIZE > 1:
+    batcher = MicroBatcher(
+        'huggingface',
+        send_batch,
+        max_batch_size=config.AI_HF_BATCH_MAX_SIZE,
+        max_wait=config.AI_HF_BATCH_MAX_WAIT_MS / 1000
+    )
+
+RESUME_FEEDBACK_PREAMBLE = "Based on the following user information, provide professional resume feedback:"
+
+RESUME_FEEDBACK_INSTRUCTIONS = """Please provide feedback in JSON format with the following structure:
+{
+    "general": "Overall assessment of the resume",
+    "strengths": "Bullet points listing strengths (use • as bullet character)",
+    "improvements": "Bullet points listing areas for improvement (use • as bullet character)"
+}
+
+Make the feedback specific, actionable, and focused on helping the user improve their resume for job applications.
+Respond ONLY with the JSON, no additional text."""
+
+CAREER_ADVICE_PREAMBLE = "Based on the following user information, provide career advice tailored to their profile:"
+
+CAREER_ADVICE_INSTRUCTIONS = """Please provide career advice in JSON format with the following structure:
+{
+    "certifications": "Recommended certifications that would enhance their profile",
+    "skills": "Skills they should develop to advance their career",
+    "tips": "Practical tips for job applications and interviews"
+}
+
+Make the advice practical, specific to their field, and actionable.
+Respond ONLY with the JSON, no additional text."""
+
+DETAILED_ROADMAP_PREAMBLE = "Based on the following user information, provide a detailed career roadmap:"
+
+DETAILED_ROADMAP_INSTRUCTIONS = """Please provide a career roadmap in JSON format as an array of objects with the following structure:
+[
+    {
+        "title": "Job title or position",
+        "description": "Detailed description of the role, skills needed, and how to achieve it"
+    },
+    // More steps in the roadmap...
+]
+
+Provide 3-5 steps that form a clear progression path based on their current skills and experience.
+For each step, include actionable advice on how to reach that position.
+Respond ONLY with the JSON array, no additional text."""
+
+def generate_resume_feedback(user_data, deadline=None):
     """Generate resume feedback based on user data"""
     try:
         # Construct a detailed prompt for resume feedback
-        prompt = f"""
-        Based on the following user information, provide professional resume feedback:
-        
-        USER PROFILE:
-        Email: {user_data.get('email', 'Not provided')}
-        
-        INTERNSHIPS:
-        {format_experiences(user_data.get('internships', []))}
+        prompt = prompt_builder.build_prompt(
+            'resume_feedback', RESUME_FEEDBACK_PREAMBLE, user_data, RESUME_FEEDBACK_INSTRUCTIONS
+        )
         
-        SKILLS:
-        {', '.join(user_data.get('skills', ['Not provided']))}
-        
-        MILESTONES:
-        {format_experiences(user_data.get('milestones', []))}
-        
-        Please provide feedback in JSON format with the following structure:
-        {{
-            "general": "Overall assessment of the resume",
-            "strengths": "Bullet points listing strengths (use • as bullet character)",
-            "improvements": "Bullet points listing areas for improvement (use • as bullet character)"
-        }}
-        
-        Make the feedback specific, actionable, and focused on helping the user improve their resume for job applications.
-        Respond ONLY with the JSON, no additional text.
-        """
-        
-        response_text = generate_completion(prompt)
+        response_text = generate_completion(prompt, user_key=user_data.get('email'), deadline=deadline)
         
         # If API call failed and returned None, use fallback response
         if response_text is None:
             logger.info("Using fallback response for resume feedback")
             return config.FALLBACK_RESPONSES['resume_feedback']
         
-        # Parse the JSON response
+        # Parse the JSON response, repairing fences, trailing text and small syntax errors
         try:
-            # First try to parse the entire response as JSON
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If that fails, try to extract the JSON part from the text response
-            try:
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    result = json.loads(json_str)
-                else:
-                    raise Exception("Could not find valid JSON in response")
-            except Exception as e:
-                logger.error(f"Failed to parse JSON from response: {e}")
-                # Fall back to the default response
-                return config.FALLBACK_RESPONSES['resume_feedback']
+            result = json_extract.loads(response_text, DEFAULT_MODEL, expect='{')
+        except ValueError as e:
+            logger.error("Failed to parse JSON from response: %s", e)
+            # Fall back to the default response
+            return config.FALLBACK_RESPONSES['resume_feedback']
         
         # Validate that the result has the expected structure
         required_fields = ["general", "strengths", "improvements"]
@@ -208,64 +281,31 @@ def generate_resume_feedback(user_data):
         return result
         
     except Exception as e:
-        logger.error(f"Error generating resume feedback: {e}")
+        logger.error("Error generating resume feedback: %s", e)
         return config.FALLBACK_RESPONSES['resume_feedback']
 
-def generate_career_advice(user_data):
+def generate_career_advice(user_data, deadline=None):
     """Generate career advice based on user data"""
     try:
         # Construct a detailed prompt for career advice
-        prompt = f"""
-        Based on the following user information, provide career advice tailored to their profile:
+        prompt = prompt_builder.build_prompt(
+            'career_advice', CAREER_ADVICE_PREAMBLE, user_data, CAREER_ADVICE_INSTRUCTIONS
+        )
         
-        USER PROFILE:
-        Email: {user_data.get('email', 'Not provided')}
-        
-        INTERNSHIPS:
-        {format_experiences(user_data.get('internships', []))}
-        
-        SKILLS:
-        {', '.join(user_data.get('skills', ['Not provided']))}
-        
-        MILESTONES:
-        {format_experiences(user_data.get('milestones', []))}
-        
-        Please provide career advice in JSON format with the following structure:
-        {{
-            "certifications": "Recommended certifications that would enhance their profile",
-            "skills": "Skills they should develop to advance their career",
-            "tips": "Practical tips for job applications and interviews"
-        }}
-        
-        Make the advice practical, specific to their field, and actionable.
-        Respond ONLY with the JSON, no additional text.
-        """
-        
-        response_text = generate_completion(prompt)
+        response_text = generate_completion(prompt, user_key=user_data.get('email'), deadline=deadline)
         
         # If API call failed and returned None, use fallback response
         if response_text is None:
             logger.info("Using fallback response for career advice")
             return config.FALLBACK_RESPONSES['career_advice']
         
-        # Parse the JSON response
+        # Parse the JSON response, repairing fences, trailing text and small syntax errors
         try:
-            # First try to parse the entire response as JSON
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If that fails, try to extract the JSON part from the text response
-            try:
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    result = json.loads(json_str)
-                else:
-                    raise Exception("Could not find valid JSON in response")
-            except Exception as e:
-                logger.error(f"Failed to parse JSON from response: {e}")
-                # Fall back to the default response
-                return config.FALLBACK_RESPONSES['career_advice']
+            result = json_extract.loads(response_text, DEFAULT_MODEL, expect='{')
+        except ValueError as e:
+            logger.error("Failed to parse JSON from response: %s", e)
+            # Fall back to the default response
+            return config.FALLBACK_RESPONSES['career_advice']
         
         # Validate that the result has the expected structure
         required_fields = ["certifications", "skills", "tips"]
@@ -276,67 +316,31 @@ def generate_career_advice(user_data):
         return result
         
     except Exception as e:
-        logger.error(f"Error generating career advice: {e}")
+        logger.error("Error generating career advice: %s", e)
         return config.FALLBACK_RESPONSES['career_advice']
 
-def generate_detailed_roadmap(user_data):
+def generate_detailed_roadmap(user_data, deadline=None):
     """Generate a detailed career roadmap based on user data"""
     try:
         # Construct a detailed prompt for a career roadmap
-        prompt = f"""
-        Based on the following user information, provide a detailed career roadmap:
-        
-        USER PROFILE:
-        Email: {user_data.get('email', 'Not provided')}
-        
-        INTERNSHIPS:
-        {format_experiences(user_data.get('internships', []))}
-        
-        SKILLS:
-        {', '.join(user_data.get('skills', ['Not provided']))}
-        
-        MILESTONES:
-        {format_experiences(user_data.get('milestones', []))}
+        prompt = prompt_builder.build_prompt(
+            'detailed_roadmap', DETAILED_ROADMAP_PREAMBLE, user_data, DETAILED_ROADMAP_INSTRUCTIONS
+        )
         
-        Please provide a career roadmap in JSON format as an array of objects with the following structure:
-        [
-            {{
-                "title": "Job title or position",
-                "description": "Detailed description of the role, skills needed, and how to achieve it"
-            }},
-            // More steps in the roadmap...
-        ]
-        
-        Provide 3-5 steps that form a clear progression path based on their current skills and experience.
-        For each step, include actionable advice on how to reach that position.
-        Respond ONLY with the JSON array, no additional text.
-        """
-        
-        response_text = generate_completion(prompt)
+        response_text = generate_completion(prompt, user_key=user_data.get('email'), deadline=deadline)
         
         # If API call failed and returned None, use fallback response
         if response_text is None:
             logger.info("Using fallback response for detailed roadmap")
             return config.FALLBACK_RESPONSES['detailed_roadmap']
         
-        # Parse the JSON response
+        # Parse the JSON response, repairing fences, trailing text and small syntax errors
         try:
-            # First try to parse the entire response as JSON
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If that fails, try to extract the JSON part from the text response
-            try:
-                json_start = response_text.find('[')
-                json_end = response_text.rfind(']') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = response_text[json_start:json_end]
-                    result = json.loads(json_str)
-                else:
-                    raise Exception("Could not find valid JSON array in response")
-            except Exception as e:
-                logger.error(f"Failed to parse JSON from response: {e}")
-                # Fall back to the default response
-                return config.FALLBACK_RESPONSES['detailed_roadmap']
+            result = json_extract.loads(response_text, DEFAULT_MODEL, expect='[')
+        except ValueError as e:
+            logger.error("Failed to parse JSON from response: %s", e)
+            # Fall back to the default response
+            return config.FALLBACK_RESPONSES['detailed_roadmap']
         
         # Validate that the result has the expected structure
         if not isinstance(result, list) or len(result) == 0:
@@ -349,27 +353,28 @@ def generate_detailed_roadmap(user_data):
         return result
         
     except Exception as e:
-        logger.error(f"Error generating detailed roadmap: {e}")
+        logger.error("Error generating detailed roadmap: %s", e)
         return config.FALLBACK_RESPONSES['detailed_roadmap']
 
-def format_experiences(experiences):
-    """Format a list of experiences (internships or milestones) into a string"""
-    if not experiences or len(experiences) == 0:
-        return "None"
-    
-    formatted = []
-    for idx, exp in enumerate(experiences, 1):
-        if isinstance(exp, dict):
-            if 'company' in exp:  # It's an internship
-                company = exp.get('company', 'Unknown')
-                role = exp.get('role', 'Unknown')
-                dates = exp.get('dates', 'Unknown')
-                description = exp.get('description', 'No description provided')
-                formatted.append(f"{idx}. {role} at {company} ({dates}): {description}")
-            elif 'title' in exp:  # It's a milestone
-                title = exp.get('title', 'Unknown')
-                date = exp.get('date', 'Unknown')
-                description = exp.get('description', 'No description provided')
-                formatted.append(f"{idx}. {title} ({date}): {description}")
-    
-    return "\n".join(formatted) if formatted else "None" 
\ No newline at end of file
+# The Inference API call used here doesn't stream, so the streaming variants
+# send the finished result as a single event
+
+def stream_resume_feedback(user_data, deadline=None):
+    """Streaming variant of generate_resume_feedback"""
+    yield 'result', generate_resume_feedback(user_data, deadline=deadline)
+
+def stream_career_advice(user_data, deadline=None):
+    """Streaming variant of generate_career_advice"""
+    yield 'result', generate_career_advice(user_data, deadline=deadline)
+
+def stream_detailed_roadmap(user_data, deadline=None):
+    """Streaming variant of generate_detailed_roadmap"""
+    yield 'result', generate_detailed_roadmap(user_data, deadline=deadline)
+
+def status():
+    """Rate limiter and cache state for /api/ai/status"""
+    return {
+        "rate_limiter": limiter.stats(),
+        "cache": response_cache.stats(),
+        "batching": batcher.stats() if batcher is not None else None
+    }
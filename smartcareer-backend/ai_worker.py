@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+AI Job Worker for SmartCareer
+
+Claims queued jobs from the ai_jobs table and runs the Gemini generators outside
+the web tier. Run as many worker processes as needed; each one processes up to
+`--concurrency` jobs in parallel.
+
+Usage:
+  python ai_worker.py [--concurrency 4] [--idle-sleep 1.0]
+
+Note: Make sure your MySQL server is running and the ai_jobs table exists
+(python update_database.py) before starting the worker.
+"""
+
+import argparse
+import logging
+import signal
+import sys
+import threading
+import time
+import config
+import ai_jobs
+import ai_cache
+import ai_precompute
+import quota
+from deadline import Deadline
+
+logging.basicConfig(
+    level=logging.INFO,
+    format=config.LOG_FORMAT,
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('ai_worker')
+
+stop_event = threading.Event()
+
+def get_task_handlers():
+    """Map task names to generator functions"""
+    # Imported lazily so that --help works without a Gemini API key
+    import ai_provider
+    return ai_provider.get_task_handlers()
+
+def refund_job_quota(job):
+    """Give back the quota the web tier charged when it queued this job"""
+    email = job['payload'].get('email')
+    if not config.AI_QUOTA or job['payload'].get('precompute') or not email:
+        # Precompute rounds are charged per profile edit, not per job
+        return
+    try:
+        quota.ledger.refund_charge(email, job['task'], job['created_at'].date())
+        logger.info(f"Refunded the {job['task']} quota of AI job {job['id']}")
+    except Exception as e:
+        # The job's outcome is already recorded; a quota error must not change it
+        logger.error(f"Could not refund the quota of AI job {job['id']}: {e}")
+
+def process_job(job, claim_token, handlers):
+    """Run one claimed job and record its outcome"""
+    job_id = job['id']
+    task = job['task']
+    started = time.time()
+    meter = quota.start_metering()
+    try:
+        handler = handlers.get(task)
+        if handler is None:
+            raise ValueError(f"Unknown AI task: {task}")
+
+        # Finish well inside the visibility timeout so the job isn't handed out twice
+        deadline = Deadline(config.AI_WORKER_JOB_TIMEOUT)
+        if job['payload'].get('precompute'):
+            # Queued by a profile change: regenerate from the stored profile
+            result = ai_precompute.run_precompute(task, job['payload']['email'], handler, deadline)
+        else:
+            result = handler(job['payload'], deadline=deadline)
+            # The generators answer failures with the fallback response instead of raising;
+            # storing it as done would skip the retries
+            if ai_precompute.is_fallback(task, result):
+                raise RuntimeError(f"Generation of {task} returned the fallback response")
+        if ai_jobs.complete_job(job_id, claim_token, result) and not meter.model_calls:
+            # Answered from a cache: free, as it is for the synchronous endpoints
+            refund_job_quota(job)
+        logger.info(f"Completed AI job {job_id} ({task}) in {time.time() - started:.2f}s")
+    except Exception as e:
+        logger.error(f"AI job {job_id} ({task}) failed on attempt {job['attempts']}: {e}")
+        try:
+            if ai_jobs.fail_job(job_id, claim_token, e) and job['attempts'] >= config.AI_JOB_MAX_ATTEMPTS:
+                # Failed for good: the client gets the fallback response, which costs nothing
+                refund_job_quota(job)
+        except Exception as db_error:
+            # The visibility timeout will release the job for another attempt
+            logger.error(f"Could not record failure for AI job {job_id}: {db_error}")
+
+def worker_loop(worker_name, handlers, idle_sleep):
+    """Claim and process jobs until asked to stop"""
+    logger.info(f"{worker_name} started")
+    while not stop_event.is_set():
+        try:
+            job, claim_token = ai_jobs.claim_job()
+        except Exception as e:
+            logger.error(f"{worker_name} could not claim a job: {e}")
+            stop_event.wait(idle_sleep)
+            continue
+
+        if job is None:
+            stop_event.wait(idle_sleep)
+            continue
+
+        process_job(job, claim_token, handlers)
+    logger.info(f"{worker_name} stopped")
+
+def run(concurrency, idle_sleep, purge_interval):
+    ai_jobs.ensure_jobs_table()
+    handlers = get_task_handlers()
+
+    threads = []
+    for i in range(concurrency):
+        thread = threading.Thread(
+            target=worker_loop,
+            args=(f"worker-{i + 1}", handlers, idle_sleep),
+            daemon=True
+        )
+        thread.start()
+        threads.append(thread)
+
+    logger.info(f"AI worker running with concurrency={concurrency}")
+
+    # The main thread handles periodic cleanup of expired results
+    while not stop_event.is_set():
+        try:
+            ai_jobs.purge_expired_jobs()
+            if config.AI_PERSISTENT_CACHE:
+                ai_cache.purge_expired_entries()
+        except Exception as e:
+            logger.error(f"Failed to purge expired AI jobs: {e}")
+        stop_event.wait(purge_interval)
+
+    # In-flight jobs finish; anything left is released by the visibility timeout
+    for thread in threads:
+        thread.join(timeout=config.AI_JOB_VISIBILITY_TIMEOUT)
+    # Write the quota refunds still queued
+    quota.ledger.close()
+
+def handle_signal(signum, frame):
+    logger.info(f"Received signal {signum}, shutting down after in-flight jobs")
+    stop_event.set()
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued SmartCareer AI jobs")
+    parser.add_argument('--concurrency', type=int, default=config.AI_WORKER_CONCURRENCY,
+                        help="Number of jobs processed in parallel")
+    parser.add_argument('--idle-sleep', type=float, default=config.AI_WORKER_IDLE_SLEEP,
+                        help="Seconds to wait before polling an empty queue again")
+    parser.add_argument('--purge-interval', type=int, default=config.AI_WORKER_PURGE_INTERVAL,
+                        help="Seconds between cleanups of expired job results")
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        run(args.concurrency, args.idle_sleep, args.purge_interval)
+    except Exception as e:
+        logger.error(f"AI worker failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
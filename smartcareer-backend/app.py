@@ -1,42 +1,44 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Blueprint, request, jsonify, send_from_directory, Response, stream_with_context, g
 import mysql.connector
 import os
 import logging
 import datetime
 from werkzeug.utils import secure_filename
 import hashlib
+import hmac
 import mimetypes
 import uuid
+import json
+import time
+import config
+import ai_provider
+import ai_precompute
+import quota
+import structured_logging
+import compression
+import metrics
+import memory
+import profiler
+from structured_logging import Payload
+from json_provider import FastJSONProvider, json_array_response
+from deadline import Deadline
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# Logging goes through structured_logging, configured by create_app()
 logger = logging.getLogger('smartcareer')
 
-app = Flask(__name__)
+# All endpoints; create_app() registers them on a new Flask app
+routes = Blueprint('smartcareer', __name__)
 
 # Folder for file uploads
-UPLOAD_FOLDER = 'uploads'
+UPLOAD_FOLDER = config.UPLOAD_FOLDER
 PROFILE_IMAGES_FOLDER = os.path.join(UPLOAD_FOLDER, 'profile_images')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROFILE_IMAGES_FOLDER, exist_ok=True)
 
 # Allowed image extensions and max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
 
-# MySQL DB config (XAMPP)
-db_config = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': '',
-    'database': 'smartcareer_db'
-}
+# MySQL DB config (XAMPP by default; DB_HOST, DB_PORT, DB_USER, DB_PASSWORD and DB_NAME override it)
+db_config = config.DB_CONFIG
 
 def allowed_file(filename):
     """Check if the filename has an allowed extension"""
@@ -69,16 +71,16 @@ def save_profile_image(file):
     try:
         # Check if the file extension is allowed
         if not allowed_file(file.filename):
-            logger.warning(f"Invalid file extension: {file.filename}")
+            logger.warning("Invalid file extension: %s", file.filename)
             return None
         
         # Check file size
         file_size = get_file_size(file)
         if file_size > MAX_IMAGE_SIZE:
-            logger.warning(f"File too large: {file.filename} ({file_size} bytes)")
+            logger.warning("File too large: %s (%s bytes)", file.filename, file_size)
             return None
         elif file_size == 0:
-            logger.warning(f"Empty file: {file.filename}")
+            logger.warning("Empty file: %s", file.filename)
             return None
         
         # Ensure filename is safe
@@ -94,36 +96,37 @@ def save_profile_image(file):
         
         # Verify the file was saved successfully
         if not os.path.exists(file_path):
-            logger.error(f"Failed to save file to {file_path}")
+            logger.error("Failed to save file to %s", file_path)
             return None
             
-        logger.info(f"File saved successfully to {file_path}")
+        logger.info("File saved successfully to %s", file_path)
+        metrics.observe_upload('profile_image', file_size)
         
         # Return the URL path for the image
         return f"/attachments/profile_images/{unique_filename}"
     except Exception as e:
-        logger.error(f"Error saving profile image: {e}")
+        logger.error("Error saving profile image: %s", e)
         return None
 
 def get_db_connection():
     try:
-        conn = mysql.connector.connect(**db_config)
+        conn = metrics.connect_mysql('app', **db_config)
         logger.debug("Database connection established successfully")
         return conn
     except mysql.connector.Error as err:
-        logger.error(f"Database connection error: {err}")
+        logger.error("Database connection error: %s", err)
         raise
 
-@app.route("/")
+@routes.route("/")
 def home():
     return "✅ SmartCareer API is running"
 
 # 🔐 Register User
-@app.route('/register', methods=['POST'])
+@routes.route('/register', methods=['POST'])
 def register():
     email = request.form.get('email')
     password = request.form.get('password')
-    logger.info(f"Register attempt for email: {email}")
+    logger.info("Register attempt for email: %s", email)
 
     if not email or not password:
         logger.warning("Missing email or password in registration")
@@ -143,7 +146,7 @@ def register():
         cursor.execute("INSERT INTO users (email, password_hash) VALUES (%s, %s)", 
                       (email, hashed_password))
         user_id = cursor.lastrowid
-        logger.info(f"User inserted into users table: ID={user_id}, Email={email}")
+        logger.info("User inserted into users table: ID=%s, Email=%s", user_id, email)
         
         # Create initial profile entry
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -155,7 +158,7 @@ def register():
         
         # Commit both operations
         conn.commit()
-        logger.info(f"User profile initialized for: ID={user_id}, Email={email}")
+        logger.info("User profile initialized for: ID=%s, Email=%s", user_id, email)
         
         return jsonify({
             "message": "User registered successfully", 
@@ -165,19 +168,19 @@ def register():
     
     except mysql.connector.IntegrityError as e:
         if e.errno == 1062:
-            logger.warning(f"Email already registered: {email}")
+            logger.warning("Email already registered: %s", email)
             # Rollback transaction
             if 'conn' in locals() and conn.is_connected():
                 conn.rollback()
             return jsonify({"message": "Email already registered"}), 409
-        logger.error(f"Database error during registration: {e}")
+        logger.error("Database error during registration: %s", e)
         # Rollback transaction
         if 'conn' in locals() and conn.is_connected():
             conn.rollback()
         return jsonify({"message": "Database error", "error": str(e)}), 500
     
     except Exception as e:
-        logger.error(f"Unexpected error during registration: {e}")
+        logger.error("Unexpected error during registration: %s", e)
         # Rollback transaction
         if 'conn' in locals() and conn.is_connected():
             conn.rollback()
@@ -190,11 +193,11 @@ def register():
             conn.close()
 
 # 🔐 Login User
-@app.route('/login', methods=['POST'])
+@routes.route('/login', methods=['POST'])
 def login():
     email = request.form.get('email')
     password = request.form.get('password')
-    logger.info(f"Login attempt for email: {email}")
+    logger.info("Login attempt for email: %s", email)
 
     if not email or not password:
         logger.warning("Missing credentials in login")
@@ -212,21 +215,21 @@ def login():
         
         # If no user found, try with unhashed password (for existing users)
         if not user:
-            logger.info(f"Trying legacy password authentication for {email}")
+            logger.info("Trying legacy password authentication for %s", email)
             cursor.execute("SELECT id, email FROM users WHERE email = %s AND password_hash = %s", 
                           (email, password))
             user = cursor.fetchone()
             
             # If user found with unhashed password, update to hashed for future logins
         if user:
-                logger.info(f"Migrating user {email} to hashed password")
+                logger.info("Migrating user %s to hashed password", email)
                 cursor.execute("UPDATE users SET password_hash = %s WHERE email = %s", 
                               (hashed_password, email))
                 conn.commit()
         
         if user:
             user_id = user['id']
-            logger.info(f"Login successful: ID={user_id}, Email={email}")
+            logger.info("Login successful: ID=%s, Email=%s", user_id, email)
             
             # Fetch the user's profile if it exists
             cursor.execute("""
@@ -249,20 +252,20 @@ def login():
             
             return jsonify(response)
         else:
-            logger.warning(f"Invalid credentials for email: {email}")
+            logger.warning("Invalid credentials for email: %s", email)
             return jsonify({"message": "Invalid credentials"}), 401
     except Exception as e:
-        logger.error(f"Error during login: {e}")
+        logger.error("Error during login: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
     finally:
         cursor.close()
         conn.close()
 
 # 📄 Add Internship
-@app.route('/add_internship', methods=['POST'])
+@routes.route('/add_internship', methods=['POST'])
 def add_internship():
     email = request.form.get('email')
-    logger.info(f"Add internship attempt for email: {email}")
+    logger.info("Add internship attempt for email: %s", email)
     
     if not email:
         logger.warning("Missing email in add_internship")
@@ -275,7 +278,7 @@ def add_internship():
         result = cursor.fetchone()
         
         if not result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found"}), 404
@@ -287,7 +290,7 @@ def add_internship():
         description = request.form.get('description')
         file = request.files.get('attachment')
 
-        logger.info(f"Internship data: user_id={user_id}, company={company}, role={role}, dates={dates}")
+        logger.info("Internship data: user_id=%s, company=%s, role=%s, dates=%s", user_id, company, role, dates)
 
         if not all([company, role, dates, description]):
             logger.warning("Missing required fields in add_internship")
@@ -296,10 +299,11 @@ def add_internship():
         filename = None
         if file:
             filename = file.filename
+            metrics.observe_upload('attachment', get_file_size(file))
             file.save(os.path.join(UPLOAD_FOLDER, filename))
-            logger.info(f"File saved: {filename}")
+            logger.info("File saved: %s", filename)
 
-        logger.debug(f"Executing SQL INSERT for internship: user_id={user_id}, company={company}")
+        logger.debug("Executing SQL INSERT for internship: user_id=%s, company=%s", user_id, company)
         cursor.execute("""
             INSERT INTO internships (user_id, company, role, dates, description, filename)
             VALUES (%s, %s, %s, %s, %s, %s)
@@ -307,18 +311,20 @@ def add_internship():
         
         conn.commit()
         internship_id = cursor.lastrowid
-        logger.info(f"Internship added successfully: ID={internship_id}, User ID={user_id}")
+        logger.info("Internship added successfully: ID=%s, User ID=%s", internship_id, user_id)
         
         # Verify the insertion worked by querying the database
         cursor.execute("SELECT * FROM internships WHERE id = %s", (internship_id,))
         verification = cursor.fetchone()
         if verification:
-            logger.info(f"Verified insertion: record found with ID={internship_id}")
+            logger.info("Verified insertion: record found with ID=%s", internship_id)
         else:
-            logger.warning(f"Verification failed: no record found with ID={internship_id}")
+            logger.warning("Verification failed: no record found with ID=%s", internship_id)
             
         cursor.close()
         conn.close()
+        
+        notify_profile_changed(email)
 
         return jsonify({
             "message": "Internship submitted successfully", 
@@ -327,17 +333,17 @@ def add_internship():
         }), 201
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in add_internship: {err}")
+        logger.error("Database error in add_internship: %s", err)
         return jsonify({"message": "Database error", "error": str(err)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in add_internship: {e}")
+        logger.error("Unexpected error in add_internship: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 🏆 Add Milestone
-@app.route('/add_milestone', methods=['POST'])
+@routes.route('/add_milestone', methods=['POST'])
 def add_milestone():
     email = request.form.get('email')
-    logger.info(f"Add milestone attempt for email: {email}")
+    logger.info("Add milestone attempt for email: %s", email)
     
     if not email:
         logger.warning("Missing email in add_milestone")
@@ -350,7 +356,7 @@ def add_milestone():
         result = cursor.fetchone()
         
         if not result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found"}), 404
@@ -361,7 +367,7 @@ def add_milestone():
         description = request.form.get('description', '')
         file = request.files.get('attachment')
 
-        logger.info(f"Milestone data: user_id={user_id}, title={title}, date={date}, description={description}")
+        logger.info("Milestone data: user_id=%s, title=%s, date=%s, description=%s", user_id, title, date, description)
 
         if not all([title, date]):
             logger.warning("Missing title or date in add_milestone")
@@ -370,10 +376,11 @@ def add_milestone():
         filename = None
         if file:
             filename = file.filename
+            metrics.observe_upload('attachment', get_file_size(file))
             file.save(os.path.join(UPLOAD_FOLDER, filename))
-            logger.info(f"File saved: {filename}")
+            logger.info("File saved: %s", filename)
 
-        logger.debug(f"Executing SQL INSERT for milestone: user_id={user_id}, title={title}")
+        logger.debug("Executing SQL INSERT for milestone: user_id=%s, title=%s", user_id, title)
         cursor.execute("""
             INSERT INTO milestones (user_id, title, date, description, filename)
             VALUES (%s, %s, %s, %s, %s)
@@ -381,18 +388,20 @@ def add_milestone():
         
         conn.commit()
         milestone_id = cursor.lastrowid
-        logger.info(f"Milestone added successfully: ID={milestone_id}, User ID={user_id}")
+        logger.info("Milestone added successfully: ID=%s, User ID=%s", milestone_id, user_id)
         
         # Verify the insertion worked by querying the database
         cursor.execute("SELECT * FROM milestones WHERE id = %s", (milestone_id,))
         verification = cursor.fetchone()
         if verification:
-            logger.info(f"Verified milestone insertion: record found with ID={milestone_id}")
+            logger.info("Verified milestone insertion: record found with ID=%s", milestone_id)
         else:
-            logger.warning(f"Verification failed: no milestone record found with ID={milestone_id}")
+            logger.warning("Verification failed: no milestone record found with ID=%s", milestone_id)
         
         cursor.close()
         conn.close()
+        
+        notify_profile_changed(email)
 
         return jsonify({
             "message": "Milestone added successfully", 
@@ -401,19 +410,130 @@ def add_milestone():
         }), 201
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in add_milestone: {err}")
+        logger.error("Database error in add_milestone: %s", err)
         return jsonify({"message": "Database error", "error": str(err)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in add_milestone: {e}")
+        logger.error("Unexpected error in add_milestone: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
+# Fill in the profile data the AI generators need from the database
+def prepare_ai_user_data(user_data):
+    """Load internships and milestones from the database if the request did not include them"""
+    if 'internships' not in user_data or not user_data['internships']:
+        user_data['internships'] = get_user_internships(user_data['email'])
+        logger.info("Retrieved %s internships from database", len(user_data['internships']))
+        
+    if 'milestones' not in user_data or not user_data['milestones']:
+        user_data['milestones'] = get_user_milestones(user_data['email'])
+        logger.info("Retrieved %s milestones from database", len(user_data['milestones']))
+    
+    # If skills are not provided, add an empty list
+    if 'skills' not in user_data:
+        user_data['skills'] = []
+    
+    return user_data
+
+# Keep the precomputed AI results in step with the profile (see ai_precompute.py)
+def notify_profile_changed(email):
+    """Queue regeneration of the user's AI results in the background; a failure here never fails the edit itself"""
+    if not config.AI_PRECOMPUTE:
+        return
+    try:
+        ai_precompute.schedule_profile_changed(email)
+    except Exception as e:
+        logger.error("Could not queue AI regeneration for %s: %s", email, e)
+
+def find_precomputed_result(task, user_data):
+    """Return (result, fingerprint) for the profile in user_data; result is None on a miss"""
+    if not config.AI_PRECOMPUTE:
+        return None, None
+    try:
+        fingerprint = ai_precompute.profile_fingerprint(user_data)
+        result = ai_precompute.get_result(user_data['email'], task, fingerprint)
+        metrics.count_cache('precomputed', result is not None)
+        return result, fingerprint
+    except Exception as e:
+        logger.error("Could not read precomputed %s: %s", task, e)
+        return None, None
+
+def save_precomputed_result(task, user_data, fingerprint, result):
+    if fingerprint is None:
+        return
+    try:
+        ai_precompute.store_result(user_data, task, fingerprint, result)
+    except Exception as e:
+        logger.error("Could not store precomputed %s: %s", task, e)
+
+# Per-user daily AI quotas (see quota.py)
+def check_ai_quota(task, email, consume=True):
+    """Count a live generation against the user's quota and return the quota status (None when quotas are off)"""
+    if not config.AI_QUOTA:
+        return None
+    if consume:
+        return quota.ledger.consume(email, task)
+    return quota.ledger.peek(email, task)
+
+def settle_ai_quota(task, email, quota_status, meter, result):
+    """
+    Keep the quota charged for a generation only if a model answered it; a
+    cached answer or the fallback response is refunded. Returns the quota status.
+    """
+    if meter.model_calls and not ai_precompute.is_fallback(task, result):
+        return quota_status
+    return refund_ai_quota(task, email, quota_status)
+
+def refund_ai_quota(task, email, quota_status):
+    """Give back a generation charged by check_ai_quota(). Returns the quota status."""
+    if quota_status is None:
+        return None
+    return quota.ledger.refund(email, task)
+
+def quota_headers(status):
+    """Response headers telling the client how much of today's quota is left"""
+    if status is None or status['limit'] is None:
+        return {}
+    return {
+        'X-AI-Quota-Limit': str(status['limit']),
+        'X-AI-Quota-Remaining': str(status['remaining']),
+        'X-AI-Quota-Reset': str(status['reset_seconds'])
+    }
+
+def quota_exceeded_response(error):
+    logger.warning(str(error))
+    headers = quota_headers(error.status)
+    headers['Retry-After'] = str(error.status['reset_seconds'])
+    return jsonify({"message": "Daily AI quota exceeded", "quota": error.status}), 429, headers
+
+def generate_ai_result(task, generate_func, user_data, deadline):
+    """
+    Serve the stored result for this exact profile, generating it live only on a miss.
+    Returns (result, quota status); only answers from the model count against the quota.
+    """
+    result, fingerprint = find_precomputed_result(task, user_data)
+    if result is not None:
+        logger.info("Serving precomputed %s for %s", task, user_data.get('email'))
+        return result, check_ai_quota(task, user_data['email'], consume=False)
+    
+    quota_status = check_ai_quota(task, user_data['email'])
+    meter = quota.start_metering()
+    try:
+        result = generate_func(user_data, deadline=deadline)
+    except Exception:
+        settle_ai_quota(task, user_data['email'], quota_status, meter, None)
+        raise
+    save_precomputed_result(task, user_data, fingerprint, result)
+    return result, settle_ai_quota(task, user_data['email'], quota_status, meter, result)
+
 # 🧠 AI Resume Feedback
-@app.route('/api/resume-feedback', methods=['POST'])
+@routes.route('/api/resume-feedback', methods=['POST'])
 def api_resume_feedback():
     try:
+        # The time budget covers the whole request, database lookups included
+        deadline = Deadline(config.AI_REQUEST_TIMEOUT)
+        
         # Get JSON data from request
         user_data = request.get_json()
-        logger.info(f"Resume feedback request received for email: {user_data.get('email')}")
+        logger.info("Resume feedback request received for email: %s", user_data.get('email'))
         
         if not user_data:
             logger.warning("No data provided in resume feedback request")
@@ -425,38 +545,33 @@ def api_resume_feedback():
             return jsonify({"message": "Email is required"}), 400
             
         # Get user data from database if not provided in request
-        if 'internships' not in user_data or not user_data['internships']:
-            user_data['internships'] = get_user_internships(user_data['email'])
-            logger.info(f"Retrieved {len(user_data['internships'])} internships from database")
-            
-        if 'milestones' not in user_data or not user_data['milestones']:
-            user_data['milestones'] = get_user_milestones(user_data['email'])
-            logger.info(f"Retrieved {len(user_data['milestones'])} milestones from database")
-        
-        # If skills are not provided, add an empty list
-        if 'skills' not in user_data:
-            user_data['skills'] = []
+        prepare_ai_user_data(user_data)
         
-        # Import the AI service here to avoid circular imports
-        import ai_service_gemini
+        # The AI provider is imported on first use (see AI_PROVIDER)
+        provider = ai_provider.get_provider()
         
         # Generate the feedback
-        feedback = ai_service_gemini.generate_resume_feedback(user_data)
-        logger.info(f"Resume feedback generated successfully for {user_data.get('email')}")
+        feedback, quota_status = generate_ai_result('resume_feedback', provider.generate_resume_feedback, user_data, deadline)
+        logger.info("Resume feedback generated successfully for %s", user_data.get('email'))
         
-        return jsonify(feedback)
+        return jsonify(feedback), 200, quota_headers(quota_status)
         
+    except quota.QuotaExceeded as e:
+        return quota_exceeded_response(e)
     except Exception as e:
-        logger.error(f"Error in resume feedback endpoint: {e}")
+        logger.error("Error in resume feedback endpoint: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 💡 AI Career Advice
-@app.route('/api/career-advice', methods=['POST'])
+@routes.route('/api/career-advice', methods=['POST'])
 def api_career_advice():
     try:
+        # The time budget covers the whole request, database lookups included
+        deadline = Deadline(config.AI_REQUEST_TIMEOUT)
+        
         # Get JSON data from request
         user_data = request.get_json()
-        logger.info(f"Career advice request received for email: {user_data.get('email')}")
+        logger.info("Career advice request received for email: %s", user_data.get('email'))
         
         if not user_data:
             logger.warning("No data provided in career advice request")
@@ -468,38 +583,33 @@ def api_career_advice():
             return jsonify({"message": "Email is required"}), 400
             
         # Get user data from database if not provided in request
-        if 'internships' not in user_data or not user_data['internships']:
-            user_data['internships'] = get_user_internships(user_data['email'])
-            logger.info(f"Retrieved {len(user_data['internships'])} internships from database")
-            
-        if 'milestones' not in user_data or not user_data['milestones']:
-            user_data['milestones'] = get_user_milestones(user_data['email'])
-            logger.info(f"Retrieved {len(user_data['milestones'])} milestones from database")
-        
-        # If skills are not provided, add an empty list
-        if 'skills' not in user_data:
-            user_data['skills'] = []
+        prepare_ai_user_data(user_data)
         
-        # Import the AI service here to avoid circular imports
-        import ai_service_gemini
+        # The AI provider is imported on first use (see AI_PROVIDER)
+        provider = ai_provider.get_provider()
         
         # Generate the career advice
-        advice = ai_service_gemini.generate_career_advice(user_data)
-        logger.info(f"Career advice generated successfully for {user_data.get('email')}")
+        advice, quota_status = generate_ai_result('career_advice', provider.generate_career_advice, user_data, deadline)
+        logger.info("Career advice generated successfully for %s", user_data.get('email'))
         
-        return jsonify(advice)
+        return jsonify(advice), 200, quota_headers(quota_status)
         
+    except quota.QuotaExceeded as e:
+        return quota_exceeded_response(e)
     except Exception as e:
-        logger.error(f"Error in career advice endpoint: {e}")
+        logger.error("Error in career advice endpoint: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 🗺️ AI Detailed Roadmap
-@app.route('/api/detailed-roadmap', methods=['POST'])
+@routes.route('/api/detailed-roadmap', methods=['POST'])
 def api_detailed_roadmap():
     try:
+        # The time budget covers the whole request, database lookups included
+        deadline = Deadline(config.AI_REQUEST_TIMEOUT)
+        
         # Get JSON data from request
         user_data = request.get_json()
-        logger.info(f"Detailed roadmap request received for email: {user_data.get('email')}")
+        logger.info("Detailed roadmap request received for email: %s", user_data.get('email'))
         
         if not user_data:
             logger.warning("No data provided in detailed roadmap request")
@@ -511,29 +621,502 @@ def api_detailed_roadmap():
             return jsonify({"message": "Email is required"}), 400
             
         # Get user data from database if not provided in request
-        if 'internships' not in user_data or not user_data['internships']:
-            user_data['internships'] = get_user_internships(user_data['email'])
-            logger.info(f"Retrieved {len(user_data['internships'])} internships from database")
-            
-        if 'milestones' not in user_data or not user_data['milestones']:
-            user_data['milestones'] = get_user_milestones(user_data['email'])
-            logger.info(f"Retrieved {len(user_data['milestones'])} milestones from database")
-        
-        # If skills are not provided, add an empty list
-        if 'skills' not in user_data:
-            user_data['skills'] = []
+        prepare_ai_user_data(user_data)
         
-        # Import the AI service here to avoid circular imports
-        import ai_service_gemini
+        # The AI provider is imported on first use (see AI_PROVIDER)
+        provider = ai_provider.get_provider()
         
         # Generate the detailed roadmap
-        roadmap = ai_service_gemini.generate_detailed_roadmap(user_data)
-        logger.info(f"Detailed roadmap generated successfully for {user_data.get('email')}")
+        roadmap, quota_status = generate_ai_result('detailed_roadmap', provider.generate_detailed_roadmap, user_data, deadline)
+        logger.info("Detailed roadmap generated successfully for %s", user_data.get('email'))
         
-        return jsonify(roadmap)
+        return jsonify(roadmap), 200, quota_headers(quota_status)
         
+    except quota.QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        logger.error("Error in detailed roadmap endpoint: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# Format one Server-Sent Events message
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_ai_endpoint(task, stream_func):
+    """Validate an AI request and stream the generator's events as Server-Sent Events"""
+    deadline = Deadline(config.AI_REQUEST_TIMEOUT)
+    user_data = request.get_json(silent=True)
+    
+    if not user_data:
+        logger.warning("No data provided in %s stream request", task)
+        return jsonify({"message": "No data provided"}), 400
+    
+    if 'email' not in user_data:
+        logger.warning("No email provided in %s stream request", task)
+        return jsonify({"message": "Email is required"}), 400
+    
+    try:
+        prepare_ai_user_data(user_data)
     except Exception as e:
-        logger.error(f"Error in detailed roadmap endpoint: {e}")
+        logger.error("Error preparing %s stream request: %s", task, e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+    
+    stored, fingerprint = find_precomputed_result(task, user_data)
+    try:
+        quota_status = check_ai_quota(task, user_data['email'], consume=stored is None)
+    except quota.QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    logger.info("Streaming %s for %s%s", task, user_data.get('email'), " (precomputed)" if stored is not None else "")
+    
+    def generate():
+        if stored is not None:
+            # Same events a live stream ends with
+            if task == 'detailed_roadmap':
+                for step in stored:
+                    yield format_sse('step', step)
+            yield format_sse('result', stored)
+        else:
+            # The headers are sent already; a refund shows in the next response's quota headers
+            meter = quota.start_metering()
+            result = None
+            try:
+                for event, data in stream_func(user_data, deadline=deadline):
+                    if event == 'result':
+                        result = data
+                        save_precomputed_result(task, user_data, fingerprint, data)
+                    yield format_sse(event, data)
+            finally:
+                settle_ai_quota(task, user_data['email'], quota_status, meter, result)
+        yield format_sse('done', {})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # Stop nginx from buffering the stream
+            **quota_headers(quota_status)
+        }
+    )
+
+# 🧠 AI Resume Feedback - streamed as Server-Sent Events
+@routes.route('/api/resume-feedback/stream', methods=['POST'])
+def api_resume_feedback_stream():
+    return stream_ai_endpoint('resume_feedback', ai_provider.get_provider().stream_resume_feedback)
+
+# 💡 AI Career Advice - streamed as Server-Sent Events
+@routes.route('/api/career-advice/stream', methods=['POST'])
+def api_career_advice_stream():
+    return stream_ai_endpoint('career_advice', ai_provider.get_provider().stream_career_advice)
+
+# 🗺️ AI Detailed Roadmap - streamed as Server-Sent Events, one event per step
+@routes.route('/api/detailed-roadmap/stream', methods=['POST'])
+def api_detailed_roadmap_stream():
+    return stream_ai_endpoint('detailed_roadmap', ai_provider.get_provider().stream_detailed_roadmap)
+
+# 📊 AI service status: rate limiter, cache, request coalescing and circuit breaker state
+@routes.route('/api/ai/status', methods=['GET'])
+def ai_status():
+    try:
+        import resilience
+        import prompt_builder
+        import json_extract
+        
+        status = {"provider": config.AI_PROVIDER}
+        status.update(ai_provider.get_provider().status())
+        status.update({
+            "circuit_breakers": resilience.breaker_stats(),
+            "prompts": prompt_builder.prompt_stats(),
+            "json_parsing": json_extract.parse_stats(),
+            "quota": quota.ledger.stats() if config.AI_QUOTA else None,
+            "logging": structured_logging.stats(),
+            "compression": compression.stats()
+        })
+        return jsonify(status)
+    except Exception as e:
+        logger.error("Error in ai_status endpoint: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 📈 Prometheus metrics: request, database, AI call and cache figures (see metrics.py)
+@routes.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    if not config.METRICS:
+        return jsonify({"message": "Metrics are disabled"}), 404
+    if config.METRICS_TOKEN:
+        authorization = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {config.METRICS_TOKEN}".encode()):
+            logger.warning("Rejected metrics request")
+            return jsonify({"message": "Forbidden"}), 403
+    try:
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+    except Exception as e:
+        logger.error("Error in prometheus_metrics endpoint: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🔍 Audit trail of AI results reused for near-identical profiles
+@routes.route('/api/ai/similarity-audit', methods=['GET'])
+def ai_similarity_audit():
+    import similarity_cache
+    
+    # Hashed user ids and match scores are for operators only
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify({
+        "threshold": config.AI_SIMILARITY_THRESHOLD,
+        "matches": similarity_cache.recent_matches()[:limit]
+    })
+
+# Map the public task names used in URLs to the internal AI task names
+AI_JOB_TASKS = {
+    'resume-feedback': 'resume_feedback',
+    'career-advice': 'career_advice',
+    'detailed-roadmap': 'detailed_roadmap'
+}
+
+# ⏳ Submit an AI job (processed by ai_worker.py)
+@routes.route('/api/jobs/<task>', methods=['POST'])
+def submit_ai_job(task):
+    if task not in AI_JOB_TASKS:
+        logger.warning("Unknown AI job task: %s", task)
+        return jsonify({"message": "Unknown task"}), 404
+    
+    try:
+        user_data = request.get_json(silent=True)
+        
+        if not user_data:
+            logger.warning("No data provided in AI job request")
+            return jsonify({"message": "No data provided"}), 400
+        
+        if 'email' not in user_data:
+            logger.warning("No email provided in AI job request")
+            return jsonify({"message": "Email is required"}), 400
+        
+        prepare_ai_user_data(user_data)
+        
+        import ai_jobs
+        
+        # Charged when submitted: the worker can't turn a job away. ai_worker.py
+        # gives it back if the job is answered from a cache or fails for good.
+        quota_status = check_ai_quota(AI_JOB_TASKS[task], user_data['email'])
+        try:
+            job_id, status, created = ai_jobs.submit_job(AI_JOB_TASKS[task], user_data)
+        except Exception:
+            refund_ai_quota(AI_JOB_TASKS[task], user_data['email'], quota_status)
+            raise
+        if not created:
+            # An identical job is already queued, and was charged when it was submitted
+            quota_status = refund_ai_quota(AI_JOB_TASKS[task], user_data['email'], quota_status)
+        logger.info("AI job %s (%s) submitted for %s", job_id, task, user_data.get('email'))
+        
+        return jsonify({
+            "job_id": job_id,
+            "status": status,
+            "status_url": f"/api/jobs/{job_id}"
+        }), 202, quota_headers(quota_status)
+    
+    except quota.QuotaExceeded as e:
+        return quota_exceeded_response(e)
+    except mysql.connector.Error as err:
+        logger.error("Database error in submit_ai_job: %s", err)
+        return jsonify({"message": "Database error", "error": str(err)}), 500
+    except Exception as e:
+        logger.error("Unexpected error in submit_ai_job: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+def ai_job_response(job_id, job):
+    """Body and status of GET /api/jobs/<job_id> for a job read by get_job() (also used by asgi.py)"""
+    if not job:
+        return {"message": "Job not found or expired"}, 404
+    
+    response = {
+        "job_id": job['id'],
+        "task": job['task'],
+        "status": job['status'],
+        "attempts": job['attempts']
+    }
+    
+    if job['status'] == 'done':
+        response["result"] = job['result']
+        return response, 200
+    
+    if job['status'] == 'failed':
+        # Clients always get a usable payload, same as the synchronous endpoints
+        logger.warning("AI job %s failed: %s", job_id, job['error'])
+        response["result"] = config.FALLBACK_RESPONSES[job['task']]
+        return response, 200
+    
+    return response, 202
+
+# ⏳ Poll an AI job, optionally waiting up to `wait` seconds for it to finish.
+# The wait holds this worker thread, so it is capped at AI_JOB_MAX_WAIT (a few
+# seconds); asgi.py serves long waits without holding a thread.
+@routes.route('/api/jobs/<job_id>', methods=['GET'])
+def get_ai_job(job_id):
+    wait = min(max(request.args.get('wait', 0, type=float), 0), config.AI_JOB_MAX_WAIT)
+    
+    try:
+        import ai_jobs
+        
+        deadline = time.time() + wait
+        job = ai_jobs.get_job(job_id)
+        while job and job['status'] not in ai_jobs.TERMINAL_STATUSES and time.time() < deadline:
+            time.sleep(min(config.AI_JOB_POLL_INTERVAL, max(deadline - time.time(), 0)))
+            job = ai_jobs.get_job(job_id)
+        
+        body, status = ai_job_response(job_id, job)
+        return jsonify(body), status
+    
+    except mysql.connector.Error as err:
+        logger.error("Database error in get_ai_job: %s", err)
+        return jsonify({"message": "Database error", "error": str(err)}), 500
+    except Exception as e:
+        logger.error("Unexpected error in get_ai_job: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# Admin endpoints are enabled by setting AI_ADMIN_TOKEN
+def has_admin_token():
+    """True if admin endpoints are enabled and the request carries the admin token"""
+    token = request.headers.get('X-Admin-Token', '')
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    return bool(config.AI_ADMIN_TOKEN) and hmac.compare_digest(token.encode(), config.AI_ADMIN_TOKEN.encode())
+
+def require_admin():
+    """Return an error response unless the request carries the admin token"""
+    if not config.AI_ADMIN_TOKEN:
+        return jsonify({"message": "Admin endpoints are disabled"}), 404
+    if not has_admin_token():
+        logger.warning("Rejected admin request to %s", request.path)
+        return jsonify({"message": "Forbidden"}), 403
+    return None
+
+# Tasks with a daily quota: the AI tasks, and the regeneration rounds profile edits queue
+QUOTA_TASKS = list(AI_JOB_TASKS.values()) + [quota.PRECOMPUTE]
+
+# 🛡️ Admin: a user's AI quota usage today, and their overrides
+@routes.route('/api/admin/quota/<email>', methods=['GET'])
+def admin_get_quota(email):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    try:
+        return jsonify(quota.ledger.usage(email, QUOTA_TASKS))
+    except Exception as e:
+        logger.error("Error in admin_get_quota: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: set a user's daily limit for one task, or for all tasks with task "*"
+@routes.route('/api/admin/quota/<email>', methods=['PUT'])
+def admin_set_quota(email):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    task = data.get('task', quota.ALL_TASKS)
+    if task != quota.ALL_TASKS and task not in QUOTA_TASKS:
+        return jsonify({"message": "Unknown task"}), 400
+    if not isinstance(data.get('daily_limit'), int):
+        return jsonify({"message": "daily_limit must be an integer (negative for unlimited)"}), 400
+    
+    try:
+        quota.ledger.set_override(email, task, data['daily_limit'], data.get('reason'))
+        logger.info("Quota override for %s: %s = %s", email, task, data['daily_limit'])
+        return jsonify(quota.ledger.usage(email, QUOTA_TASKS))
+    except mysql.connector.Error as err:
+        logger.error("Database error in admin_set_quota: %s", err)
+        return jsonify({"message": "Database error", "error": str(err)}), 500
+    except Exception as e:
+        logger.error("Unexpected error in admin_set_quota: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: remove a user's quota override
+@routes.route('/api/admin/quota/<email>', methods=['DELETE'])
+def admin_delete_quota(email):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    task = request.args.get('task', quota.ALL_TASKS)
+    try:
+        if not quota.ledger.delete_override(email, task):
+            return jsonify({"message": "No such override"}), 404
+        logger.info("Removed quota override for %s: %s", email, task)
+        return jsonify(quota.ledger.usage(email, QUOTA_TASKS))
+    except mysql.connector.Error as err:
+        logger.error("Database error in admin_delete_quota: %s", err)
+        return jsonify({"message": "Database error", "error": str(err)}), 500
+    except Exception as e:
+        logger.error("Unexpected error in admin_delete_quota: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: current log level and sampling
+@routes.route('/api/admin/logging', methods=['GET'])
+def admin_get_logging():
+    denied = require_admin()
+    if denied:
+        return denied
+    return jsonify(structured_logging.stats())
+
+# 🛡️ Admin: change the log level and sampling without a restart
+@routes.route('/api/admin/logging', methods=['PUT'])
+def admin_set_logging():
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    route_sample_rates = data.get('route_sample_rates')
+    if route_sample_rates is not None and not isinstance(route_sample_rates, dict):
+        return jsonify({"message": "route_sample_rates must be an object of route: rate"}), 400
+    
+    try:
+        updated = structured_logging.settings.update(
+            level=data.get('level'),
+            sample_rate=data.get('sample_rate'),
+            route_sample_rates=route_sample_rates
+        )
+        logger.warning("Logging settings changed: %s", updated)
+        return jsonify(structured_logging.stats())
+    except (ValueError, TypeError) as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        logger.error("Unexpected error in admin_set_logging: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: stored request profiles, newest first (see profiler.py)
+@routes.route('/api/admin/profiles', methods=['GET'])
+def admin_list_profiles():
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    try:
+        return jsonify({"settings": profiler.settings(), "profiles": profiler.list_reports()})
+    except Exception as e:
+        logger.error("Error in admin_list_profiles: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: one request profile with its top functions
+@routes.route('/api/admin/profiles/<report_id>', methods=['GET'])
+def admin_get_profile(report_id):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    report = profiler.load_report(report_id)
+    if report is None:
+        return jsonify({"message": "Profile not found"}), 404
+    return jsonify(report)
+
+# 🛡️ Admin: the raw profile, a pstats .prof file or collapsed stacks for a flame graph
+@routes.route('/api/admin/profiles/<report_id>/raw', methods=['GET'])
+def admin_get_raw_profile(report_id):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    path = profiler.raw_report_path(report_id)
+    if path is None:
+        return jsonify({"message": "Profile not found"}), 404
+    directory, filename = os.path.split(os.path.abspath(path))
+    return send_from_directory(directory, filename, as_attachment=True)
+
+# 🛡️ Admin: this worker's RSS, growth alarm, cache sizes and memory tracing state (see memory.py)
+@routes.route('/api/admin/memory', methods=['GET'])
+def admin_get_memory():
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    try:
+        return jsonify(memory.report())
+    except Exception as e:
+        logger.error("Error in admin_get_memory: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: start or stop tracemalloc in this worker
+@routes.route('/api/admin/memory/tracing', methods=['PUT'])
+def admin_set_memory_tracing():
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    enabled = data.get('enabled')
+    frames = data.get('frames')
+    if not isinstance(enabled, bool):
+        return jsonify({"message": "enabled must be true or false"}), 400
+    if frames is not None and (not isinstance(frames, int) or isinstance(frames, bool) or frames < 1):
+        return jsonify({"message": "frames must be a positive integer"}), 400
+    
+    try:
+        if enabled:
+            memory.start_tracing(frames)
+        else:
+            memory.stop_tracing()
+        return jsonify(memory.tracing_stats())
+    except Exception as e:
+        logger.error("Unexpected error in admin_set_memory_tracing: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: take a tracemalloc snapshot and show its top allocation sites
+@routes.route('/api/admin/memory/snapshots', methods=['POST'])
+def admin_take_memory_snapshot():
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        snapshot_id = memory.take_snapshot(data.get('label'))
+        return jsonify(memory.top_sites(snapshot_id, request.args.get('group_by', 'lineno'), request.args.get('limit', type=int))), 201
+    except memory.TracingNotStarted as e:
+        return jsonify({"message": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        logger.error("Unexpected error in admin_take_memory_snapshot: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: top allocation sites of a snapshot
+@routes.route('/api/admin/memory/snapshots/<int:snapshot_id>', methods=['GET'])
+def admin_get_memory_snapshot(snapshot_id):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    try:
+        return jsonify(memory.top_sites(snapshot_id, request.args.get('group_by', 'lineno'), request.args.get('limit', type=int)))
+    except KeyError:
+        return jsonify({"message": "Snapshot not found"}), 404
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        logger.error("Unexpected error in admin_get_memory_snapshot: %s", e)
+        return jsonify({"message": "Server error", "error": str(e)}), 500
+
+# 🛡️ Admin: allocation sites that grew between a snapshot and another one (?to=<id>) or now
+@routes.route('/api/admin/memory/snapshots/<int:snapshot_id>/diff', methods=['GET'])
+def admin_diff_memory_snapshots(snapshot_id):
+    denied = require_admin()
+    if denied:
+        return denied
+    
+    try:
+        return jsonify(memory.diff(snapshot_id, request.args.get('to', type=int),
+                                   request.args.get('group_by', 'lineno'), request.args.get('limit', type=int)))
+    except KeyError:
+        return jsonify({"message": "Snapshot not found"}), 404
+    except memory.TracingNotStarted as e:
+        return jsonify({"message": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    except Exception as e:
+        logger.error("Unexpected error in admin_diff_memory_snapshots: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # Helper function to get user internships from database
@@ -547,7 +1130,7 @@ def get_user_internships(email):
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return []
@@ -573,7 +1156,7 @@ def get_user_internships(email):
         return internships
         
     except Exception as e:
-        logger.error(f"Error retrieving internships from database: {e}")
+        logger.error("Error retrieving internships from database: %s", e)
         return []
 
 # Helper function to get user milestones from database
@@ -587,7 +1170,7 @@ def get_user_milestones(email):
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return []
@@ -615,14 +1198,14 @@ def get_user_milestones(email):
         return milestones
         
     except Exception as e:
-        logger.error(f"Error retrieving milestones from database: {e}")
+        logger.error("Error retrieving milestones from database: %s", e)
         return []
 
 # 📄 Get Internships for a User
-@app.route('/get_internships', methods=['GET'])
+@routes.route('/get_internships', methods=['GET'])
 def get_internships():
     email = request.args.get('email')
-    logger.info(f"Get internships request for email: {email}")
+    logger.info("Get internships request for email: %s", email)
     
     if not email:
         logger.warning("Missing email in get_internships request")
@@ -637,55 +1220,38 @@ def get_internships():
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found"}), 404
         
         user_id = user_result['id']
-        logger.info(f"Found user with ID: {user_id}")
+        logger.info("Found user with ID: %s", user_id)
         
-        # Now get all internships for this user
+        # Now get all internships for this user, already in the format the Android client expects
         cursor.execute("""
-            SELECT i.id, i.company, i.role, i.dates, i.description, i.filename
+            SELECT CAST(i.id AS CHAR) AS id, i.company, i.role, i.dates, i.description,
+                   COALESCE(i.filename, '') AS filename
             FROM internships i
             WHERE i.user_id = %s
             ORDER BY i.id DESC
         """, (user_id,))
         
-        internships = cursor.fetchall()
-        logger.info(f"Found {len(internships)} internships for user {email}")
-        
-        # Convert to proper format for Android client
-        internship_list = []
-        for internship in internships:
-            item = {
-                "id": str(internship['id']),
-                "company": internship['company'],
-                "role": internship['role'],
-                "dates": internship['dates'],
-                "description": internship['description'],
-                "filename": internship['filename'] if internship['filename'] else ""
-            }
-            internship_list.append(item)
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(internship_list)
+        # Rows go from the cursor to the response in batches (closes cursor and connection)
+        return json_array_response(cursor, conn)
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in get_internships: {err}")
+        logger.error("Database error in get_internships: %s", err)
         return jsonify({"message": "Database error", "error": str(err)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in get_internships: {e}")
+        logger.error("Unexpected error in get_internships: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 🏆 Get Milestones for a User
-@app.route('/get_milestones', methods=['GET'])
+@routes.route('/get_milestones', methods=['GET'])
 def get_milestones():
     email = request.args.get('email')
-    logger.info(f"Get milestones request for email: {email}")
+    logger.info("Get milestones request for email: %s", email)
     
     if not email:
         logger.warning("Missing email in get_milestones request")
@@ -700,55 +1266,39 @@ def get_milestones():
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found"}), 404
         
         user_id = user_result['id']
-        logger.info(f"Found user with ID: {user_id}")
+        logger.info("Found user with ID: %s", user_id)
         
-        # Now get all milestones for this user
+        # Now get all milestones for this user; the JSON provider writes dates as YYYY-MM-DD
         cursor.execute("""
-            SELECT m.id, m.title, m.date, m.description, m.filename
+            SELECT CAST(m.id AS CHAR) AS id, m.title, m.date,
+                   COALESCE(m.description, '') AS description, COALESCE(m.filename, '') AS filename
             FROM milestones m
             WHERE m.user_id = %s
             ORDER BY m.date DESC
         """, (user_id,))
         
-        milestones = cursor.fetchall()
-        logger.info(f"Found {len(milestones)} milestones for user {email}")
-        
-        # Convert to proper format for Android client
-        milestone_list = []
-        for milestone in milestones:
-            item = {
-                "id": str(milestone['id']),
-                "title": milestone['title'],
-                "date": milestone['date'].strftime('%Y-%m-%d') if hasattr(milestone['date'], 'strftime') else milestone['date'],
-                "description": milestone['description'] if milestone['description'] else "",
-                "filename": milestone['filename'] if milestone['filename'] else ""
-            }
-            milestone_list.append(item)
-        
-        cursor.close()
-        conn.close()
-        
-        return jsonify(milestone_list)
+        # Rows go from the cursor to the response in batches (closes cursor and connection)
+        return json_array_response(cursor, conn)
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in get_milestones: {err}")
+        logger.error("Database error in get_milestones: %s", err)
         return jsonify({"message": "Database error", "error": str(err)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in get_milestones: {e}")
+        logger.error("Unexpected error in get_milestones: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 🗑️ Delete Internship
-@app.route('/delete_internship', methods=['POST'])
+@routes.route('/delete_internship', methods=['POST'])
 def delete_internship():
     email = request.form.get('email')
     internship_id = request.form.get('id')
-    logger.info(f"Delete internship request for email: {email}, internship ID: {internship_id}")
+    logger.info("Delete internship request for email: %s, internship ID: %s", email, internship_id)
     
     if not email or not internship_id:
         logger.warning("Missing email or internship ID in delete_internship request")
@@ -763,7 +1313,7 @@ def delete_internship():
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found"}), 404
@@ -777,32 +1327,34 @@ def delete_internship():
         """, (internship_id, user_id))
         
         if cursor.rowcount == 0:
-            logger.warning(f"Internship not found or does not belong to user: internship_id={internship_id}, user_id={user_id}")
+            logger.warning("Internship not found or does not belong to user: internship_id=%s, user_id=%s", internship_id, user_id)
             cursor.close()
             conn.close()
             return jsonify({"message": "Internship not found or access denied"}), 404
         
         conn.commit()
-        logger.info(f"Internship deleted successfully: ID={internship_id}")
+        logger.info("Internship deleted successfully: ID=%s", internship_id)
         
         cursor.close()
         conn.close()
         
+        notify_profile_changed(email)
+        
         return jsonify({"message": "Internship deleted successfully"})
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in delete_internship: {err}")
+        logger.error("Database error in delete_internship: %s", err)
         return jsonify({"message": "Database error", "error": str(err)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in delete_internship: {e}")
+        logger.error("Unexpected error in delete_internship: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 🗑️ Delete Milestone
-@app.route('/delete_milestone', methods=['POST'])
+@routes.route('/delete_milestone', methods=['POST'])
 def delete_milestone():
     email = request.form.get('email')
     milestone_id = request.form.get('id')
-    logger.info(f"Delete milestone request for email: {email}, milestone ID: {milestone_id}")
+    logger.info("Delete milestone request for email: %s, milestone ID: %s", email, milestone_id)
     
     if not email or not milestone_id:
         logger.warning("Missing email or milestone ID in delete_milestone request")
@@ -817,7 +1369,7 @@ def delete_milestone():
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found"}), 404
@@ -831,65 +1383,67 @@ def delete_milestone():
         """, (milestone_id, user_id))
         
         if cursor.rowcount == 0:
-            logger.warning(f"Milestone not found or does not belong to user: milestone_id={milestone_id}, user_id={user_id}")
+            logger.warning("Milestone not found or does not belong to user: milestone_id=%s, user_id=%s", milestone_id, user_id)
             cursor.close()
             conn.close()
             return jsonify({"message": "Milestone not found or access denied"}), 404
         
         conn.commit()
-        logger.info(f"Milestone deleted successfully: ID={milestone_id}")
+        logger.info("Milestone deleted successfully: ID=%s", milestone_id)
         
         cursor.close()
         conn.close()
         
+        notify_profile_changed(email)
+        
         return jsonify({"message": "Milestone deleted successfully"})
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in delete_milestone: {err}")
+        logger.error("Database error in delete_milestone: %s", err)
         return jsonify({"message": "Database error", "error": str(err)}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in delete_milestone: {e}")
+        logger.error("Unexpected error in delete_milestone: %s", e)
         return jsonify({"message": "Server error", "error": str(e)}), 500
 
 # 📎 Serve attachment files
-@app.route('/attachments/<path:filename>')
+@routes.route('/attachments/<path:filename>')
 def serve_attachment(filename):
     # If it's a profile image
     if filename.startswith('profile_images/'):
         # Split the path into directory and filename
         directory, image_filename = os.path.split(filename)
-        logger.info(f"Serving profile image: {image_filename}")
+        logger.info("Serving profile image: %s", image_filename)
         return send_from_directory(PROFILE_IMAGES_FOLDER, image_filename)
     else:
         # Regular attachment
-        logger.info(f"Serving attachment: {filename}")
+        logger.info("Serving attachment: %s", filename)
         return send_from_directory(UPLOAD_FOLDER, filename)
 
 # 🧠 AI Resume Feedback - Alias for backward compatibility
-@app.route('/get_resume_feedback', methods=['POST'])
+@routes.route('/get_resume_feedback', methods=['POST'])
 def get_resume_feedback_alias():
     logger.info("Resume feedback request received through legacy endpoint")
     return api_resume_feedback()
 
 # 💡 AI Career Advice - Alias for backward compatibility
-@app.route('/get_career_advice', methods=['POST'])
+@routes.route('/get_career_advice', methods=['POST'])
 def get_career_advice_alias():
     logger.info("Career advice request received through legacy endpoint")
     return api_career_advice()
 
 # 🗺️ AI Detailed Roadmap - Alias for backward compatibility
-@app.route('/get_detailed_roadmap', methods=['POST'])
+@routes.route('/get_detailed_roadmap', methods=['POST'])
 def get_detailed_roadmap_alias():
     logger.info("Detailed roadmap request received through legacy endpoint")
     return api_detailed_roadmap()
 
 # 👤 Get User Profile
-@app.route('/api/user-profile', methods=['GET'])
+@routes.route('/api/user-profile', methods=['GET'])
 def get_user_profile():
     email = request.args.get('email')
-    logger.info(f"Get user profile request for email: {email}")
-    logger.debug(f"Profile request headers: {dict(request.headers)}")
-    logger.debug(f"Profile request args: {dict(request.args)}")
+    logger.info("Get user profile request for email: %s", email)
+    logger.debug("Profile request headers: %s", Payload(request.headers))
+    logger.debug("Profile request args: %s", Payload(request.args))
     
     if not email:
         logger.warning("Missing email in get_user_profile request")
@@ -904,7 +1458,7 @@ def get_user_profile():
         user_result = cursor.fetchone()
         
         if not user_result:
-            logger.warning(f"User not found for email: {email}")
+            logger.warning("User not found for email: %s", email)
             cursor.close()
             conn.close()
             return jsonify({"message": "User not found", "success": False}), 404
@@ -922,7 +1476,7 @@ def get_user_profile():
         
         if not profile:
             # Profile doesn't exist yet, create a basic one
-            logger.info(f"Profile not found for user {email}, creating basic profile")
+            logger.info("Profile not found for user %s, creating basic profile", email)
             
             current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
@@ -944,40 +1498,33 @@ def get_user_profile():
             profile = cursor.fetchone()
             
             if not profile:
-                logger.error(f"Failed to create basic profile for {email}")
+                logger.error("Failed to create basic profile for %s", email)
                 return jsonify({
                     "message": "Failed to create user profile", 
                     "success": False
                 }), 500
         
-        # Format date fields for JSON serialization
-        if profile['birthday'] and hasattr(profile['birthday'], 'strftime'):
-            profile['birthday'] = profile['birthday'].strftime('%Y-%m-%d')
-        if profile['created_at'] and hasattr(profile['created_at'], 'strftime'):
-            profile['created_at'] = profile['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-        if profile['updated_at'] and hasattr(profile['updated_at'], 'strftime'):
-            profile['updated_at'] = profile['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
-        
+        # Dates are formatted by the JSON provider (YYYY-MM-DD, YYYY-MM-DD HH:MM:SS)
         # Add success flag
         profile['success'] = True
         
         # Debug logging to help diagnose client issues
-        logger.debug(f"Response data (full profile): {profile}")
-        logger.info(f"Profile retrieved successfully for user {email}")
+        logger.debug("Response data (full profile): %s", Payload(profile))
+        logger.info("Profile retrieved successfully for user %s", email)
         cursor.close()
         conn.close()
         
         return jsonify(profile)
     
     except mysql.connector.Error as err:
-        logger.error(f"Database error in get_user_profile: {err}")
+        logger.error("Database error in get_user_profile: %s", err)
         return jsonify({"message": "Database error", "error": str(err), "success": False}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in get_user_profile: {e}")
+        logger.error("Unexpected error in get_user_profile: %s", e)
         return jsonify({"message": "Server error", "error": str(e), "success": False}), 500
 
 # 📧 Change Email
-@app.route('/api/change-email', methods=['POST'])
+@routes.route('/api/change-email', methods=['POST'])
 def change_email():
     try:
         # Get data from either JSON or form data
@@ -987,7 +1534,7 @@ def change_email():
         new_email = data.get('new_email')
         password = data.get('password')  # Require password for security
         
-        logger.info(f"Email change request for: {current_email} -> {new_email}")
+        logger.info("Email change request for: %s -> %s", current_email, new_email)
         
         if not all([current_email, new_email, password]):
             logger.warning("Missing required fields in change_email request")
@@ -1012,7 +1559,7 @@ def change_email():
             
             user = cursor.fetchone()
             if not user:
-                logger.warning(f"Password verification failed for {current_email}")
+                logger.warning("Password verification failed for %s", current_email)
                 conn.rollback()
                 return jsonify({
                     "message": "Current password is incorrect",
@@ -1022,7 +1569,7 @@ def change_email():
             # Check if new email is already in use
             cursor.execute("SELECT id FROM users WHERE email = %s", (new_email,))
             if cursor.fetchone():
-                logger.warning(f"New email {new_email} is already in use")
+                logger.warning("New email %s is already in use", new_email)
                 conn.rollback()
                 return jsonify({
                     "message": "New email is already in use",
@@ -1037,7 +1584,7 @@ def change_email():
             """, (new_email, current_email))
             
             if cursor.rowcount == 0:
-                logger.error(f"Failed to update email in users table")
+                logger.error("Failed to update email in users table")
                 conn.rollback()
                 return jsonify({
                     "message": "Failed to update email",
@@ -1052,7 +1599,7 @@ def change_email():
             """, (new_email, current_email))
             
             if cursor.rowcount == 0:
-                logger.error(f"Failed to update email in user_profiles table")
+                logger.error("Failed to update email in user_profiles table")
                 conn.rollback()
                 return jsonify({
                     "message": "Failed to update email",
@@ -1061,7 +1608,7 @@ def change_email():
             
             # Commit transaction
             conn.commit()
-            logger.info(f"Email updated successfully from {current_email} to {new_email}")
+            logger.info("Email updated successfully from %s to %s", current_email, new_email)
             
             return jsonify({
                 "message": "Email updated successfully",
@@ -1070,7 +1617,7 @@ def change_email():
             })
             
         except mysql.connector.Error as err:
-            logger.error(f"Database error in change_email: {err}")
+            logger.error("Database error in change_email: %s", err)
             if conn and conn.is_connected():
                 conn.rollback()
             return jsonify({"message": "Database error", "error": str(err), "success": False}), 500
@@ -1081,19 +1628,15 @@ def change_email():
                 conn.close()
                 
     except Exception as e:
-        logger.error(f"Unexpected error in change_email: {e}")
+        logger.error("Unexpected error in change_email: %s", e)
         return jsonify({"message": "Server error", "error": str(e), "success": False}), 500
 
 # Modify update_profile to remove email change functionality
-@app.route('/api/update-profile', methods=['POST'])
+@routes.route('/api/update-profile', methods=['POST'])
 def update_profile():
     try:
-        # Log incoming request data
-        request_data = {
-            "form": dict(request.form),
-            "headers": {key: value for key, value in request.headers.items() if key.lower() not in ['authorization', 'cookie']}
-        }
-        logger.debug(f"Raw update_profile request data: {request_data}")
+        # Log incoming request data (redacted, and only built if debug logging is on)
+        logger.debug("Raw update_profile request data: form=%s headers=%s", Payload(request.form), Payload(request.headers))
         
         # Get form data
         data = request.form
@@ -1122,7 +1665,7 @@ def update_profile():
                 "birthday": birthday,
                 "phone": phone
             }
-            logger.debug(f"Parsed update_profile data: {parsed_data}")
+            logger.debug("Parsed update_profile data: %s", Payload(parsed_data))
             
             # Validate birthday format if provided
             if birthday:
@@ -1148,7 +1691,7 @@ def update_profile():
                 user_result = cursor.fetchone()
                 
                 if not user_result:
-                    logger.warning(f"User not found for email: {email}")
+                    logger.warning("User not found for email: %s", email)
                     return jsonify({
                         "message": "User not found",
                         "success": False
@@ -1181,17 +1724,17 @@ def update_profile():
                         current_time
                     )
                     
-                    logger.debug(f"Executing INSERT query: {insert_query} with params: {insert_params}")
+                    logger.debug("Executing INSERT query: %s with params: %s", insert_query, Payload(insert_params))
                     cursor.execute(insert_query, insert_params)
                     
                     if cursor.rowcount == 0:
-                        logger.error(f"Failed to create profile for {email}")
+                        logger.error("Failed to create profile for %s", email)
                         return jsonify({
                             "message": "Failed to create profile",
                             "success": False
                         }), 500
                     
-                    logger.info(f"New profile created for user {email}")
+                    logger.info("New profile created for user %s", email)
                 else:
                     # Build dynamic update query based on provided fields
                     update_fields = []
@@ -1224,13 +1767,13 @@ def update_profile():
                             WHERE email = %s
                         """
                         
-                        logger.debug(f"Executing UPDATE query: {update_query} with params: {params}")
+                        logger.debug("Executing UPDATE query: %s with params: %s", update_query, Payload(params))
                         cursor.execute(update_query, params)
                         
                         if cursor.rowcount == 0:
-                            logger.warning(f"Profile update had no effect for {email}")
+                            logger.warning("Profile update had no effect for %s", email)
                         else:
-                            logger.info(f"Profile updated for user {email}")
+                            logger.info("Profile updated for user %s", email)
                         
                         # Commit the changes
                         conn.commit()
@@ -1246,21 +1789,13 @@ def update_profile():
                 updated_profile = cursor.fetchone()
                 
                 if not updated_profile:
-                    logger.error(f"Failed to retrieve updated profile for {email}")
+                    logger.error("Failed to retrieve updated profile for %s", email)
                     return jsonify({
                         "message": "Failed to retrieve updated profile",
                         "success": False
                     }), 500
                 
-                # Format date fields for JSON serialization
-                if updated_profile['birthday'] and hasattr(updated_profile['birthday'], 'strftime'):
-                    updated_profile['birthday'] = updated_profile['birthday'].strftime('%Y-%m-%d')
-                if updated_profile['created_at'] and hasattr(updated_profile['created_at'], 'strftime'):
-                    updated_profile['created_at'] = updated_profile['created_at'].strftime('%Y-%m-%d %H:%M:%S')
-                if updated_profile['updated_at'] and hasattr(updated_profile['updated_at'], 'strftime'):
-                    updated_profile['updated_at'] = updated_profile['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Prepare response data
+                # Prepare response data (the JSON provider formats the birthday as YYYY-MM-DD)
                 response_data = {
                     "name": updated_profile['name'] or "",
                     "bio": updated_profile['bio'] or "",
@@ -1271,11 +1806,13 @@ def update_profile():
                     "success": True
                 }
                 
-                logger.debug(f"Response data: {response_data}")
+                logger.debug("Response data: %s", Payload(response_data))
+                
+                notify_profile_changed(email)
                 return jsonify(response_data)
                 
             except mysql.connector.Error as err:
-                logger.error(f"Database error in update_profile: {err}")
+                logger.error("Database error in update_profile: %s", err)
                 if conn and conn.is_connected():
                     conn.rollback()
                 return jsonify({
@@ -1290,7 +1827,7 @@ def update_profile():
                     conn.close()
                     
         except Exception as e:
-            logger.error(f"Error parsing request data: {e}")
+            logger.error("Error parsing request data: %s", e)
             return jsonify({
                 "message": "Error processing request data",
                 "error": str(e),
@@ -1298,7 +1835,7 @@ def update_profile():
             }), 400
     
     except Exception as e:
-        logger.error(f"Unexpected error in update_profile: {e}")
+        logger.error("Unexpected error in update_profile: %s", e)
         return jsonify({
             "message": "Server error",
             "error": str(e),
@@ -1306,11 +1843,11 @@ def update_profile():
         }), 500
 
 # 🛠️ Debug Profile API
-@app.route('/api/debug-profile', methods=['GET'])
+@routes.route('/api/debug-profile', methods=['GET'])
 def debug_profile():
     """Debug endpoint to test profile API without database interaction"""
     email = request.args.get('email', 'test@example.com')
-    logger.info(f"Debug profile request for email: {email}")
+    logger.info("Debug profile request for email: %s", email)
     
     # Return a sample profile that matches the expected structure
     sample_profile = {
@@ -1331,19 +1868,19 @@ def debug_profile():
     }
     
     # Log the response for debugging
-    logger.debug(f"Debug profile response: {sample_profile}")
+    logger.debug("Debug profile response: %s", sample_profile)
     
     # Return the sample profile
     return jsonify(sample_profile)
 
 # 🔑 Change Password
-@app.route('/change-password', methods=['POST'])
+@routes.route('/change-password', methods=['POST'])
 def change_password():
     email = request.form.get('email')
     current_password = request.form.get('current_password')
     new_password = request.form.get('new_password')
     
-    logger.info(f"Password change request for email: {email}")
+    logger.info("Password change request for email: %s", email)
     
     # Validate inputs
     if not all([email, current_password, new_password]):
@@ -1367,7 +1904,7 @@ def change_password():
         user = cursor.fetchone()
         
         if not user:
-            logger.warning(f"Current password verification failed for {email}")
+            logger.warning("Current password verification failed for %s", email)
             conn.rollback()
             return jsonify({"message": "Current password is incorrect", "success": False}), 401
         
@@ -1383,23 +1920,23 @@ def change_password():
         
         # Check if the update was successful
         if cursor.rowcount == 0:
-            logger.error(f"No rows affected when updating password for {email}")
+            logger.error("No rows affected when updating password for %s", email)
             conn.rollback()
             return jsonify({"message": "Failed to update password", "success": False}), 500
         
         # Commit the transaction
         conn.commit()
         
-        logger.info(f"Password updated successfully for {email}")
+        logger.info("Password updated successfully for %s", email)
         return jsonify({"message": "Password updated successfully", "success": True})
         
     except mysql.connector.Error as err:
-        logger.error(f"Database error in change_password: {err}")
+        logger.error("Database error in change_password: %s", err)
         if 'conn' in locals() and conn.is_connected():
             conn.rollback()
         return jsonify({"message": "Database error", "error": str(err), "success": False}), 500
     except Exception as e:
-        logger.error(f"Unexpected error in change_password: {e}")
+        logger.error("Unexpected error in change_password: %s", e)
         if 'conn' in locals() and conn.is_connected():
             conn.rollback()
         return jsonify({"message": "Server error", "error": str(e), "success": False}), 500
@@ -1410,7 +1947,7 @@ def change_password():
             conn.close()
 
 # 🧪 Test Form Upload
-@app.route('/api/test-form-upload', methods=['POST'])
+@routes.route('/api/test-form-upload', methods=['POST'])
 def test_form_upload():
     """Test endpoint for diagnosing form upload issues"""
     try:
@@ -1440,11 +1977,11 @@ def test_form_upload():
                         "error": "No filename or empty file"
                     })
         
-        logger.info(f"Test form upload received: {len(response_data['form_data'])} form fields, {len(response_data['files'])} files")
+        logger.info("Test form upload received: %s form fields, %s files", len(response_data['form_data']), len(response_data['files']))
         return jsonify(response_data)
     
     except Exception as e:
-        logger.error(f"Error in test_form_upload: {e}")
+        logger.error("Error in test_form_upload: %s", e)
         return jsonify({
             "success": False,
             "message": "Error processing form data",
@@ -1452,7 +1989,7 @@ def test_form_upload():
         }), 500
 
 # 🧪 API Connection Test
-@app.route('/api/test-connection', methods=['GET', 'POST'])
+@routes.route('/api/test-connection', methods=['GET', 'POST'])
 def test_connection():
     """Simple endpoint to test API connectivity from the app"""
     response_data = {
@@ -1472,29 +2009,29 @@ def test_connection():
         response_data["form_data"] = dict(request.form)
         response_data["has_files"] = len(request.files) > 0
     
-    logger.info(f"Connection test hit: {request.method} request from {request.remote_addr}")
+    logger.info("Connection test hit: %s request from %s", request.method, request.remote_addr)
     return jsonify(response_data)
 
 # 👤 User Profile Endpoints - URL Aliases without /api/ prefix
-@app.route('/user-profile', methods=['GET'])
+@routes.route('/user-profile', methods=['GET'])
 def get_user_profile_alias():
     """Alias for the /api/user-profile endpoint"""
     logger.info("Request received at /user-profile alias")
     return get_user_profile()
 
-@app.route('/update-profile', methods=['POST'])
+@routes.route('/update-profile', methods=['POST'])
 def update_profile_alias():
     """Alias for the /api/update-profile endpoint"""
     logger.info("Request received at /update-profile alias")
     return update_profile()
 
 # 👤 Update Profile Image
-@app.route('/api/update-profile-image', methods=['POST'])
+@routes.route('/api/update-profile-image', methods=['POST'])
 def update_profile_image():
     try:
         # Get email from form data
         email = request.form.get('email')
-        logger.info(f"Update profile image request for email: {email}")
+        logger.info("Update profile image request for email: %s", email)
         
         if not email:
             logger.warning("Missing email in update_profile_image request")
@@ -1522,7 +2059,7 @@ def update_profile_image():
             user_result = cursor.fetchone()
             
             if not user_result:
-                logger.warning(f"User not found for email: {email}")
+                logger.warning("User not found for email: %s", email)
                 conn.rollback()
                 return jsonify({"message": "User not found", "success": False}), 404
             
@@ -1542,13 +2079,13 @@ def update_profile_image():
             """, (image_url, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), email))
             
             if cursor.rowcount == 0:
-                logger.warning(f"No profile found to update for {email}")
+                logger.warning("No profile found to update for %s", email)
                 conn.rollback()
                 return jsonify({"message": "Profile not found", "success": False}), 404
             
             # Commit the transaction
             conn.commit()
-            logger.info(f"Profile image updated successfully for {email}")
+            logger.info("Profile image updated successfully for %s", email)
             
             return jsonify({
                 "message": "Profile image updated successfully",
@@ -1557,7 +2094,7 @@ def update_profile_image():
             })
             
         except mysql.connector.Error as err:
-            logger.error(f"Database error in update_profile_image: {err}")
+            logger.error("Database error in update_profile_image: %s", err)
             if conn and conn.is_connected():
                 conn.rollback()
             return jsonify({"message": "Database error", "error": str(err), "success": False}), 500
@@ -1568,8 +2105,88 @@ def update_profile_image():
                 conn.close()
                 
     except Exception as e:
-        logger.error(f"Unexpected error in update_profile_image: {e}")
+        logger.error("Unexpected error in update_profile_image: %s", e)
         return jsonify({"message": "Server error", "error": str(e), "success": False}), 500
 
+def create_app(settings=None):
+    """
+    Build the Flask app. Nothing here opens connections or starts threads (the
+    log writer thread starts with the first record), so the app can be created
+    in a server's master process and forked (see wsgi.py and gunicorn.conf.py).
+    """
+    app = Flask(__name__)
+    if settings:
+        app.config.update(settings)
+    
+    structured_logging.configure()
+    app.json = FastJSONProvider(app)
+    app.before_request(start_request_logging)
+    app.before_request(start_request_timer)
+    app.teardown_request(end_request_logging)
+    if config.PROFILER:
+        # after_request hooks run in reverse order: registered first, the profile is finished
+        # after the metrics and compression hooks and covers them. With PROFILER off no hook
+        # is installed and requests pay nothing
+        app.before_request(start_request_profile)
+        app.teardown_request(stop_request_profile)
+        app.after_request(finish_request_profile)
+    # after_request hooks run in reverse order, so the timer also covers compression
+    app.after_request(record_request_metrics)
+    app.after_request(compress_after_request)
+    if config.MEMORY_RSS_CHECK_EVERY > 0:
+        app.teardown_request(count_request_memory)
+    
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    os.makedirs(PROFILE_IMAGES_FOLDER, exist_ok=True)
+    
+    app.register_blueprint(routes)
+    return app
+
+# Tag each request's log records with its route and decide whether its info logs are sampled
+def start_request_logging():
+    structured_logging.start_request(request.url_rule.rule if request.url_rule else request.path)
+
+def end_request_logging(error=None):
+    structured_logging.end_request()
+
+# Latency and status of every request, by Flask rule (see metrics.py)
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+# Negotiated gzip/brotli compression (see compression.py)
+def compress_after_request(response):
+    return compression.compress_response(response, request)
+
+# Count requests for the RSS growth alarm (see memory.py)
+def count_request_memory(error=None):
+    memory.record_request()
+
+# Profile a sampled request, or one asking for it with X-Profile and the admin token (see profiler.py)
+def start_request_profile():
+    mode = profiler.requested_mode(request.headers.get('X-Profile'))
+    if mode is not None and not has_admin_token():
+        mode = None
+    g.profile = profiler.start(request.url_rule.rule if request.url_rule else 'unmatched', mode)
+
+def finish_request_profile(response):
+    profile = g.get('profile')
+    if profile is not None and profile.finish(request.method, request.path, response.status_code):
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+def stop_request_profile(error=None):
+    # Requests that raised never reach finish_request_profile()
+    profile = g.get('profile')
+    if profile is not None:
+        profile.stop()
+
+# Development server only; production runs wsgi:app under gunicorn (see DEPLOYMENT.md)
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    create_app().run(host='0.0.0.0', port=5000, debug=True)
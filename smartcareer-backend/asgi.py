@@ -0,0 +1,269 @@
+"""
+ASGI entry point for SmartCareer with async AI endpoints
+
+    uvicorn asgi:app --workers 4
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+The blocking AI endpoints hold a worker thread for the whole model call, so a
+gthread worker serves at most GUNICORN_THREADS of them at a time. Here
+/api/resume-feedback, /api/career-advice and /api/detailed-roadmap (and their
+old /get_* aliases) are coroutines: the model call, the rate limiter, retry
+backoff and the MySQL queries (async_db.py) are awaited, and one worker can
+have hundreds of them waiting at once. GET /api/jobs/<job_id> long-polls
+here too, for up to AI_JOB_ASYNC_MAX_WAIT seconds instead of app.py's short
+AI_JOB_MAX_WAIT. Responses are the same as from app.py.
+
+Every other route is the Flask app from wsgi.py, run on the event loop's
+default thread pool.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+import config
+import ai_provider
+import ai_jobs
+import ai_precompute
+import async_db
+import compression
+import json_provider
+import memory
+import metrics
+import quota
+import structured_logging
+from deadline import Deadline
+from app import check_ai_quota, settle_ai_quota, quota_headers, ai_job_response
+from wsgi import app as flask_app
+
+logger = logging.getLogger('asgi')
+
+ASYNC_AI_ROUTES = {
+    '/api/resume-feedback': 'resume_feedback',
+    '/api/career-advice': 'career_advice',
+    '/api/detailed-roadmap': 'detailed_roadmap',
+    # Old paths the frontend still uses
+    '/get_resume_feedback': 'resume_feedback',
+    '/get_career_advice': 'career_advice',
+    '/get_detailed_roadmap': 'detailed_roadmap',
+}
+
+JOB_PATH_PREFIX = '/api/jobs/'
+JOB_ROUTE = '/api/jobs/<job_id>'
+
+TASK_LABELS = {
+    'resume_feedback': 'resume feedback',
+    'career_advice': 'career advice',
+    'detailed_roadmap': 'detailed roadmap',
+}
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI request on one shared thread unless told otherwise
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False)
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+wsgi_app = ThreadedWsgiToAsgi(flask_app)
+_handlers = None
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+async def send_json(send, data, status=200, headers=None, accept_encoding=None, cache=True):
+    body = json_provider.dumps_bytes(data)
+    headers = dict(headers or {})
+    if config.COMPRESSION:
+        # Successful AI responses repeat, so their compressed form is cached
+        body, encoding = compression.encode_body(body, accept_encoding, cached=cache and status == 200)
+        headers['Vary'] = 'Accept-Encoding'
+        if encoding is not None:
+            headers['Content-Encoding'] = encoding
+    raw_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    for name, value in headers.items():
+        raw_headers.append((name.lower().encode('latin-1'), value.encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+    return status
+
+async def get_handlers():
+    global _handlers
+    if _handlers is None:
+        # Loading a provider imports its SDK; keep that off the event loop
+        _handlers = await asyncio.to_thread(ai_provider.get_async_task_handlers)
+    return _handlers
+
+async def prepare_ai_user_data(user_data):
+    """app.prepare_ai_user_data() with the queries awaited"""
+    if 'internships' not in user_data or not user_data['internships']:
+        user_data['internships'] = await async_db.get_user_internships(user_data['email'])
+        logger.info("Retrieved %s internships from database", len(user_data['internships']))
+
+    if 'milestones' not in user_data or not user_data['milestones']:
+        user_data['milestones'] = await async_db.get_user_milestones(user_data['email'])
+        logger.info("Retrieved %s milestones from database", len(user_data['milestones']))
+
+    if 'skills' not in user_data:
+        user_data['skills'] = []
+
+    return user_data
+
+async def find_precomputed_result(task, user_data):
+    if not config.AI_PRECOMPUTE:
+        return None, None
+    try:
+        fingerprint = ai_precompute.profile_fingerprint(user_data)
+        result = await async_db.get_precomputed_result(user_data['email'], task, fingerprint)
+        metrics.count_cache('precomputed', result is not None)
+        return result, fingerprint
+    except Exception as e:
+        logger.error("Could not read precomputed %s: %s", task, e)
+        return None, None
+
+async def save_precomputed_result(task, user_data, fingerprint, result):
+    if fingerprint is None:
+        return
+    try:
+        await async_db.store_precomputed_result(user_data, task, fingerprint, result)
+    except Exception as e:
+        logger.error("Could not store precomputed %s: %s", task, e)
+
+async def generate_ai_result(task, user_data, deadline):
+    """app.generate_ai_result() for the async handlers"""
+    result, fingerprint = await find_precomputed_result(task, user_data)
+    if result is not None:
+        logger.info("Serving precomputed %s for %s", task, user_data.get('email'))
+        return result, check_ai_quota(task, user_data['email'], consume=False)
+
+    # The ledger counts in memory; it never touches MySQL on the request path
+    quota_status = check_ai_quota(task, user_data['email'])
+    meter = quota.start_metering()
+    try:
+        handlers = await get_handlers()
+        result = await handlers[task](user_data, deadline=deadline)
+    except Exception:
+        settle_ai_quota(task, user_data['email'], quota_status, meter, None)
+        raise
+    await save_precomputed_result(task, user_data, fingerprint, result)
+    return result, settle_ai_quota(task, user_data['email'], quota_status, meter, result)
+
+def header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def ai_endpoint(task, scope, receive, send):
+    label = TASK_LABELS[task]
+    accept_encoding = header(scope, b'accept-encoding')
+    try:
+        # The time budget covers the whole request, database lookups included
+        deadline = Deadline(config.AI_REQUEST_TIMEOUT)
+
+        body = await read_body(receive)
+        try:
+            user_data = json.loads(body) if body else None
+        except ValueError:
+            user_data = None
+
+        if not user_data or not isinstance(user_data, dict):
+            logger.warning("No data provided in %s request", label)
+            return await send_json(send, {"message": "No data provided"}, 400)
+
+        logger.info("%s request received for email: %s", label.capitalize(), user_data.get('email'))
+        if 'email' not in user_data:
+            logger.warning("No email provided in %s request", label)
+            return await send_json(send, {"message": "Email is required"}, 400)
+
+        await prepare_ai_user_data(user_data)
+        result, quota_status = await generate_ai_result(task, user_data, deadline)
+        logger.info("%s generated successfully for %s", label.capitalize(), user_data.get('email'))
+        return await send_json(send, result, 200, quota_headers(quota_status), accept_encoding)
+
+    except quota.QuotaExceeded as e:
+        logger.warning(str(e))
+        headers = quota_headers(e.status)
+        headers['Retry-After'] = str(e.status['reset_seconds'])
+        return await send_json(send, {"message": "Daily AI quota exceeded", "quota": e.status}, 429, headers)
+    except Exception as e:
+        logger.error("Error in async %s endpoint: %s", label, e)
+        return await send_json(send, {"message": "Server error", "error": str(e)}, 500)
+
+async def job_endpoint(job_id, scope, send):
+    """app.get_ai_job() with the waits awaited, so a long-poll holds no thread"""
+    accept_encoding = header(scope, b'accept-encoding')
+    try:
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        try:
+            wait = float(query.get('wait', ['0'])[0])
+        except ValueError:
+            wait = 0.0
+        wait = min(max(wait, 0), config.AI_JOB_ASYNC_MAX_WAIT)
+
+        deadline = time.time() + wait
+        job = await async_db.get_job(job_id)
+        while job and job['status'] not in ai_jobs.TERMINAL_STATUSES and time.time() < deadline:
+            await asyncio.sleep(min(config.AI_JOB_POLL_INTERVAL, max(deadline - time.time(), 0)))
+            job = await async_db.get_job(job_id)
+
+        body, status = ai_job_response(job_id, job)
+        # A job's body is read by one client; not worth a place in the compressed cache
+        return await send_json(send, body, status, accept_encoding=accept_encoding, cache=False)
+    except Exception as e:
+        logger.error("Unexpected error in async get_ai_job: %s", e)
+        return await send_json(send, {"message": "Server error", "error": str(e)}, 500)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await get_handlers()
+                logger.info("Async AI endpoints ready (provider %s)", config.AI_PROVIDER)
+            except Exception as e:
+                # Same as the WSGI app: the AI endpoints report the error when called
+                logger.error("Could not load AI provider %s: %s", config.AI_PROVIDER, e)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_db.close_pool()
+            await asyncio.to_thread(quota.ledger.close)
+            metrics.shutdown()
+            structured_logging.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    task = ASYNC_AI_ROUTES.get(scope.get('path')) if scope['type'] == 'http' else None
+    if task is not None and scope['method'] == 'POST':
+        # Each request runs in its own task, so the logging context doesn't leak between requests
+        structured_logging.start_request(scope['path'])
+        started = time.perf_counter()
+        status = await ai_endpoint(task, scope, receive, send)
+        metrics.observe_request(scope['path'], 'POST', status, time.perf_counter() - started)
+        if config.MEMORY_RSS_CHECK_EVERY > 0:
+            memory.record_request()
+        return
+
+    path = scope.get('path', '') if scope['type'] == 'http' else ''
+    job_id = path[len(JOB_PATH_PREFIX):] if path.startswith(JOB_PATH_PREFIX) else ''
+    if job_id and '/' not in job_id and scope['method'] == 'GET':
+        structured_logging.start_request(JOB_ROUTE)
+        started = time.perf_counter()
+        status = await job_endpoint(job_id, scope, send)
+        metrics.observe_request(JOB_ROUTE, 'GET', status, time.perf_counter() - started)
+        if config.MEMORY_RSS_CHECK_EVERY > 0:
+            memory.record_request()
+        return
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,139 @@
+"""
+Asyncio MySQL access for the async AI endpoints (asgi.py)
+
+The queries the AI endpoints need (the user's internships and milestones, the
+precomputed results, and AI jobs for long-polls) run on an aiomysql connection pool, so a worker waits
+on MySQL without tying up a thread. The pool is created on first use inside
+the worker's event loop and closed at shutdown. Results have the same shape as
+the blocking helpers in app.py and ai_precompute.py.
+"""
+
+import asyncio
+import json
+import logging
+import aiomysql
+import config
+import ai_jobs
+import ai_precompute
+from prompt_builder import get_skills
+
+logger = logging.getLogger('async_db')
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aiomysql.create_pool(
+                    host=config.DB_CONFIG['host'],
+                    port=config.DB_CONFIG['port'],
+                    user=config.DB_CONFIG['user'],
+                    password=config.DB_CONFIG['password'],
+                    db=config.DB_CONFIG['database'],
+                    minsize=config.AI_ASYNC_DB_POOL_MIN,
+                    maxsize=config.AI_ASYNC_DB_POOL_MAX,
+                    autocommit=True
+                )
+                logger.info("Async MySQL pool created (max %s connections)", config.AI_ASYNC_DB_POOL_MAX)
+    return _pool
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+def pool_stats():
+    """Size of this worker's pool for /metrics, or None before it is created"""
+    if _pool is None:
+        return None
+    return {"size": _pool.size, "free": _pool.freesize, "max": _pool.maxsize}
+
+async def fetch_all(sql, params=()):
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+async def get_user_internships(email):
+    """Same rows as app.get_user_internships"""
+    try:
+        internships = await fetch_all("""
+            SELECT i.id, i.company, i.role, i.dates, i.description, i.filename
+            FROM internships i
+            JOIN users u ON u.id = i.user_id
+            WHERE u.email = %s
+        """, (email,))
+    except Exception as e:
+        logger.error("Error retrieving internships from database: %s", e)
+        return []
+    
+    for internship in internships:
+        internship['id'] = str(internship['id'])
+    return list(internships)
+
+async def get_user_milestones(email):
+    """Same rows as app.get_user_milestones"""
+    try:
+        milestones = await fetch_all("""
+            SELECT m.id, m.title, m.date, m.description, m.filename
+            FROM milestones m
+            JOIN users u ON u.id = m.user_id
+            WHERE u.email = %s
+        """, (email,))
+    except Exception as e:
+        logger.error("Error retrieving milestones from database: %s", e)
+        return []
+    
+    for milestone in milestones:
+        milestone['id'] = str(milestone['id'])
+        if hasattr(milestone['date'], 'strftime'):
+            milestone['date'] = milestone['date'].strftime('%Y-%m-%d')
+    return list(milestones)
+
+async def get_precomputed_result(email, task, fingerprint, max_age=None):
+    """ai_precompute.get_result() on the pool"""
+    max_age = config.AI_PRECOMPUTE_MAX_AGE if max_age is None else max_age
+    rows = await fetch_all("""
+        SELECT result
+        FROM ai_precomputed_results
+        WHERE email = %s AND task = %s AND fingerprint = %s
+          AND created_at > NOW() - INTERVAL %s SECOND
+    """, (email, task, fingerprint, max_age))
+    return json.loads(rows[0]['result']) if rows else None
+
+async def get_job(job_id):
+    """ai_jobs.get_job() on the pool"""
+    rows = await fetch_all(ai_jobs.GET_JOB_SQL, (job_id,))
+    return ai_jobs.decode_job(rows[0] if rows else None)
+
+async def store_precomputed_result(user_data, task, fingerprint, result):
+    """ai_precompute.store_result() on the pool"""
+    if ai_precompute.is_fallback(task, result):
+        return False
+    
+    email = user_data['email']
+    pool = await get_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await conn.begin()
+            await cursor.execute("""
+                INSERT INTO ai_precomputed_results (email, task, fingerprint, result, created_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                    fingerprint = VALUES(fingerprint),
+                    result = VALUES(result),
+                    created_at = NOW()
+            """, (email, task, fingerprint, json.dumps(result)))
+            await cursor.execute("""
+                INSERT INTO ai_profile_state (email, fingerprint, skills, changed_at, updated_at)
+                VALUES (%s, %s, %s, NOW(), NOW())
+                ON DUPLICATE KEY UPDATE skills = VALUES(skills), updated_at = NOW()
+            """, (email, fingerprint, json.dumps(get_skills(user_data))))
+            await conn.commit()
+    return True
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+JSON Response Benchmark for SmartCareer
+
+Times the /get_milestones response path on synthetic rows, without MySQL:
+  legacy   build a dict per row, strftime the date, Flask's default jsonify
+  stdlib   rows as the query returns them, FastJSONProvider on the standard library
+  orjson   rows as the query returns them, FastJSONProvider on orjson
+  stream   rows fetched in batches and streamed as a JSON array (orjson if installed)
+For each size it reports the median time per response, the time to the first
+byte and the peak memory allocated while building the response, and checks
+that every path produces the same JSON as the legacy one.
+
+Usage:
+  python bench_json.py                       # 1,000 and 10,000 rows
+  python bench_json.py --rows 1000 100000 --repeat 5 --report bench_json.json
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from flask import Flask, jsonify
+from mysql.connector import FieldType
+import config
+import json_provider
+
+logging.basicConfig(
+    level=logging.INFO,
+    format=config.LOG_FORMAT,
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('bench_json')
+
+class ListCursor:
+    """Stand-in for an unbuffered dictionary cursor"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._position = 0
+        # (name, type_code, ...) like mysql.connector's cursor.description
+        self.description = [(name, FieldType.DATE if name == 'date' else FieldType.VAR_STRING)
+                            for name in (rows[0] if rows else {})]
+
+    def fetchall(self):
+        rows, self._position = self._rows[self._position:], len(self._rows)
+        return rows
+
+    def fetchmany(self, size):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def close(self):
+        pass
+
+def make_rows(count, seed):
+    """Rows as the old query returned them (int id, NULL columns) and as the new one does"""
+    rng = random.Random(seed)
+    start = datetime.date(2018, 1, 1)
+    legacy_rows, rows = [], []
+    for i in range(count):
+        description = None if rng.random() < 0.2 else f"Milestone {i}: " + "delivered a project " * rng.randint(1, 8)
+        filename = None if rng.random() < 0.5 else f"{i}_certificate.pdf"
+        row = {
+            "id": i + 1,
+            "title": f"Milestone title {i}",
+            "date": start + datetime.timedelta(days=rng.randint(0, 2500)),
+            "description": description,
+            "filename": filename,
+        }
+        legacy_rows.append(row)
+        rows.append(dict(row, id=str(row['id']), description=description or "", filename=filename or ""))
+    return legacy_rows, rows
+
+def legacy_response(app, rows):
+    with app.app_context():
+        milestone_list = []
+        for milestone in ListCursor(rows).fetchall():
+            milestone_list.append({
+                "id": str(milestone['id']),
+                "title": milestone['title'],
+                "date": milestone['date'].strftime('%Y-%m-%d') if hasattr(milestone['date'], 'strftime') else milestone['date'],
+                "description": milestone['description'] if milestone['description'] else "",
+                "filename": milestone['filename'] if milestone['filename'] else ""
+            })
+        return jsonify(milestone_list).get_data()
+
+def provider_response(app, rows):
+    with app.app_context():
+        return jsonify(ListCursor(rows).fetchall()).get_data()
+
+def stream_response(rows, first_byte=None):
+    chunks = []
+    for chunk in json_provider.iter_json_array(ListCursor(rows)):
+        if first_byte is not None and not chunks:
+            first_byte.append(time.perf_counter())
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def drain_stream(rows):
+    """Like a server writing the chunks out: only one chunk is alive at a time"""
+    size = 0
+    for chunk in json_provider.iter_json_array(ListCursor(rows)):
+        size += len(chunk)
+    return size
+
+def measure(build, repeat, build_for_memory=None):
+    """(median seconds, median seconds to first byte, peak bytes, body)"""
+    timings, first_bytes = [], []
+    body = None
+    for _ in range(repeat):
+        first_byte = []
+        started = time.perf_counter()
+        body = build(first_byte)
+        finished = time.perf_counter()
+        timings.append(finished - started)
+        first_bytes.append((first_byte[0] if first_byte else finished) - started)
+    tracemalloc.start()
+    (build_for_memory or build)([])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), statistics.median(first_bytes), peak, body
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response serialization")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000], help="Row counts to test")
+    parser.add_argument('--repeat', type=int, default=20, help="Timed runs per path and size")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    legacy_app = Flask('bench_legacy')
+    stdlib_app = Flask('bench_stdlib')
+    stdlib_app.json = json_provider.FastJSONProvider(stdlib_app)
+    stdlib_app.json.fast = False
+    fast_app = Flask('bench_orjson')
+    fast_app.json = json_provider.FastJSONProvider(fast_app)
+    if not fast_app.json.fast:
+        logger.warning("orjson is not installed; the orjson and stream paths use the standard library")
+
+    results = []
+    for count in args.rows:
+        legacy_rows, rows = make_rows(count, args.seed)
+        paths = {
+            'legacy': lambda first_byte: legacy_response(legacy_app, legacy_rows),
+            'stdlib': lambda first_byte: provider_response(stdlib_app, rows),
+            'orjson': lambda first_byte: provider_response(fast_app, rows),
+            'stream': lambda first_byte: stream_response(rows, first_byte),
+        }
+        expected = None
+        for name, build in paths.items():
+            seconds, first_byte, peak, body = measure(
+                build, args.repeat, (lambda first_byte: drain_stream(rows)) if name == 'stream' else None
+            )
+            decoded = json.loads(body)
+            if expected is None:
+                expected = decoded
+            elif decoded != expected:
+                raise AssertionError(f"{name} output differs from the legacy output for {count} rows")
+            results.append({
+                "rows": count,
+                "path": name,
+                "median_ms": round(seconds * 1000, 2),
+                "first_byte_ms": round(first_byte * 1000, 2),
+                "peak_kib": round(peak / 1024, 1),
+                "bytes": len(body),
+            })
+            logger.info("%s rows, %s: %.2f ms", count, name, seconds * 1000)
+
+    print(f"{'rows':>7}  {'path':<7} {'median ms':>10} {'first byte ms':>14} {'peak KiB':>10} {'speedup':>8}")
+    for result in results:
+        baseline = next(r for r in results if r['rows'] == result['rows'] and r['path'] == 'legacy')
+        speedup = baseline['median_ms'] / result['median_ms'] if result['median_ms'] else 0.0
+        print(f"{result['rows']:>7}  {result['path']:<7} {result['median_ms']:>10.2f} "
+              f"{result['first_byte_ms']:>14.2f} {result['peak_kib']:>10.1f} {speedup:>7.1f}x")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"repeat": args.repeat, "results": results}, f, indent=2)
+        logger.info("Report written to %s", args.report)
+
+if __name__ == "__main__":
+    main()
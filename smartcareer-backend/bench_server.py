@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Server Configuration Benchmark for SmartCareer
+
+Starts gunicorn (gunicorn.conf.py) once per configuration against
+the mock AI provider, sends the same request mix to each and reports
+throughput and p50/p95/p99 latency per route. The AI requests carry their
+internships and milestones and quotas and precomputation are off, so no MySQL
+server is needed; every request uses a different profile, so every AI
+request reaches the (mock) model.
+
+A configuration is WORKER_CLASS:WORKERS[xTHREADS], where THREADS is the
+thread count for gthread and the connection limit for gevent. The uvicorn
+class serves asgi:app, with the async AI endpoints, on uvicorn workers; the
+others serve wsgi:app.
+
+Usage:
+  python bench_server.py                                      # sync:4, gthread:4x16, gevent:4x500 and uvicorn:4 (if installed)
+  python bench_server.py --configs sync:9 gthread:2x32 --requests 600 --concurrency 200
+  python bench_server.py --configs gthread:4x16 uvicorn:4 --requests 2000 --concurrency 400
+  AI_MOCK_LATENCY_MEDIAN=3 python bench_server.py --report bench.json
+
+Note: gunicorn must be installed (pip install gunicorn, plus gevent for the
+gevent worker class and uvicorn, asgiref and aiomysql for the uvicorn class).
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import config
+from precompute_all import percentile
+
+logging.basicConfig(
+    level=logging.INFO,
+    format=config.LOG_FORMAT,
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('bench_server')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+AI_ROUTES = {
+    '/api/resume-feedback': 'resume_feedback',
+    '/api/career-advice': 'career_advice',
+    '/api/detailed-roadmap': 'detailed_roadmap',
+}
+LIGHT_ROUTE = '/api/test-connection'
+
+WORKER_CLASSES = {
+    'sync': ('sync', 'wsgi:app'),
+    'gthread': ('gthread', 'wsgi:app'),
+    'gevent': ('gevent', 'wsgi:app'),
+    'uvicorn': ('uvicorn.workers.UvicornWorker', 'asgi:app'),
+}
+
+def parse_config(spec):
+    """'gthread:4x16' -> ('gthread', 4, 16)"""
+    worker_class, _, size = spec.partition(':')
+    workers, _, threads = (size or '4').partition('x')
+    if worker_class not in WORKER_CLASSES:
+        raise ValueError(f"Unknown worker class in {spec}")
+    return worker_class, int(workers), int(threads) if threads else None
+
+def default_configs():
+    configs = ['sync:4', 'gthread:4x16']
+    try:
+        import gevent  # noqa: F401
+        configs.append('gevent:4x500')
+    except ImportError:
+        logger.info("gevent is not installed, skipping the gevent configuration")
+    try:
+        import uvicorn  # noqa: F401
+        configs.append('uvicorn:4')
+    except ImportError:
+        logger.info("uvicorn is not installed, skipping the uvicorn configuration")
+    return configs
+
+def server_env(worker_class, workers, threads, port):
+    env = dict(os.environ)
+    env.update({
+        'GUNICORN_BIND': f"127.0.0.1:{port}",
+        'GUNICORN_WORKER_CLASS': WORKER_CLASSES[worker_class][0],
+        'GUNICORN_WORKERS': str(workers),
+        'AI_PROVIDER': 'mock',
+        'AI_QUOTA': 'false',
+        'AI_PRECOMPUTE': 'false',
+        # Measure the server, not the rate limiter or the similarity cache
+        'MAX_REQUESTS_PER_MINUTE': '1000000',
+        'AI_USER_REQUESTS_PER_MINUTE': '0',
+        'AI_SIMILARITY_CACHE': 'false',
+    })
+    if threads:
+        env['GUNICORN_THREADS' if worker_class == 'gthread' else 'GUNICORN_WORKER_CONNECTIONS'] = str(threads)
+    return env
+
+def start_server(spec, port, log_file):
+    worker_class, workers, threads = parse_config(spec)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', WORKER_CLASSES[worker_class][1]],
+        cwd=BASE_DIR,
+        env=server_env(worker_class, workers, threads, port),
+        stdout=log_file,
+        stderr=subprocess.STDOUT
+    )
+    url = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    while time.monotonic() - started < 60:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {process.returncode} (see {log_file.name})")
+        try:
+            if requests.get(url + LIGHT_ROUTE, timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not answer within 60s (see {log_file.name})")
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=config.GUNICORN_GRACEFUL_TIMEOUT + 5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def build_requests(count, ai_share, seed):
+    """The request mix: (method, route, payload), the same for every configuration"""
+    rng = random.Random(seed)
+    mix = []
+    for i in range(count):
+        if rng.random() >= ai_share:
+            mix.append(('GET', LIGHT_ROUTE, None))
+            continue
+        route = rng.choice(list(AI_ROUTES))
+        mix.append(('POST', route, {
+            "email": f"bench{i}@example.com",
+            "skills": f"Python, SQL, skill{i}",
+            "internships": [{"company": f"Company {i % 50}", "role": "Software Intern",
+                             "dates": "2024", "description": "Built internal tools"}],
+            "milestones": [{"title": "Hackathon winner", "date": "2024-05-01", "description": "First place"}]
+        }))
+    return mix
+
+def run_load(url, mix, concurrency):
+    """Send the mix with `concurrency` clients; returns per-route latencies and outcomes"""
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def send(entry):
+        method, route, payload = entry
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.monotonic()
+        outcome = 'ok'
+        try:
+            response = session.request(method, url + route, json=payload, timeout=120)
+            if response.status_code != 200:
+                outcome = f"http_{response.status_code}"
+            elif route in AI_ROUTES and response.json() == config.FALLBACK_RESPONSES[AI_ROUTES[route]]:
+                outcome = 'fallback'
+        except requests.RequestException:
+            outcome = 'error'
+        with results_lock:
+            results.append((route, time.monotonic() - started, outcome))
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, mix))
+    return results, time.monotonic() - started
+
+def summarize(spec, results, elapsed):
+    routes = {}
+    for route in sorted({route for route, _, _ in results}):
+        latencies = sorted(seconds for r, seconds, _ in results if r == route)
+        outcomes = {}
+        for r, _, outcome in results:
+            if r == route:
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        routes[route] = {
+            "requests": len(latencies),
+            "outcomes": outcomes,
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+        }
+    return {
+        "config": spec,
+        "elapsed_seconds": round(elapsed, 2),
+        "requests_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "routes": routes,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gunicorn configurations against the mock AI provider")
+    parser.add_argument('--configs', nargs='+', help="WORKER_CLASS:WORKERS[xTHREADS] (default: sync, gthread, gevent and uvicorn)")
+    parser.add_argument('--requests', type=int, default=300, help="Requests sent to each configuration")
+    parser.add_argument('--concurrency', type=int, default=64, help="Concurrent clients")
+    parser.add_argument('--ai-share', type=float, default=0.8, help="Share of requests going to the AI endpoints")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    configs = args.configs or default_configs()
+    for spec in configs:
+        parse_config(spec)
+    mix = build_requests(args.requests, args.ai_share, args.seed)
+
+    summaries = []
+    for spec in configs:
+        log_path = os.path.join(BASE_DIR, f"bench_{spec.replace(':', '_')}.log")
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            logger.info(f"Starting gunicorn with {spec} (log: {log_path})")
+            process, url = start_server(spec, args.port, log_file)
+            try:
+                results, elapsed = run_load(url, mix, args.concurrency)
+            finally:
+                stop_server(process)
+        summary = summarize(spec, results, elapsed)
+        logger.info(f"{spec}: {summary['requests_per_second']} requests/s")
+        summaries.append(summary)
+
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "ai_share": args.ai_share,
+        "mock_latency_median": float(os.getenv('AI_MOCK_LATENCY_MEDIAN', config.AI_MOCK_LATENCY_MEDIAN)),
+        "results": summaries,
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
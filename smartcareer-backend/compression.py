@@ -0,0 +1,256 @@
+"""
+Negotiated response compression
+
+Responses are compressed with brotli (if the brotli package is installed) or
+gzip, whichever the client's Accept-Encoding prefers, once they are at least
+COMPRESSION_MIN_SIZE bytes. Streamed JSON arrays (the list endpoints) are
+compressed chunk by chunk, so they keep streaming. Server-sent events are never
+compressed: a compressor would hold events back until it had enough bytes.
+
+AI responses are the same few bodies sent again and again from the caches,
+so their compressed form is kept in an LRU cache keyed by a digest of the
+body (COMPRESSION_CACHE_BYTES). A repeat sends the stored bytes without
+compressing anything. These entries are compressed once, so they use the
+higher COMPRESSION_CACHED_*_LEVEL settings.
+
+Bytes saved, CPU time spent compressing and cache hits are counted in
+stats().
+"""
+
+import gzip
+import hashlib
+import logging
+import threading
+import time
+import zlib
+from cachetools import LRUCache
+import config
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used instead
+    brotli = None
+
+logger = logging.getLogger('compression')
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/plain', 'text/html', 'text/css', 'application/javascript'}
+
+# Flask rules (and asgi.py paths) whose bodies are worth keeping compressed
+PRECOMPRESSED_ROUTES = {
+    '/api/resume-feedback',
+    '/api/career-advice',
+    '/api/detailed-roadmap',
+    '/get_resume_feedback',
+    '/get_career_advice',
+    '/get_detailed_roadmap',
+    '/api/jobs/<job_id>',
+}
+
+def supported_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def choose_encoding(accept_encoding):
+    """The encoding to use for an Accept-Encoding header, or None"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip()] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in supported_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        # On a tie brotli wins, since it compresses JSON better
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def compress(data, encoding, level=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config.COMPRESSION_BROTLI_LEVEL if level is None else level)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(data, compresslevel=config.COMPRESSION_GZIP_LEVEL if level is None else level, mtime=0)
+
+class CompressionStats:
+    """Counters for stats() and /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.responses = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.cpu_seconds = 0.0
+            self.cache_hits = 0
+            self.cache_misses = 0
+            self.skipped = {}
+
+    def record(self, encoding, bytes_in, bytes_out, cpu_seconds=0.0):
+        with self._lock:
+            self.responses[encoding] = self.responses.get(encoding, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.cpu_seconds += cpu_seconds
+
+    def skip(self, reason):
+        with self._lock:
+            self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def cache_result(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.cache_hits + self.cache_misses
+            return {
+                "responses": dict(self.responses),
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+                "cpu_seconds": round(self.cpu_seconds, 4),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                "cache_hit_ratio": round(self.cache_hits / lookups, 3) if lookups else None,
+                "skipped": dict(self.skipped)
+            }
+
+metrics = CompressionStats()
+
+_cache = LRUCache(maxsize=config.COMPRESSION_CACHE_BYTES, getsizeof=len)
+_cache_lock = threading.Lock()
+
+def _compress_timed(data, encoding, level=None):
+    started = time.thread_time()
+    compressed = compress(data, encoding, level)
+    return compressed, time.thread_time() - started
+
+def _compress_cached(body, encoding):
+    key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+    with _cache_lock:
+        compressed = _cache.get(key)
+    if compressed is not None:
+        metrics.cache_result(True)
+        metrics.record(encoding, len(body), len(compressed))
+        return compressed
+
+    metrics.cache_result(False)
+    level = config.COMPRESSION_CACHED_BROTLI_LEVEL if encoding == 'br' else config.COMPRESSION_CACHED_GZIP_LEVEL
+    compressed, cpu_seconds = _compress_timed(body, encoding, level)
+    metrics.record(encoding, len(body), len(compressed), cpu_seconds)
+    if len(compressed) <= config.COMPRESSION_CACHE_BYTES:
+        with _cache_lock:
+            _cache[key] = compressed
+    return compressed
+
+def encode_body(body, accept_encoding, cached=False):
+    """
+    Compress a complete response body if it is worth it and the client accepts it.
+    Returns (body, encoding); encoding is None when the body was left as it was.
+    """
+    if len(body) < config.COMPRESSION_MIN_SIZE:
+        metrics.skip('too_small')
+        return body, None
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        metrics.skip('not_accepted')
+        return body, None
+
+    if cached and config.COMPRESSION_CACHE_BYTES:
+        compressed = _compress_cached(body, encoding)
+    else:
+        compressed, cpu_seconds = _compress_timed(body, encoding)
+        metrics.record(encoding, len(body), len(compressed), cpu_seconds)
+    if len(compressed) >= len(body):
+        metrics.skip('incompressible')
+        return body, None
+    return compressed, encoding
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of byte chunks as they come, flushing after each one"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config.COMPRESSION_BROTLI_LEVEL)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+    bytes_in = bytes_out = 0
+    cpu_seconds = 0.0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            started = time.thread_time()
+            out = process(chunk) + flush()
+            cpu_seconds += time.thread_time() - started
+            bytes_in += len(chunk)
+            bytes_out += len(out)
+            yield out
+        out = finish()
+        bytes_out += len(out)
+        yield out
+    finally:
+        metrics.record(encoding, bytes_in, bytes_out, cpu_seconds)
+
+def compress_response(response, request):
+    """Flask after_request hook: compress the response for this request if it is worth it"""
+    if not config.COMPRESSION:
+        return response
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    accept_encoding = request.headers.get('Accept-Encoding', '')
+
+    if response.is_streamed:
+        # Streamed JSON arrays; event streams have a different mimetype and never get here
+        if response.direct_passthrough:
+            return response
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            metrics.skip('not_accepted')
+            return response
+        response.response = compress_stream(response.iter_encoded(), encoding)
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Content-Length', None)
+        return response
+
+    rule = request.url_rule.rule if request.url_rule else None
+    # Error, 429 and job-pending bodies differ on every request; caching them would only evict AI answers
+    cached = response.status_code == 200 and rule in PRECOMPRESSED_ROUTES
+    body, encoding = encode_body(response.get_data(), accept_encoding, cached=cached)
+    if encoding is not None:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+def cache_stats():
+    with _cache_lock:
+        return {"entries": len(_cache), "bytes": _cache.currsize, "max_bytes": _cache.maxsize}
+
+def stats():
+    status = metrics.as_dict()
+    status.update({
+        "enabled": config.COMPRESSION,
+        "encodings": list(supported_encodings()),
+        "min_size": config.COMPRESSION_MIN_SIZE,
+        "cache": cache_stats()
+    })
+    return status
@@ -12,18 +12,106 @@ GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'models/gemini-1.5-flash-8b')
 CACHE_TIMEOUT = int(os.getenv('CACHE_TIMEOUT', 86400))  # 24 hours in seconds
 MAX_REQUESTS_PER_MINUTE = int(os.getenv('MAX_REQUESTS_PER_MINUTE', 60))
 
-# MySQL DB config (same as in app.py)
+# MySQL DB config (used by app.py and every other module)
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
+    'port': int(os.getenv('DB_PORT', 3306)),
     'user': os.getenv('DB_USER', 'root'),
     'password': os.getenv('DB_PASSWORD', ''),
     'database': os.getenv('DB_NAME', 'smartcareer_db')
 }
 
+# Uploads (attachments and profile images)
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', 'uploads')
+
 # AI Service Configuration
-MAX_REQUESTS_PER_MINUTE = 60  # Maximum number of requests per minute
+MAX_REQUESTS_PER_MINUTE = int(os.getenv('MAX_REQUESTS_PER_MINUTE', 60))  # Maximum number of requests per minute
+AI_USER_REQUESTS_PER_MINUTE = int(os.getenv('AI_USER_REQUESTS_PER_MINUTE', 10))  # Per-user share of the limit (0 disables)
+AI_RATE_LIMIT_MAX_QUEUE = int(os.getenv('AI_RATE_LIMIT_MAX_QUEUE', 20))  # Callers allowed to wait for a token at once
+AI_RATE_LIMIT_MAX_WAIT = float(os.getenv('AI_RATE_LIMIT_MAX_WAIT', 5))  # Longest a caller waits for a token (seconds)
 CACHE_TIMEOUT = 3600  # Cache timeout in seconds (1 hour)
 MAX_CACHE_SIZE = 1000  # Maximum number of cached responses
+AI_PERSISTENT_CACHE = os.getenv('AI_PERSISTENT_CACHE', 'false').lower() == 'true'  # Share cached responses across processes via MySQL
+AI_CROSS_PROCESS_LOCK_TIMEOUT = int(os.getenv('AI_CROSS_PROCESS_LOCK_TIMEOUT', 30))  # Seconds to wait for another process computing the same response
+AI_NEGATIVE_CACHE_TTL = float(os.getenv('AI_NEGATIVE_CACHE_TTL', 30))  # Seconds a failed prompt is answered with the fallback without retrying (0 disables)
+
+# AI Job Queue Configuration
+AI_JOB_VISIBILITY_TIMEOUT = int(os.getenv('AI_JOB_VISIBILITY_TIMEOUT', 120))  # Seconds a claimed job stays hidden from other workers
+AI_JOB_MAX_ATTEMPTS = int(os.getenv('AI_JOB_MAX_ATTEMPTS', 3))  # Attempts before a job is marked failed
+AI_JOB_RESULT_TTL = int(os.getenv('AI_JOB_RESULT_TTL', 3600))  # Seconds a finished job stays readable
+AI_JOB_MAX_WAIT = float(os.getenv('AI_JOB_MAX_WAIT', 2))  # Longest long-poll wait of GET /api/jobs/<id> in app.py; it holds a worker thread
+AI_JOB_ASYNC_MAX_WAIT = float(os.getenv('AI_JOB_ASYNC_MAX_WAIT', 25))  # Longest long-poll wait of GET /api/jobs/<id> in asgi.py, where waiting is awaited
+AI_JOB_POLL_INTERVAL = float(os.getenv('AI_JOB_POLL_INTERVAL', 0.5))  # Seconds between reads while long-polling
+AI_WORKER_CONCURRENCY = int(os.getenv('AI_WORKER_CONCURRENCY', 4))  # Jobs processed in parallel per worker process
+AI_WORKER_IDLE_SLEEP = float(os.getenv('AI_WORKER_IDLE_SLEEP', 1.0))  # Seconds a worker thread sleeps when the queue is empty
+AI_WORKER_PURGE_INTERVAL = int(os.getenv('AI_WORKER_PURGE_INTERVAL', 300))  # Seconds between expired job cleanups
+
+# Precompute Configuration
+AI_PRECOMPUTE = os.getenv('AI_PRECOMPUTE', 'false').lower() == 'true'  # Regenerate AI results on profile changes and serve them from MySQL; needs ai_worker.py running
+AI_PRECOMPUTE_THREADS = int(os.getenv('AI_PRECOMPUTE_THREADS', 2))  # Threads per web worker recording profile changes off the request path
+AI_PRECOMPUTE_DEBOUNCE = int(os.getenv('AI_PRECOMPUTE_DEBOUNCE', 30))  # Seconds of quiet after a profile change before regenerating
+AI_PRECOMPUTE_MAX_AGE = int(os.getenv('AI_PRECOMPUTE_MAX_AGE', 7 * 86400))  # Stored results older than this are regenerated on request
+AI_PRECOMPUTE_CHECKPOINT = os.getenv('AI_PRECOMPUTE_CHECKPOINT', 'precompute_checkpoint.json')  # Progress file of precompute_all.py
+AI_INPUT_COST_PER_MILLION_TOKENS = float(os.getenv('AI_INPUT_COST_PER_MILLION_TOKENS', 0.0375))  # USD, for cost estimates in reports
+AI_OUTPUT_COST_PER_MILLION_TOKENS = float(os.getenv('AI_OUTPUT_COST_PER_MILLION_TOKENS', 0.15))  # USD, for cost estimates in reports
+
+# Quota Configuration
+AI_QUOTA = os.getenv('AI_QUOTA', 'true').lower() == 'true'  # Limit live AI generations per user and task per day
+AI_QUOTA_DAILY_LIMIT = int(os.getenv('AI_QUOTA_DAILY_LIMIT', 50))  # Default daily limit per task (negative: unlimited)
+AI_QUOTA_DAILY_LIMITS = {  # Per-task daily limits
+    'resume_feedback': int(os.getenv('AI_QUOTA_RESUME_FEEDBACK', AI_QUOTA_DAILY_LIMIT)),
+    'career_advice': int(os.getenv('AI_QUOTA_CAREER_ADVICE', AI_QUOTA_DAILY_LIMIT)),
+    'detailed_roadmap': int(os.getenv('AI_QUOTA_DETAILED_ROADMAP', AI_QUOTA_DAILY_LIMIT)),
+    'precompute': int(os.getenv('AI_QUOTA_PRECOMPUTE', 10))  # Regeneration rounds queued by profile edits (ai_precompute.py)
+}
+AI_QUOTA_FLUSH_INTERVAL = float(os.getenv('AI_QUOTA_FLUSH_INTERVAL', 5))  # Seconds between batched writes of quota counters to MySQL
+AI_ADMIN_TOKEN = os.getenv('AI_ADMIN_TOKEN', '')  # X-Admin-Token value for /api/admin endpoints (unset: admin endpoints disabled)
+
+# AI Provider Configuration
+AI_PROVIDER = os.getenv('AI_PROVIDER', 'gemini')  # gemini, huggingface, mock, record or replay
+AI_FIXTURE_DIR = os.getenv('AI_FIXTURE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ai'))  # Where record/replay keep responses
+AI_REPLAY_LATENCY = os.getenv('AI_REPLAY_LATENCY', 'true').lower() == 'true'  # Replay fixtures at their recorded latency
+AI_MOCK_LATENCY_MEDIAN = float(os.getenv('AI_MOCK_LATENCY_MEDIAN', 1.5))  # Seconds
+AI_MOCK_LATENCY_SIGMA = float(os.getenv('AI_MOCK_LATENCY_SIGMA', 0.5))  # Spread of the log-normal latency
+AI_MOCK_ERROR_RATE = float(os.getenv('AI_MOCK_ERROR_RATE', 0.02))  # Share of calls failing with a retryable error
+AI_MOCK_TIMEOUT_RATE = float(os.getenv('AI_MOCK_TIMEOUT_RATE', 0.0))  # Share of calls that hang until their timeout
+AI_MOCK_SEED = int(os.getenv('AI_MOCK_SEED', 42))
+
+# Hugging Face Configuration
+AI_HF_API_URL = os.getenv('AI_HF_API_URL', 'https://api-inference.huggingface.co/models')  # Inference API base URL (point at a local stand-in for tests)
+AI_HF_BATCH_MAX_SIZE = int(os.getenv('AI_HF_BATCH_MAX_SIZE', 8))  # Prompts sent in one request (1 disables batching)
+AI_HF_BATCH_MAX_WAIT_MS = float(os.getenv('AI_HF_BATCH_MAX_WAIT_MS', 20))  # How long the first prompt waits for others to join
+
+# Structured Output Configuration
+AI_STRUCTURED_OUTPUT = os.getenv('AI_STRUCTURED_OUTPUT', 'true').lower() == 'true'  # Ask Gemini models for schema-shaped JSON
+
+# Similarity Cache Configuration
+AI_SIMILARITY_CACHE = os.getenv('AI_SIMILARITY_CACHE', 'true').lower() == 'true'  # Reuse results of near-identical profiles
+AI_SIMILARITY_THRESHOLD = float(os.getenv('AI_SIMILARITY_THRESHOLD', 0.9))  # Cosine similarity needed to reuse a result
+AI_SIMILARITY_CACHE_SIZE = int(os.getenv('AI_SIMILARITY_CACHE_SIZE', 1000))  # Profiles kept per task
+AI_SIMILARITY_DIMENSIONS = int(os.getenv('AI_SIMILARITY_DIMENSIONS', 1024))  # Size of the hashed feature vectors
+AI_SIMILARITY_AUDIT_SIZE = int(os.getenv('AI_SIMILARITY_AUDIT_SIZE', 500))  # Recent reuses kept for /api/ai/similarity-audit
+
+# Prompt Budget Configuration
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv('AI_PROMPT_TOKEN_BUDGET', 1500))  # Estimated tokens a whole prompt may use
+AI_PROMPT_MAX_DESCRIPTION_CHARS = int(os.getenv('AI_PROMPT_MAX_DESCRIPTION_CHARS', 300))  # Longer internship/milestone descriptions are cut
+AI_CHARS_PER_TOKEN = float(os.getenv('AI_CHARS_PER_TOKEN', 4))  # Used to estimate token counts from text length
+
+# Deadline Configuration
+AI_REQUEST_TIMEOUT = float(os.getenv('AI_REQUEST_TIMEOUT', 25))  # Total seconds an AI endpoint may spend before returning the fallback
+AI_WORKER_JOB_TIMEOUT = float(os.getenv('AI_WORKER_JOB_TIMEOUT', 90))  # Budget for a queued job (keep below AI_JOB_VISIBILITY_TIMEOUT)
+AI_MIN_CALL_BUDGET = float(os.getenv('AI_MIN_CALL_BUDGET', 0.5))  # Don't start a model call with less time than this left
+
+# Retry and Circuit Breaker Configuration
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 3))  # Attempts per model call on retryable errors
+AI_RETRY_BASE_DELAY = float(os.getenv('AI_RETRY_BASE_DELAY', 0.5))  # First backoff ceiling (seconds), doubled per attempt
+AI_RETRY_MAX_DELAY = float(os.getenv('AI_RETRY_MAX_DELAY', 8))  # Largest backoff ceiling (seconds)
+AI_BREAKER_WINDOW = int(os.getenv('AI_BREAKER_WINDOW', 20))  # Recent calls considered per model
+AI_BREAKER_MIN_CALLS = int(os.getenv('AI_BREAKER_MIN_CALLS', 5))  # Calls needed in the window before the breaker can trip
+AI_BREAKER_ERROR_RATE = float(os.getenv('AI_BREAKER_ERROR_RATE', 0.5))  # Failure ratio that opens the breaker
+AI_BREAKER_SLOW_CALL_SECONDS = float(os.getenv('AI_BREAKER_SLOW_CALL_SECONDS', 20))  # Calls slower than this count as slow
+AI_BREAKER_SLOW_CALL_RATE = float(os.getenv('AI_BREAKER_SLOW_CALL_RATE', 0.5))  # Slow call ratio that opens the breaker
+AI_BREAKER_OPEN_SECONDS = float(os.getenv('AI_BREAKER_OPEN_SECONDS', 30))  # Time before a trial call is let through
 
 # Fallback responses for when the AI service fails
 FALLBACK_RESPONSES = {
@@ -57,6 +145,80 @@ FALLBACK_RESPONSES = {
 DEFAULT_MODEL = 'models/gemini-1.5-flash-8b'
 FALLBACK_MODEL = 'models/gemma-3-4b-it'
 
+# Hedged Requests Configuration
+AI_HEDGE = os.getenv('AI_HEDGE', 'false').lower() == 'true'  # Race slow primary calls against a second call
+AI_HEDGE_MODEL = os.getenv('AI_HEDGE_MODEL', FALLBACK_MODEL)  # Model the hedge call goes to (empty: the primary again)
+AI_HEDGE_PERCENTILE = float(os.getenv('AI_HEDGE_PERCENTILE', 95))  # Hedge once the primary is slower than this percentile of its recent calls
+AI_HEDGE_WINDOW = int(os.getenv('AI_HEDGE_WINDOW', 200))  # Recent latencies kept per model
+AI_HEDGE_MIN_SAMPLES = int(os.getenv('AI_HEDGE_MIN_SAMPLES', 20))  # Calls timed before hedging starts
+AI_HEDGE_MAX_WORKERS = int(os.getenv('AI_HEDGE_MAX_WORKERS', 8))  # Threads running hedge calls per process; a hedge is skipped when all are busy
+
+# Server Configuration (gunicorn.conf.py)
+GUNICORN_BIND = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')  # Address gunicorn listens on
+GUNICORN_WORKER_CLASS = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')  # sync, gthread or gevent
+GUNICORN_WORKERS = int(os.getenv('GUNICORN_WORKERS', (os.cpu_count() or 1) * 2 + 1))  # Worker processes
+GUNICORN_THREADS = int(os.getenv('GUNICORN_THREADS', 16))  # Threads per worker (gthread)
+GUNICORN_WORKER_CONNECTIONS = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 500))  # Concurrent requests per worker (gevent)
+GUNICORN_TIMEOUT = int(os.getenv('GUNICORN_TIMEOUT', 60))  # Seconds before a silent worker is killed (keep above AI_REQUEST_TIMEOUT and AI_JOB_MAX_WAIT)
+GUNICORN_GRACEFUL_TIMEOUT = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))  # Seconds a stopping worker gets to finish its requests
+GUNICORN_KEEPALIVE = int(os.getenv('GUNICORN_KEEPALIVE', 5))  # Seconds an idle keep-alive connection stays open
+GUNICORN_MAX_REQUESTS = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))  # Requests before a worker is recycled (0 disables)
+GUNICORN_MAX_REQUESTS_JITTER = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))  # Random extra requests so workers don't recycle together
+GUNICORN_PRELOAD = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'  # Load the app once in the master before forking (not with gevent)
+
+# Async Endpoint Configuration (asgi.py)
+AI_ASYNC_DB_POOL_MIN = int(os.getenv('AI_ASYNC_DB_POOL_MIN', 1))  # MySQL connections kept open per worker
+AI_ASYNC_DB_POOL_MAX = int(os.getenv('AI_ASYNC_DB_POOL_MAX', 10))  # Most MySQL connections per worker; further queries wait for one
+
+# JSON Response Configuration (json_provider.py)
+JSON_PROVIDER = os.getenv('JSON_PROVIDER', 'auto').lower()  # auto (orjson if installed), orjson or stdlib
+JSON_STREAM_BATCH_SIZE = int(os.getenv('JSON_STREAM_BATCH_SIZE', 500))  # Rows fetched and serialized per chunk of a streamed list
+
+# Response Compression Configuration (compression.py)
+COMPRESSION = os.getenv('COMPRESSION', 'true').lower() == 'true'  # Compress responses the client accepts gzip or brotli for
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 500))  # Smaller bodies are sent as they are
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))  # 1 (fastest) to 9 (smallest)
+COMPRESSION_BROTLI_LEVEL = int(os.getenv('COMPRESSION_BROTLI_LEVEL', 5))  # 0 (fastest) to 11 (smallest); needs `pip install brotli`
+COMPRESSION_CACHED_GZIP_LEVEL = int(os.getenv('COMPRESSION_CACHED_GZIP_LEVEL', 9))  # Level for AI responses that are compressed once and cached
+COMPRESSION_CACHED_BROTLI_LEVEL = int(os.getenv('COMPRESSION_CACHED_BROTLI_LEVEL', 11))  # Brotli quality for cached AI responses
+COMPRESSION_CACHE_BYTES = int(os.getenv('COMPRESSION_CACHE_BYTES', 16 * 1024 * 1024))  # Compressed AI responses kept per process (0 disables)
+
+# Metrics Configuration (metrics.py)
+METRICS = os.getenv('METRICS', 'true').lower() == 'true'  # Record request, database and AI call metrics and serve GET /metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # If set, /metrics requires "Authorization: Bearer <token>"
+METRICS_DIR = os.getenv('METRICS_DIR', '')  # Directory the worker processes share snapshots through (empty: /metrics shows one process)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # Seconds between a worker's snapshot writes to METRICS_DIR
+
+# Request Profiler Configuration (profiler.py)
+PROFILER = os.getenv('PROFILER', 'false').lower() == 'true'  # Install the profiling hooks (off: requests pay nothing)
+PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 0.0))  # Fraction of requests profiled without being asked (0 = only "X-Profile" admin requests)
+PROFILER_MODE = os.getenv('PROFILER_MODE', 'sample')  # "sample" (stack sampling, flame graphs) or "cprofile" (every call)
+PROFILER_SAMPLE_INTERVAL = float(os.getenv('PROFILER_SAMPLE_INTERVAL', 0.005))  # Seconds between stack samples in sample mode
+PROFILER_MIN_SECONDS = float(os.getenv('PROFILER_MIN_SECONDS', 0.0))  # Sampled requests faster than this are not saved
+PROFILER_DIR = os.getenv('PROFILER_DIR', 'profiles')  # Directory the reports are written to
+PROFILER_MAX_REPORTS = int(os.getenv('PROFILER_MAX_REPORTS', 50))  # Reports kept; the oldest are deleted
+PROFILER_TOP_FUNCTIONS = int(os.getenv('PROFILER_TOP_FUNCTIONS', 40))  # Functions listed in each report's top tables
+
+# Memory Inspector Configuration (memory.py)
+MEMORY_RSS_CHECK_EVERY = int(os.getenv('MEMORY_RSS_CHECK_EVERY', 200))  # Requests between RSS checks (0 disables the alarm)
+MEMORY_RSS_ALARM_BYTES_PER_REQUEST = int(os.getenv('MEMORY_RSS_ALARM_BYTES_PER_REQUEST', 16384))  # RSS growth per request between checks that raises the alarm
+MEMORY_RSS_WARMUP_REQUESTS = int(os.getenv('MEMORY_RSS_WARMUP_REQUESTS', 1000))  # Requests before the alarm is armed (caches fill up first)
+MEMORY_TRACE_ON_ALARM = os.getenv('MEMORY_TRACE_ON_ALARM', 'false').lower() == 'true'  # Start tracemalloc and take a snapshot at the first alarm
+MEMORY_TRACE_FRAMES = int(os.getenv('MEMORY_TRACE_FRAMES', 10))  # Frames tracemalloc keeps per allocation
+MEMORY_MAX_SNAPSHOTS = int(os.getenv('MEMORY_MAX_SNAPSHOTS', 5))  # tracemalloc snapshots kept; the oldest are dropped
+MEMORY_TOP_SITES = int(os.getenv('MEMORY_TOP_SITES', 25))  # Allocation sites listed by default
+
 # Logging Configuration
-LOG_LEVEL = 'INFO'
-LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s' 
\ No newline at end of file
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()  # Starting level; can be changed at runtime (/api/admin/logging)
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_JSON = os.getenv('LOG_JSON', 'true').lower() == 'true'  # Web app writes one JSON object per line (false: LOG_FORMAT text)
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # Records waiting for the background writer; further records are dropped and counted
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 1.0))  # Share of requests whose debug/info records are kept (warnings and errors always are)
+LOG_ROUTE_SAMPLE_RATES = {
+    route.strip(): float(rate)
+    for route, _, rate in (item.partition('=') for item in os.getenv('LOG_ROUTE_SAMPLE_RATES', '/api/test-connection=0.1').split(','))
+    if route.strip()
+}  # Per-route overrides of LOG_SAMPLE_RATE as "rule=rate,rule=rate", with Flask rules like /api/jobs/<job_id>
+LOG_MAX_FIELD_LENGTH = int(os.getenv('LOG_MAX_FIELD_LENGTH', 1000))  # Longer messages and payload values are truncated
+LOG_SETTINGS_FILE = os.getenv('LOG_SETTINGS_FILE', '')  # File that shares runtime level/sampling changes with every worker (empty: this process only)
+LOG_SETTINGS_POLL = float(os.getenv('LOG_SETTINGS_POLL', 5))  # Seconds between checks of LOG_SETTINGS_FILE
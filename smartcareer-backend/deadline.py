@@ -0,0 +1,62 @@
+"""
+Request deadlines for AI calls
+
+A Deadline is created when a request starts (in the Flask route or the job
+worker) and handed down through the generators to the model call. Retries,
+backoff sleeps, rate limit waits and fallbacks only spend what is left of it.
+"""
+
+import asyncio
+import time
+import config
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has run out of time budget"""
+
+class Deadline:
+    """A fixed point in time by which a request has to be answered"""
+
+    def __init__(self, seconds=None):
+        self.budget = config.AI_REQUEST_TIMEOUT if seconds is None else seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, what="request"):
+        """Raise DeadlineExceeded unless enough budget is left to start another call"""
+        if self.remaining() < config.AI_MIN_CALL_BUDGET:
+            raise DeadlineExceeded(f"Deadline of {self.budget:.1f}s exceeded before {what}")
+
+    def timeout(self, cap=None):
+        """Remaining budget, optionally capped, for use as a network timeout"""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def sleep(self, seconds):
+        """
+        Sleep for `seconds` if the budget allows it. Returns False without
+        sleeping when the sleep would leave too little time for another call.
+        """
+        if seconds + config.AI_MIN_CALL_BUDGET > self.remaining():
+            return False
+        time.sleep(seconds)
+        return True
+
+    async def asleep(self, seconds):
+        """sleep() for coroutines"""
+        if seconds + config.AI_MIN_CALL_BUDGET > self.remaining():
+            return False
+        await asyncio.sleep(seconds)
+        return True
+
+    def __repr__(self):
+        return f"Deadline(budget={self.budget:.1f}s, remaining={self.remaining():.1f}s)"
@@ -0,0 +1,70 @@
+"""
+Gunicorn configuration for SmartCareer
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Every setting comes from config.py (GUNICORN_* environment variables). The AI
+endpoints spend almost all their time waiting on the model, so the worker
+class matters more than the worker count:
+  sync     one request per worker; a slow model call blocks the whole worker
+  gthread  GUNICORN_THREADS requests per worker (default); plain threads, so
+           it works with every library the app uses
+  gevent   GUNICORN_WORKER_CONNECTIONS requests per worker on greenlets; needs
+           `pip install gevent` and the pure-Python MySQL connector. Preloading
+           is turned off because the app must be imported after gevent has
+           patched the standard library.
+  uvicorn.workers.UvicornWorker
+           with asgi:app only; the AI endpoints run as coroutines, so a
+           worker isn't limited by a thread or connection count (asgi.py)
+
+Workers are recycled after GUNICORN_MAX_REQUESTS requests (plus jitter) so a
+slow leak or fragmented heap can't grow without bound. Use bench_server.py to
+compare configurations.
+"""
+
+import config as app_config  # "config" is itself a gunicorn setting
+
+bind = app_config.GUNICORN_BIND
+worker_class = app_config.GUNICORN_WORKER_CLASS
+workers = app_config.GUNICORN_WORKERS
+# gunicorn quietly turns sync into gthread when threads > 1
+threads = app_config.GUNICORN_THREADS if worker_class == 'gthread' else 1
+worker_connections = app_config.GUNICORN_WORKER_CONNECTIONS
+
+# Must outlast the longest request: AI_REQUEST_TIMEOUT, AI_JOB_MAX_WAIT long-polls and SSE streams
+timeout = app_config.GUNICORN_TIMEOUT
+graceful_timeout = app_config.GUNICORN_GRACEFUL_TIMEOUT
+keepalive = app_config.GUNICORN_KEEPALIVE
+
+max_requests = app_config.GUNICORN_MAX_REQUESTS
+max_requests_jitter = app_config.GUNICORN_MAX_REQUESTS_JITTER
+
+preload_app = app_config.GUNICORN_PRELOAD and worker_class != 'gevent'
+
+accesslog = '-'
+loglevel = app_config.LOG_LEVEL.lower()
+
+def on_starting(server):
+    # Snapshots left in METRICS_DIR belong to the previous run
+    if app_config.METRICS and app_config.METRICS_DIR:
+        import metrics
+        metrics.clear_snapshots()
+
+def when_ready(server):
+    # Runs in the master after the app is preloaded and before any worker is forked
+    if preload_app:
+        import wsgi
+        wsgi.warm_up()
+    server.log.info(f"Starting {workers} {worker_class} workers (preload={preload_app})")
+
+def post_fork(server, worker):
+    if preload_app:
+        import wsgi
+        wsgi.reinit_after_fork()
+
+def worker_exit(server, worker):
+    import sys
+    # Only if this worker loaded the app
+    if 'wsgi' in sys.modules:
+        sys.modules['wsgi'].on_worker_exit()
@@ -0,0 +1,237 @@
+"""
+Hedged model calls
+
+Model latency has a long tail: most answers come back quickly, a few take many
+times longer. When the primary call has not answered after the
+AI_HEDGE_PERCENTILE of that model's recent latencies, the same prompt is also
+sent to config.AI_HEDGE_MODEL (the fallback model by default, or the primary
+again) and the first successful answer is used.
+
+A call that can't be hedged (too few latencies recorded yet, or too little of
+the deadline left) runs on the caller's thread. Otherwise the primary runs on
+a thread of its own, so the caller can return whichever answer comes first,
+and only hedges use the pool of AI_HEDGE_MAX_WORKERS threads. When every pool
+thread is busy the call goes unhedged rather than queueing.
+
+A loser that has already started can't be cancelled: a blocking HTTP call
+can't be interrupted from Python, so it finishes in the background (keeping
+its thread) and its answer is discarded. Every hedge costs a model call and a
+rate limit token; hedge and win rates per model are reported by hedge_stats().
+
+Calls on other threads run in a copy of the caller's context, so their log
+lines keep the route and request id. Latency is timed from when a call starts
+running and is recorded for the model that actually answered.
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import config
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger('hedging')
+
+class LatencyTracker:
+    """Latencies of the most recent successful calls to one model"""
+
+    def __init__(self, window=None, min_samples=None):
+        self.min_samples = min_samples or config.AI_HEDGE_MIN_SAMPLES
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window or config.AI_HEDGE_WINDOW)
+
+    def record(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def threshold(self, pct):
+        """Nearest-rank percentile of recent latencies, or None until enough calls were seen"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            values = sorted(self._latencies)
+        index = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+        return values[min(index, len(values) - 1)]
+
+class HedgeStats:
+    """Counters for one primary model"""
+
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.both_failed = 0
+        self.pool_full = 0
+
+_lock = threading.Lock()
+_trackers = {}
+_stats = {}
+_executor = None
+# Free hedge threads; taken before a hedge is submitted, so hedges never queue
+_hedge_slots = threading.BoundedSemaphore(config.AI_HEDGE_MAX_WORKERS)
+
+def get_tracker(model_name):
+    with _lock:
+        tracker = _trackers.get(model_name)
+        if tracker is None:
+            tracker = LatencyTracker()
+            _trackers[model_name] = tracker
+        return tracker
+
+def get_executor():
+    """Threads running hedge calls, created on first use"""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=config.AI_HEDGE_MAX_WORKERS, thread_name_prefix='hedge')
+        return _executor
+
+def after_fork():
+    """Drop the executor inherited from the parent process; its threads did not survive the fork"""
+    global _executor, _lock, _hedge_slots
+    _lock = threading.Lock()
+    _executor = None
+    _hedge_slots = threading.BoundedSemaphore(config.AI_HEDGE_MAX_WORKERS)
+
+def _record(model_name, hedged=False, winner=None, pool_full=False):
+    with _lock:
+        stats = _stats.setdefault(model_name, HedgeStats())
+        stats.calls += 1
+        if pool_full:
+            stats.pool_full += 1
+        if hedged:
+            stats.hedged += 1
+            if winner == 'hedge':
+                stats.hedge_wins += 1
+            elif winner == 'primary':
+                stats.primary_wins += 1
+            else:
+                stats.both_failed += 1
+
+def _timed(context, func):
+    started = time.monotonic()
+    result = context.run(func)
+    return result, time.monotonic() - started
+
+def _start_primary(func):
+    """Run func() on a thread of its own in the caller's context; the future's result is (result, seconds)"""
+    context = contextvars.copy_context()
+    future = Future()
+    # Marked running up front: like a started call on the pool, it can't be cancelled
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(_timed(context, func))
+        except BaseException as e:
+            future.set_exception(e)
+
+    future.add_done_callback(_record_latency)
+    threading.Thread(target=run, name='hedge-primary', daemon=True).start()
+    return future
+
+def _submit_hedge(func):
+    """Run func() on a free pool thread in the caller's context, or return None if there is none"""
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    context = contextvars.copy_context()
+    future = get_executor().submit(_timed, context, func)
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    future.add_done_callback(_record_latency)
+    return future
+
+def _record_latency(future):
+    # Also when the other call already won, so slow answers keep the percentile honest
+    if not future.cancelled() and future.exception() is None:
+        (_, model_used), seconds = future.result()
+        get_tracker(model_used).record(seconds)
+
+def _wait_for(futures, deadline):
+    timeout = deadline.remaining() if deadline is not None else None
+    return wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+def hedged_call(primary, hedge, model_name, deadline=None, percentile=None):
+    """
+    Run primary(); if it is slower than the model's latency percentile, run
+    hedge() as well and return the result of whichever succeeds first. Both
+    return (result, model_used), like resilience.call_with_resilience().
+
+    Until AI_HEDGE_MIN_SAMPLES calls have been timed, or when too little of the
+    deadline is left for a second call, primary() runs unhedged on the
+    caller's thread. Raises the primary's error if both fail, or
+    DeadlineExceeded if neither answers in time.
+    """
+    percentile = config.AI_HEDGE_PERCENTILE if percentile is None else percentile
+    tracker = get_tracker(model_name)
+    delay = tracker.threshold(percentile)
+
+    remaining = deadline.remaining() if deadline is not None else None
+    if delay is None or (remaining is not None and delay + config.AI_MIN_CALL_BUDGET >= remaining):
+        try:
+            started = time.monotonic()
+            result, model_used = primary()
+            get_tracker(model_used).record(time.monotonic() - started)
+            return result, model_used
+        finally:
+            _record(model_name)
+
+    primary_future = _start_primary(primary)
+    done, _ = wait([primary_future], timeout=delay)
+    pool_full = False
+    if not done:
+        hedge_future = _submit_hedge(hedge)
+        if hedge_future is not None:
+            logger.info("%s slower than p%g (%.2fs), hedging", model_name, percentile, delay)
+            return _race(primary_future, hedge_future, model_name, deadline)
+        logger.info("%s slower than p%g (%.2fs), but every hedge thread is busy", model_name, percentile, delay)
+        pool_full = True
+
+    done, _ = _wait_for([primary_future], deadline)
+    _record(model_name, pool_full=pool_full)
+    if not done:
+        raise DeadlineExceeded(f"No answer from {model_name} before the deadline")
+    return primary_future.result()[0]
+
+def _race(primary_future, hedge_future, model_name, deadline):
+    names = {primary_future: 'primary', hedge_future: 'hedge'}
+    pending = set(names)
+    errors = {}
+    while pending:
+        done, pending = _wait_for(pending, deadline)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                winner = names[future]
+                # Only a call that has not started yet can be cancelled; a started one finishes in the background
+                for loser in pending:
+                    loser.cancel()
+                _record(model_name, hedged=True, winner=winner)
+                if winner == 'hedge':
+                    logger.info("Hedged call beat %s", model_name)
+                return future.result()[0]
+            errors[names[future]] = future.exception()
+
+    _record(model_name, hedged=True)
+    if errors:
+        raise errors.get('primary') or errors['hedge']
+    raise DeadlineExceeded(f"No answer from {model_name} or its hedge before the deadline")
+
+def hedge_stats():
+    """Per primary model: hedge rate, how often the hedge won and the current hedge delay"""
+    with _lock:
+        snapshot = {model: vars(stats).copy() for model, stats in _stats.items()}
+    result = {}
+    for model, stats in snapshot.items():
+        threshold = get_tracker(model).threshold(config.AI_HEDGE_PERCENTILE)
+        stats.update({
+            "hedge_rate": round(stats["hedged"] / stats["calls"], 4) if stats["calls"] else 0.0,
+            "hedge_win_rate": round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0,
+            "hedge_after_seconds": round(threshold, 3) if threshold is not None else None,
+        })
+        result[model] = stats
+    return result
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Hugging Face Inference API
+
+Answers POST /models/<model> like the real API: a single input gets
+[{"generated_text": ...}], a list of inputs gets one such entry per input.
+Every request costs a fixed latency regardless of how many inputs it carries,
+which is what makes batching pay off. GET /stats reports how many requests
+and inputs arrived, and the batch sizes seen.
+
+Each generated text names the input it answers: a prompt containing a marker
+such as "[marker:user-7]" is answered with "answer to user-7", any other
+prompt with "answer to <sha256 prefix of the prompt>". That way a caller can
+tell whether it got its own answer back, but the app's endpoints get no JSON
+and return their fallback responses (use AI_PROVIDER=mock to try those).
+With --status every request is answered with that HTTP error instead.
+
+Usage:
+  python hf_stand_in.py [--port 8081] [--latency 0.5] [--status 429]
+  AI_PROVIDER=huggingface HF_API_KEY=test AI_HF_API_URL=http://localhost:8081/models python app.py
+  python hf_stand_in.py --load-test 64        # start the stand-in and send 64 concurrent prompts through ai_service_hf
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('hf_stand_in')
+
+MARKER = re.compile(r'\[marker:([\w.-]+)\]')
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.inputs = 0
+        self.batch_sizes = Counter()
+
+    def record(self, size):
+        with self.lock:
+            self.requests += 1
+            self.inputs += size
+            self.batch_sizes[size] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "inputs": self.inputs,
+                "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())}
+            }
+
+def marker(prompt):
+    """The prompt's marker, or a digest of the prompt if it has none"""
+    match = MARKER.search(prompt)
+    return match.group(1) if match else hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+
+def answer(prompt):
+    return f"answer to {marker(prompt)}"
+
+def make_handler(stats, latency):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send(200, stats.snapshot())
+            else:
+                self._send(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if not self.path.startswith('/models/'):
+                self._send(404, {"error": "Not found"})
+                return
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            inputs = payload.get('inputs')
+            batched = isinstance(inputs, list)
+            prompts = inputs if batched else [inputs]
+            stats.record(len(prompts))
+
+            time.sleep(latency)
+            if self.server.fail_status:
+                self._send(self.server.fail_status, {"error": f"Stand-in answered with {self.server.fail_status}"})
+                return
+            outputs = [{"generated_text": answer(str(prompt))} for prompt in prompts]
+            self._send(200, [[output] for output in outputs] if batched else outputs)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def start_server(port, latency, fail_status=None):
+    """Serve in a background thread; port 0 picks a free port (server.server_address has it)"""
+    stats = Stats()
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(stats, latency))
+    # Set it on the running server to switch error injection on or off
+    server.fail_status = fail_status
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Hugging Face stand-in listening on http://127.0.0.1:{server.server_address[1]}/models (latency {latency}s)")
+    return server, stats
+
+def load_test(port, prompts):
+    """Send concurrent prompts through ai_service_hf and report what reached the stand-in"""
+    os.environ.setdefault('HF_API_KEY', 'stand-in')
+    os.environ['AI_HF_API_URL'] = f"http://127.0.0.1:{port}/models"
+    import config
+    config.AI_HF_API_URL = os.environ['AI_HF_API_URL']
+    import ai_service_hf
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=prompts) as pool:
+        results = list(pool.map(
+            lambda i: ai_service_hf.generate_completion(f"Prompt [marker:user-{i}]", user_key=f"user-{i}"),
+            range(prompts)
+        ))
+    elapsed = time.monotonic() - started
+    return {
+        "prompts": prompts,
+        "answered": sum(result is not None for result in results),
+        "own_answer": sum(result == f"answer to user-{i}" for i, result in enumerate(results)),
+        "elapsed_seconds": round(elapsed, 2),
+        "batching": ai_service_hf.status()["batching"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Hugging Face Inference API")
+    parser.add_argument('--port', type=int, default=8081, help="0 picks a free port")
+    parser.add_argument('--latency', type=float, default=0.5, help="Seconds each request takes")
+    parser.add_argument('--status', type=int, help="Answer every request with this HTTP error status")
+    parser.add_argument('--load-test', type=int, metavar='PROMPTS',
+                        help="Send this many concurrent prompts through ai_service_hf, print stats and exit")
+    args = parser.parse_args()
+
+    server, stats = start_server(args.port, args.latency, args.status)
+    if args.load_test:
+        report = load_test(server.server_address[1], args.load_test)
+        report["stand_in"] = stats.snapshot()
+        print(json.dumps(report, indent=2))
+        server.shutdown()
+        return
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
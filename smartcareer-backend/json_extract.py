@@ -0,0 +1,264 @@
+"""
+Tolerant JSON extraction from model output
+
+Models sometimes wrap their JSON in markdown fences, add a sentence before or
+after it, or make small syntax mistakes. JsonExtractor reads the output once,
+chunk by chunk as it streams in, and writes out valid JSON as it goes:
+  - anything before the first '{' (or '[') and after the matching close is skipped
+  - raw newlines/tabs inside strings are escaped, invalid escapes are doubled
+  - single-quoted strings become double-quoted
+  - a quote inside a string that is not followed by , : } ] is kept as text
+  - trailing commas and // or /* */ comments are dropped
+  - a missing comma between two members on separate lines is added
+  - output cut off mid-way is closed, unless the caller asks for a complete
+    answer (a model that hit its token limit dropped the rest of it)
+
+Parse outcomes are counted per model so /api/ai/status shows how often each
+model needs repairs or fails outright.
+"""
+
+import json
+import logging
+import threading
+
+logger = logging.getLogger('json_extract')
+
+CLOSERS = {'{': '}', '[': ']'}
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+class JsonExtractor:
+    """Single-pass extractor; feed() chunks, then call result()"""
+
+    def __init__(self, expect=None):
+        # expect='{' or '[' ignores the other bracket before the JSON starts
+        self.openers = expect or '{['
+        self.repairs = set()
+        self.done = False
+        self._out = []
+        self._stack = []
+        self._quote = None       # quote character of the string being read
+        self._escape = False
+        self._maybe_closed = False  # saw a '"' that may or may not end the string
+        self._held_space = ''
+        self._slash = False
+        self._comment = None     # 'line' or 'block'
+        self._comment_star = False
+        self._item_start = None
+        self._items = []
+
+    def feed(self, text):
+        """
+        Consume a chunk of model output. Returns the elements of a top-level
+        array that were completed by this chunk (empty for objects).
+        """
+        self._items = []
+        for ch in text:
+            if self.done:
+                break
+            self._consume(ch)
+        return self._items
+
+    def _consume(self, ch):
+        if not self._stack:
+            if ch in self.openers:
+                self._open(ch)
+            return
+
+        if self._maybe_closed:
+            if ch.isspace():
+                self._held_space += ch
+                return
+            self._maybe_closed = False
+            held, self._held_space = self._held_space, ''
+            if ch in ',:}]':
+                self._out.append('"' + held)
+                self._quote = None
+            elif ch == '"' and '\n' in held:
+                # Two members on separate lines without a comma between them
+                self.repairs.add('missing_comma')
+                self._out.append('",' + held)
+                self._quote = None
+            else:
+                self.repairs.add('unescaped_quote')
+                self._out.append('\\"' + self._escape_text(held))
+
+        if self._quote:
+            self._consume_string(ch)
+            return
+
+        if self._comment:
+            self._consume_comment(ch)
+            return
+        if self._slash:
+            self._slash = False
+            if ch in '/*':
+                self.repairs.add('comment')
+                self._comment = 'line' if ch == '/' else 'block'
+                self._comment_star = False
+                return
+            self._out.append('/')
+
+        if ch == '/':
+            self._slash = True
+        elif ch == '"':
+            self._quote = '"'
+            self._out.append('"')
+        elif ch == "'":
+            self.repairs.add('single_quotes')
+            self._quote = "'"
+            self._out.append('"')
+        elif ch in CLOSERS:
+            self._open(ch)
+        elif ch in '}]':
+            self._close(ch)
+        else:
+            self._out.append(ch)
+
+    def _consume_string(self, ch):
+        if self._escape:
+            self._escape = False
+            if ch in '"\\/bfnrtu':
+                self._out.append('\\' + ch)
+            elif ch == "'":
+                self._out.append("'")
+            else:
+                self.repairs.add('invalid_escape')
+                self._out.append('\\\\' + self._escape_text(ch))
+        elif ch == '\\':
+            self._escape = True
+        elif ch == self._quote:
+            if ch == '"':
+                self._maybe_closed = True
+            else:
+                self._out.append('"')
+                self._quote = None
+        elif ch == '"':
+            self._out.append('\\"')
+        else:
+            self._out.append(self._escape_text(ch))
+
+    def _consume_comment(self, ch):
+        if self._comment == 'line':
+            if ch == '\n':
+                self._comment = None
+                self._out.append(ch)
+        else:
+            if self._comment_star and ch == '/':
+                self._comment = None
+            self._comment_star = ch == '*'
+
+    def _escape_text(self, text):
+        if not any(ch < ' ' for ch in text):
+            return text
+        self.repairs.add('control_character')
+        return json.dumps(text)[1:-1]
+
+    def _open(self, ch):
+        if self._stack == ['[']:
+            self._item_start = len(self._out)
+        self._stack.append(ch)
+        self._out.append(ch)
+
+    def _close(self, ch):
+        self._strip_trailing_comma()
+        opener = self._stack.pop()
+        if CLOSERS[opener] != ch:
+            self.repairs.add('mismatched_bracket')
+        self._out.append(CLOSERS[opener])
+
+        if not self._stack:
+            self.done = True
+        elif self._stack == ['['] and self._item_start is not None:
+            item = ''.join(self._out[self._item_start:])
+            self._item_start = None
+            try:
+                self._items.append(json.loads(item))
+            except ValueError:
+                pass
+
+    def _strip_trailing_comma(self):
+        while self._out and not self._out[-1].strip():
+            self._out.pop()
+        if self._out and self._out[-1] == ',':
+            self.repairs.add('trailing_comma')
+            self._out.pop()
+
+    def text(self):
+        """The JSON written so far, closed off if the output was cut short"""
+        if not self._stack and not self.done:
+            raise ValueError("Could not find JSON structure in response")
+
+        out = list(self._out)
+        stack = list(self._stack)
+        if self._maybe_closed:
+            out.append('"' + self._held_space)
+        elif self._quote:
+            self.repairs.add('truncated')
+            out.append('"')
+        if stack:
+            self.repairs.add('truncated')
+            while out and not out[-1].strip():
+                out.pop()
+            if out and out[-1] in (',', ':'):
+                out.pop()
+            while stack:
+                out.append(CLOSERS[stack.pop()])
+        return ''.join(out)
+
+    def result(self, allow_truncated=True):
+        """Parse what was fed; raises ValueError if it can't be made into JSON (or was cut off)"""
+        text = self.text()
+        if not allow_truncated and 'truncated' in self.repairs:
+            raise ValueError("JSON response was cut off")
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"Could not repair JSON response: {e}")
+
+def loads(text, model_name=None, expect=None, allow_truncated=True):
+    """
+    Parse JSON from model output, repairing it if needed. Raises ValueError
+    when nothing usable is found, or when the output was cut off and
+    `allow_truncated` is False. With `model_name` the outcome is counted.
+    """
+    try:
+        result = json.loads(text)
+        if expect is None or isinstance(result, dict if expect == '{' else list):
+            if model_name:
+                record_parse(model_name, set(), True)
+            return result
+    except ValueError:
+        pass
+
+    extractor = JsonExtractor(expect=expect)
+    extractor.feed(text)
+    try:
+        result = extractor.result(allow_truncated)
+    except ValueError:
+        if model_name:
+            record_parse(model_name, extractor.repairs, False)
+        raise
+    if model_name:
+        record_parse(model_name, extractor.repairs, True)
+    if extractor.repairs:
+        logger.info("Repaired JSON response (%s)", ', '.join(sorted(extractor.repairs)))
+    return result
+
+def record_parse(model_name, repairs, ok):
+    with _stats_lock:
+        stats = _stats.setdefault(model_name, {"clean": 0, "repaired": 0, "failed": 0, "repairs": {}})
+        if not ok:
+            stats["failed"] += 1
+        elif repairs:
+            stats["repaired"] += 1
+        else:
+            stats["clean"] += 1
+        for repair in repairs:
+            stats["repairs"][repair] = stats["repairs"].get(repair, 0) + 1
+
+def parse_stats():
+    """Per-model counts of clean, repaired and failed JSON parses"""
+    with _stats_lock:
+        return {model: dict(stats, repairs=dict(stats["repairs"])) for model, stats in _stats.items()}
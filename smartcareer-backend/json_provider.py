@@ -0,0 +1,144 @@
+"""
+Fast JSON serialization for API responses
+
+create_app() installs FastJSONProvider as the Flask app's JSON provider, so
+jsonify() and returning a dict from a view go through it. It uses orjson when
+it is installed (JSON_PROVIDER=auto or orjson) and the standard library
+otherwise (JSON_PROVIDER=stdlib). Either way dates are written the way the
+Android client reads them:
+  date      'YYYY-MM-DD'
+  datetime  'YYYY-MM-DD HH:MM:SS'
+so rows from MySQL can be returned as they are, without formatting each date
+with strftime first. Keys keep their insertion order.
+
+json_array_response() streams a list endpoint's rows from a cursor in
+batches, so a long list is never held in memory as Python objects or as one
+big string.
+"""
+
+import datetime
+import decimal
+import json
+import logging
+import uuid
+from flask import Response, stream_with_context
+from flask.json.provider import JSONProvider
+from mysql.connector import FieldType
+import config
+
+try:
+    import orjson
+except ImportError:  # optional; the standard library is used instead
+    orjson = None
+
+logger = logging.getLogger('json_provider')
+
+def default(value):
+    """Serialize the types the json modules can't (or, for dates, shouldn't) handle themselves"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        # MySQL TIME columns arrive as timedelta
+        return str(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def use_orjson():
+    if config.JSON_PROVIDER == 'stdlib':
+        return False
+    if orjson is None:
+        if config.JSON_PROVIDER == 'orjson':
+            logger.warning("JSON_PROVIDER=orjson but orjson is not installed, using the standard library")
+        return False
+    return True
+
+if orjson is not None:
+    # orjson writes dates as YYYY-MM-DD itself, but datetimes with a "T"; passing
+    # them through to default() costs a Python call per value, so it is only
+    # done when the data may hold datetimes
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+    ORJSON_DATETIME_OPTIONS = ORJSON_OPTIONS | orjson.OPT_PASSTHROUGH_DATETIME
+
+DATETIME_TYPE_CODES = {FieldType.DATETIME, FieldType.TIMESTAMP}
+
+def dumps_bytes(obj, fast=None, datetimes=True):
+    """Serialize obj to UTF-8 JSON bytes; datetimes=False promises obj holds no datetime"""
+    if fast is None:
+        fast = use_orjson()
+    if fast:
+        return orjson.dumps(obj, default=default, option=ORJSON_DATETIME_OPTIONS if datetimes else ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def has_datetime_columns(cursor):
+    """True if the query returns DATETIME or TIMESTAMP columns (or the cursor can't tell)"""
+    if not getattr(cursor, 'description', None):
+        return True
+    return any(column[1] in DATETIME_TYPE_CODES for column in cursor.description)
+
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the standard library"""
+
+    mimetype = 'application/json'
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.fast = use_orjson()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or not self.fast:
+            kwargs.setdefault('default', default)
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=default, option=ORJSON_DATETIME_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs or not self.fast:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand the bytes to the response as they are, without a round trip through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj, self.fast), mimetype=self.mimetype)
+
+def iter_json_array(cursor, batch_size=None, fast=None):
+    """Yield a JSON array of the cursor's remaining rows, one chunk per batch of rows"""
+    batch_size = batch_size or config.JSON_STREAM_BATCH_SIZE
+    fast = use_orjson() if fast is None else fast
+    datetimes = has_datetime_columns(cursor)
+    separator = b'['
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        # Each batch is serialized as an array and its brackets are dropped
+        yield separator + dumps_bytes(rows, fast, datetimes)[1:-1]
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+def json_array_response(cursor, conn, batch_size=None):
+    """
+    Stream the rows of an executed (unbuffered, dictionary) query as a JSON
+    array. The cursor and connection are closed when the response is done. A
+    database error after the first batch can only end the body early, so run
+    everything that can fail cleanly before calling this.
+    """
+    def generate():
+        try:
+            yield from iter_json_array(cursor, batch_size)
+        except Exception as e:
+            logger.error("Error while streaming JSON rows: %s", e)
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,745 @@
+#!/usr/bin/env python3
+"""
+HTTP Load Test for SmartCareer
+
+Starts a disposable MySQL server and seeds it with synthetic users, profiles,
+internships, milestones and attachments. Then it starts gunicorn
+(gunicorn.conf.py) against that database and the mock AI provider, and
+drives the API with one scenario after another:
+
+  login      logins (one in ten with a wrong password), registrations, the
+             dashboard a user opens after logging in
+  dashboard  profile, internship, milestone and attachment reads
+  upload     internships and milestones with attachments (added, then deleted
+             again), profile images and profile updates
+  ai         resume feedback, career advice and roadmaps, plain, streamed and
+             on the old /get_* paths
+  mixed      a bit of everything, including password and email changes
+
+A scenario is a fixed list of flows built from --seed, so every run sends the
+same requests. A flow is one or more requests one client sends in order
+(add an internship, then delete it). The report has the throughput of each
+scenario and p50/p95/p99 latency per route. With a baseline, each route's
+latency percentiles and each scenario's throughput are compared with it,
+and the exit status is 1 if one of them is worse by more than --tolerance.
+Routes with fewer than --min-samples requests are left out of the comparison.
+
+The database is one of:
+  local     mysqld or mariadbd from the PATH on a temporary data directory
+  docker    a mysql:8.0 container
+  external  the server in DB_HOST/DB_PORT/DB_USER/DB_PASSWORD; the test creates
+            its own database (--db-name) there and drops it afterwards
+--mysql auto (the default) picks local, then docker. Uploads go to a
+temporary directory. Neither outlives the run.
+
+Not covered: the admin and debug endpoints, and the AI job queue (it needs
+ai_worker.py). Quotas, precomputation and the similarity cache are off, as
+in bench_server.py.
+
+Usage:
+  python load_test.py                                          # every scenario against gthread:4x16
+  python load_test.py --scenarios login dashboard --requests 2000 --concurrency 100
+  python load_test.py --config uvicorn:4 --mysql docker
+  python load_test.py --save-baseline                          # store the results as the baseline
+  python load_test.py --baseline loadtest_baseline.json --tolerance 0.3 --report loadtest.json
+  AI_MOCK_LATENCY_MEDIAN=0.5 python load_test.py --scenarios ai
+
+Note: gunicorn must be installed (see bench_server.py for the worker classes),
+plus mysqld/mariadbd or docker unless --mysql external is used. A baseline
+only means something on the machine that recorded it.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+import requests
+import config
+from bench_server import start_server, stop_server
+from precompute_all import percentile
+
+logging.basicConfig(
+    level=logging.INFO,
+    format=config.LOG_FORMAT,
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('load_test')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BASE_DIR, 'loadtest_baseline.json')
+
+# Tables app.py expects (see DEPLOYMENT.md); the AI tables come from their modules
+SCHEMA = [
+    """
+    CREATE TABLE users (
+      id INT AUTO_INCREMENT PRIMARY KEY,
+      email VARCHAR(255) UNIQUE NOT NULL,
+      password_hash VARCHAR(255) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE user_profiles (
+      id INT AUTO_INCREMENT PRIMARY KEY,
+      email VARCHAR(255) UNIQUE NOT NULL,
+      name VARCHAR(255),
+      bio TEXT,
+      birthday DATE,
+      phone VARCHAR(50),
+      profile_image_url VARCHAR(512),
+      created_at DATETIME,
+      updated_at DATETIME
+    )
+    """,
+    """
+    CREATE TABLE internships (
+      id INT AUTO_INCREMENT PRIMARY KEY,
+      user_id INT NOT NULL,
+      company VARCHAR(255) NOT NULL,
+      role VARCHAR(255) NOT NULL,
+      dates VARCHAR(255) NOT NULL,
+      description TEXT,
+      filename VARCHAR(255),
+      FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    """,
+    """
+    CREATE TABLE milestones (
+      id INT AUTO_INCREMENT PRIMARY KEY,
+      user_id INT NOT NULL,
+      title VARCHAR(255) NOT NULL,
+      date DATE NOT NULL,
+      description TEXT,
+      filename VARCHAR(255),
+      FOREIGN KEY (user_id) REFERENCES users(id)
+    )
+    """,
+]
+
+FIRST_NAMES = ['Amira', 'Omar', 'Lina', 'Yusuf', 'Sara', 'Karim', 'Maya', 'Hadi', 'Nour', 'Sami']
+LAST_NAMES = ['Haddad', 'Khalil', 'Saleh', 'Nasser', 'Aziz', 'Farah', 'Rahman', 'Mansour']
+COMPANIES = ['Acme Corp', 'Globex', 'Initech', 'Umbrella Labs', 'Stark Industries', 'Wayne Tech',
+             'Hooli', 'Pied Piper', 'Cyberdyne', 'Soylent Data']
+ROLES = ['Software Intern', 'Data Analyst Intern', 'Backend Developer Intern', 'QA Intern',
+         'Mobile Developer Intern', 'Machine Learning Intern', 'DevOps Intern']
+MILESTONES = ['Hackathon winner', 'Dean\'s list', 'AWS Cloud Practitioner', 'Published a paper',
+              'Open source contribution', 'Led a student club', 'Capstone project']
+WORDS = ('built tested shipped designed improved automated analysed deployed documented refactored '
+         'service pipeline dashboard api feature model report database team users performance').split()
+
+AI_ROUTES = ['/api/resume-feedback', '/api/career-advice', '/api/detailed-roadmap']
+AI_TASKS = dict(zip(AI_ROUTES, ['resume_feedback', 'career_advice', 'detailed_roadmap']))
+LEGACY_AI_ROUTES = {'/get_resume_feedback': 'resume_feedback', '/get_career_advice': 'career_advice',
+                    '/get_detailed_roadmap': 'detailed_roadmap'}
+
+def email(user):
+    return f"loadtest{user}@example.com"
+
+def password(user):
+    return f"password-{user}"
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+class Upload:
+    """A file sent with a request, generated when it is sent so the flows stay small"""
+
+    def __init__(self, filename, size, seed, content_type):
+        self.filename = filename
+        self.size = size
+        self.seed = seed
+        self.content_type = content_type
+
+    def content(self):
+        return random.Random(self.seed).randbytes(self.size)
+
+class Ref:
+    """A value taken from the JSON response of the flow's previous request"""
+
+    def __init__(self, key):
+        self.key = key
+
+class Dataset:
+    """What the flows need to know about the seeded data; account users are handed out one per flow"""
+
+    def __init__(self, users, attachments):
+        self.users = users
+        self.attachments = attachments
+        self.accounts = 0
+        self.registrations = 0
+
+    def user(self, rng):
+        return rng.randrange(self.users)
+
+    def account(self):
+        # Password and email changes each get a user of their own, so they can't trip over each other
+        self.accounts += 1
+        return self.users + self.accounts - 1
+
+    def new_email(self, scenario):
+        self.registrations += 1
+        return f"new-{scenario}-{self.registrations}@example.com"
+
+def step(label, method, path, expected=(200,), **kwargs):
+    """One request: label is the route it is reported under"""
+    return (label, method, path, kwargs, expected)
+
+# Flows: (rng, dataset, scenario) -> list of steps
+
+def login_flow(rng, data, scenario):
+    user = data.user(rng)
+    if rng.random() < 0.1:
+        return [step('POST /login', 'POST', '/login', expected=(401,), data={'email': email(user), 'password': 'wrong-password'})]
+    return [step('POST /login', 'POST', '/login', data={'email': email(user), 'password': password(user)})]
+
+def register_flow(rng, data, scenario):
+    new_email = data.new_email(scenario)
+    return [
+        step('POST /register', 'POST', '/register', expected=(201,), data={'email': new_email, 'password': 'new-password'}),
+        step('POST /login', 'POST', '/login', data={'email': new_email, 'password': 'new-password'}),
+    ]
+
+def dashboard_flow(rng, data, scenario):
+    user = email(data.user(rng))
+    return [
+        step('GET /api/user-profile', 'GET', '/api/user-profile', params={'email': user}),
+        step('GET /get_internships', 'GET', '/get_internships', params={'email': user}),
+        step('GET /get_milestones', 'GET', '/get_milestones', params={'email': user}),
+    ]
+
+def internships_flow(rng, data, scenario):
+    return [step('GET /get_internships', 'GET', '/get_internships', params={'email': email(data.user(rng))})]
+
+def milestones_flow(rng, data, scenario):
+    return [step('GET /get_milestones', 'GET', '/get_milestones', params={'email': email(data.user(rng))})]
+
+def profile_flow(rng, data, scenario):
+    path = rng.choice(['/api/user-profile', '/user-profile'])
+    return [step(f'GET {path}', 'GET', path, params={'email': email(data.user(rng))})]
+
+def attachment_flow(rng, data, scenario):
+    if not data.attachments:
+        return internships_flow(rng, data, scenario)
+    # Files attached by the upload flows are deleted with their rows; only seeded ones are read
+    return [step('GET /attachments/<path:filename>', 'GET', f"/attachments/{rng.choice(data.attachments)}")]
+
+def attachment_upload(rng, kind):
+    if rng.random() < 0.5:
+        return {}
+    return {'files': {'attachment': Upload(f"loadtest-{kind}-{rng.getrandbits(64):016x}.pdf",
+                                          rng.randint(20000, 800000), rng.getrandbits(32), 'application/pdf')}}
+
+def add_internship_flow(rng, data, scenario):
+    user = email(data.user(rng))
+    form = {'email': user, 'company': rng.choice(COMPANIES), 'role': rng.choice(ROLES),
+            'dates': 'Jun 2024 - Aug 2024', 'description': sentence(rng, 30)}
+    return [
+        step('POST /add_internship', 'POST', '/add_internship', expected=(201,), data=form, **attachment_upload(rng, 'internship')),
+        step('POST /delete_internship', 'POST', '/delete_internship', data={'email': user, 'id': Ref('internship_id')}),
+    ]
+
+def add_milestone_flow(rng, data, scenario):
+    user = email(data.user(rng))
+    form = {'email': user, 'title': rng.choice(MILESTONES), 'date': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'description': sentence(rng, 20)}
+    return [
+        step('POST /add_milestone', 'POST', '/add_milestone', expected=(201,), data=form, **attachment_upload(rng, 'milestone')),
+        step('POST /delete_milestone', 'POST', '/delete_milestone', data={'email': user, 'id': Ref('milestone_id')}),
+    ]
+
+def profile_image_flow(rng, data, scenario):
+    image = Upload(f"photo{rng.randrange(1000)}.jpg", rng.randint(30000, 2000000), rng.getrandbits(32), 'image/jpeg')
+    return [step('POST /api/update-profile-image', 'POST', '/api/update-profile-image',
+                 data={'email': email(data.user(rng))}, files={'profileImage': image})]
+
+def update_profile_flow(rng, data, scenario):
+    path = rng.choice(['/api/update-profile', '/update-profile'])
+    form = {'current_email': email(data.user(rng)), 'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'bio': sentence(rng, 25), 'birthday': f"{rng.randint(1995, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'phone': f"+961{rng.randrange(10000000, 99999999)}"}
+    return [step(f'POST {path}', 'POST', path, data=form)]
+
+def change_password_flow(rng, data, scenario):
+    user = data.account()
+    return [
+        step('POST /change-password', 'POST', '/change-password',
+             data={'email': email(user), 'current_password': password(user), 'new_password': 'changed-password'}),
+        step('POST /change-password', 'POST', '/change-password',
+             data={'email': email(user), 'current_password': 'changed-password', 'new_password': password(user)}),
+    ]
+
+def change_email_flow(rng, data, scenario):
+    user = data.account()
+    changed = f"changed{user}@example.com"
+    return [
+        step('POST /api/change-email', 'POST', '/api/change-email',
+             json={'current_email': email(user), 'new_email': changed, 'password': password(user)}),
+        step('POST /api/change-email', 'POST', '/api/change-email',
+             json={'current_email': changed, 'new_email': email(user), 'password': password(user)}),
+    ]
+
+def ai_flow(route):
+    def flow(rng, data, scenario):
+        return [step(f'POST {route}', 'POST', route, json={'email': email(data.user(rng))})]
+    return flow
+
+def ai_stream_flow(rng, data, scenario):
+    route = rng.choice(AI_ROUTES) + '/stream'
+    return [step(f'POST {route}', 'POST', route, json={'email': email(data.user(rng))})]
+
+def ai_legacy_flow(rng, data, scenario):
+    route = rng.choice(list(LEGACY_AI_ROUTES))
+    return [step(f'POST {route}', 'POST', route, json={'email': email(data.user(rng))})]
+
+def status_flow(rng, data, scenario):
+    return [step('GET /api/ai/status', 'GET', '/api/ai/status')]
+
+def health_flow(rng, data, scenario):
+    path = rng.choice(['/', '/api/test-connection'])
+    return [step(f'GET {path}', 'GET', path)]
+
+def metrics_flow(rng, data, scenario):
+    return [step('GET /metrics', 'GET', '/metrics')]
+
+FLOWS = {
+    'login': login_flow,
+    'register': register_flow,
+    'dashboard': dashboard_flow,
+    'internships': internships_flow,
+    'milestones': milestones_flow,
+    'profile': profile_flow,
+    'attachment': attachment_flow,
+    'add_internship': add_internship_flow,
+    'add_milestone': add_milestone_flow,
+    'profile_image': profile_image_flow,
+    'update_profile': update_profile_flow,
+    'change_password': change_password_flow,
+    'change_email': change_email_flow,
+    'resume_feedback': ai_flow('/api/resume-feedback'),
+    'career_advice': ai_flow('/api/career-advice'),
+    'detailed_roadmap': ai_flow('/api/detailed-roadmap'),
+    'ai_stream': ai_stream_flow,
+    'ai_legacy': ai_legacy_flow,
+    'status': status_flow,
+    'health': health_flow,
+    'metrics': metrics_flow,
+}
+
+# Scenario -> {flow: weight}
+SCENARIOS = {
+    'login': {'login': 55, 'register': 10, 'dashboard': 20, 'profile': 10, 'health': 5},
+    'dashboard': {'dashboard': 40, 'internships': 15, 'milestones': 15, 'profile': 15, 'attachment': 10, 'login': 5},
+    'upload': {'add_internship': 30, 'add_milestone': 30, 'profile_image': 20, 'update_profile': 15, 'dashboard': 5},
+    'ai': {'resume_feedback': 25, 'career_advice': 25, 'detailed_roadmap': 25, 'ai_stream': 15, 'ai_legacy': 5, 'status': 5},
+    'mixed': {'login': 15, 'register': 3, 'dashboard': 25, 'internships': 4, 'milestones': 4, 'profile': 5,
+              'attachment': 3, 'add_internship': 5, 'add_milestone': 5, 'profile_image': 3, 'update_profile': 4,
+              'change_password': 2, 'change_email': 2, 'resume_feedback': 5, 'career_advice': 5,
+              'detailed_roadmap': 5, 'ai_stream': 2, 'ai_legacy': 1, 'status': 1, 'health': 1, 'metrics': 0.5},
+}
+
+def build_flows(scenario, count, dataset, seed):
+    """The scenario's flows, the same for every run with the same seed"""
+    rng = random.Random(f"{seed}-{scenario}")
+    names = list(SCENARIOS[scenario])
+    weights = list(SCENARIOS[scenario].values())
+    return [FLOWS[name](rng, dataset, scenario) for name in rng.choices(names, weights, k=count)]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class DisposableMySQL:
+    """A MySQL server for one run; stop() removes it with all its data"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.process = None
+        self.container = None
+        self.data_dir = None
+        self.server = None  # connection settings without a database
+
+    @staticmethod
+    def resolve(kind):
+        if kind != 'auto':
+            return kind
+        if shutil.which('mysqld') or shutil.which('mariadbd'):
+            return 'local'
+        if shutil.which('docker'):
+            return 'docker'
+        raise RuntimeError("No mysqld, mariadbd or docker found; install one, or point DB_HOST/DB_PORT/DB_USER/"
+                           "DB_PASSWORD at a server you can create a database on and use --mysql external")
+
+    def start(self):
+        self.kind = self.resolve(self.kind)
+        if self.kind == 'external':
+            self.server = {key: config.DB_CONFIG[key] for key in ('host', 'port', 'user', 'password')}
+        elif self.kind == 'local':
+            self._start_local()
+        elif self.kind == 'docker':
+            self._start_docker()
+        else:
+            raise ValueError(f"Unknown --mysql {self.kind}")
+        logger.info(f"Using {self.kind} MySQL at {self.server['host']}:{self.server['port']}")
+        return self.server
+
+    def _start_local(self):
+        mysqld = shutil.which('mysqld') or shutil.which('mariadbd')
+        version = subprocess.run([mysqld, '--version'], capture_output=True, text=True).stdout
+        mariadb = 'mariadb' in version.lower()
+        self.data_dir = tempfile.mkdtemp(prefix='smartcareer-mysql-')
+        data = os.path.join(self.data_dir, 'data')
+        # mysqld refuses to run as root unless told to
+        user = ['--user=root'] if hasattr(os, 'geteuid') and os.geteuid() == 0 else []
+
+        if mariadb:
+            install = shutil.which('mariadb-install-db') or shutil.which('mysql_install_db')
+            command = [install, '--no-defaults', f'--datadir={data}', '--auth-root-authentication-method=normal', '--skip-test-db'] + user
+        else:
+            command = [mysqld, '--no-defaults', '--initialize-insecure', f'--datadir={data}'] + user
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not initialize a MySQL data directory: {result.stderr.strip()}")
+
+        port = free_port()
+        command = [mysqld, '--no-defaults', f'--datadir={data}', f'--port={port}', '--bind-address=127.0.0.1',
+                   f'--socket={self.data_dir}/mysqld.sock', f'--pid-file={self.data_dir}/mysqld.pid',
+                   f'--log-error={self.data_dir}/error.log', '--skip-log-bin'] + user
+        if not mariadb:
+            command.append('--mysqlx=OFF')
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.server = {'host': '127.0.0.1', 'port': port, 'user': 'root', 'password': ''}
+        self._wait(60, f"see {self.data_dir}/error.log")
+
+    def _start_docker(self):
+        port = free_port()
+        result = subprocess.run(['docker', 'run', '--detach', '--rm', '--publish', f'127.0.0.1:{port}:3306',
+                                 '--env', 'MYSQL_ALLOW_EMPTY_PASSWORD=yes', 'mysql:8.0', '--skip-log-bin'],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Could not start a MySQL container: {result.stderr.strip()}")
+        self.container = result.stdout.strip()
+        self.server = {'host': '127.0.0.1', 'port': port, 'user': 'root', 'password': ''}
+        # The image initializes its data directory on first start, which takes a while
+        self._wait(180, f"see docker logs {self.container[:12]}")
+
+    def _wait(self, timeout, hint):
+        started = time.monotonic()
+        while time.monotonic() - started < timeout:
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(f"mysqld exited with {self.process.returncode} ({hint})")
+            try:
+                mysql.connector.connect(**self.server, connection_timeout=2).close()
+                return
+            except mysql.connector.Error:
+                time.sleep(0.5)
+        raise RuntimeError(f"MySQL did not accept connections within {timeout}s ({hint})")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self.container is not None:
+            subprocess.run(['docker', 'stop', self.container], capture_output=True)
+        if self.data_dir is not None:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+def create_database(server, db_name):
+    from ai_jobs import CREATE_AI_JOBS_TABLE
+    from ai_cache import CREATE_AI_RESPONSE_CACHE_TABLE
+    from ai_precompute import CREATE_AI_PROFILE_STATE_TABLE, CREATE_AI_PRECOMPUTED_RESULTS_TABLE
+    from quota import CREATE_AI_QUOTA_LEDGER_TABLE, CREATE_AI_QUOTA_OVERRIDES_TABLE
+
+    conn = mysql.connector.connect(**server)
+    try:
+        cursor = conn.cursor()
+        # Fails if the database exists: the test never writes to a database it didn't create
+        cursor.execute(f"CREATE DATABASE `{db_name}` CHARACTER SET utf8mb4")
+        cursor.execute(f"USE `{db_name}`")
+        for statement in SCHEMA + [CREATE_AI_JOBS_TABLE, CREATE_AI_RESPONSE_CACHE_TABLE, CREATE_AI_PROFILE_STATE_TABLE,
+                                   CREATE_AI_PRECOMPUTED_RESULTS_TABLE, CREATE_AI_QUOTA_LEDGER_TABLE,
+                                   CREATE_AI_QUOTA_OVERRIDES_TABLE]:
+            cursor.execute(statement)
+        conn.commit()
+    finally:
+        conn.close()
+
+def drop_database(server, db_name):
+    conn = mysql.connector.connect(**server)
+    try:
+        conn.cursor().execute(f"DROP DATABASE IF EXISTS `{db_name}`")
+    finally:
+        conn.close()
+
+class SyntheticData:
+    """Rows for the seeded tables, generated before the flows so they can refer to the attachments"""
+
+    def __init__(self):
+        self.users = []
+        self.profiles = []
+        self.internships = []
+        self.milestones = []
+        self.attachments = {}  # file name -> (size, seed)
+
+    def add_users(self, first, count, rng, attachment_share):
+        """Users first..first+count-1 with a profile and 0-5 internships and milestones each"""
+        for user in range(first, first + count):
+            user_id = user + 1
+            self.users.append((user_id, email(user), hashlib.sha256(password(user).encode()).hexdigest()))
+            self.profiles.append((email(user), f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", sentence(rng, 20),
+                                  f"{rng.randint(1995, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                                  f"+961{rng.randrange(10000000, 99999999)}"))
+            for index in range(rng.randint(0, 5)):
+                filename = None
+                if rng.random() < attachment_share:
+                    filename = f"loadtest-seed-{user}-{index}.pdf"
+                    self.attachments[filename] = (rng.randint(5000, 200000), rng.getrandbits(32))
+                start_year = rng.randint(2019, 2024)
+                self.internships.append((user_id, rng.choice(COMPANIES), rng.choice(ROLES),
+                                         f"Jun {start_year} - Sep {start_year}", sentence(rng, 40), filename))
+            for _ in range(rng.randint(0, 5)):
+                self.milestones.append((user_id, rng.choice(MILESTONES),
+                                        f"{rng.randint(2019, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                                        sentence(rng, 25), None))
+
+def seed_database(server, db_name, data, upload_dir):
+    """Insert the synthetic rows and write their attachments to upload_dir"""
+    for filename, (size, seed) in data.attachments.items():
+        with open(os.path.join(upload_dir, filename), 'wb') as f:
+            f.write(random.Random(seed).randbytes(size))
+
+    conn = mysql.connector.connect(**server, database=db_name)
+    try:
+        cursor = conn.cursor()
+        for statement, rows in [
+            ("INSERT INTO users (id, email, password_hash) VALUES (%s, %s, %s)", data.users),
+            ("INSERT INTO user_profiles (email, name, bio, birthday, phone, created_at, updated_at) "
+             "VALUES (%s, %s, %s, %s, %s, NOW(), NOW())", data.profiles),
+            ("INSERT INTO internships (user_id, company, role, dates, description, filename) "
+             "VALUES (%s, %s, %s, %s, %s, %s)", data.internships),
+            ("INSERT INTO milestones (user_id, title, date, description, filename) VALUES (%s, %s, %s, %s, %s)", data.milestones),
+        ]:
+            for start in range(0, len(rows), 1000):
+                cursor.executemany(statement, rows[start:start + 1000])
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Seeded {len(data.users)} users, {len(data.internships)} internships "
+                f"({len(data.attachments)} with attachments) and {len(data.milestones)} milestones")
+
+def run_flows(url, flows, concurrency):
+    """Run the flows with `concurrency` clients; returns (route, seconds, outcome) per request"""
+    local = threading.local()
+    results = []
+    results_lock = threading.Lock()
+
+    def resolve(value, previous):
+        if isinstance(value, Ref):
+            return (previous or {}).get(value.key)
+        if isinstance(value, Upload):
+            return (value.filename, value.content(), value.content_type)
+        if isinstance(value, dict):
+            return {key: resolve(item, previous) for key, item in value.items()}
+        return value
+
+    def send(flow):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        previous = None
+        for label, method, path, kwargs, expected in flow:
+            kwargs = resolve(kwargs, previous)
+            started = time.monotonic()
+            outcome = 'ok'
+            try:
+                response = session.request(method, url + path, timeout=120, **kwargs)
+                content = response.content
+                if response.status_code not in expected:
+                    outcome = f"http_{response.status_code}"
+                previous = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else None
+                task = AI_TASKS.get(path) or LEGACY_AI_ROUTES.get(path)
+                if outcome == 'ok' and task and previous == config.FALLBACK_RESPONSES[task]:
+                    outcome = 'fallback'
+            except (requests.RequestException, ValueError):
+                outcome, content = 'error', b''
+            elapsed = time.monotonic() - started
+            with results_lock:
+                results.append((label, elapsed, outcome, len(content)))
+            if outcome not in ('ok', 'fallback'):
+                # The rest of the flow depends on this request
+                break
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, flows))
+    return results, time.monotonic() - started
+
+def summarize(results, elapsed):
+    routes = {}
+    for route in sorted({route for route, _, _, _ in results}):
+        entries = [(seconds, outcome, size) for r, seconds, outcome, size in results if r == route]
+        latencies = sorted(seconds for seconds, _, _ in entries)
+        outcomes = {}
+        for _, outcome, _ in entries:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        routes[route] = {
+            "requests": len(entries),
+            "requests_per_second": round(len(entries) / elapsed, 2) if elapsed else 0.0,
+            "outcomes": outcomes,
+            "mean_response_bytes": round(sum(size for _, _, size in entries) / len(entries)),
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+        }
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "requests": len(results),
+        "requests_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "failed": sum(1 for _, _, outcome, _ in results if outcome not in ('ok', 'fallback')),
+        "routes": routes,
+    }
+
+def failure_rate(route):
+    failed = sum(count for outcome, count in route["outcomes"].items() if outcome not in ('ok', 'fallback'))
+    return failed / route["requests"] if route["requests"] else 0.0
+
+def compare(report, baseline, tolerance, min_delta, min_samples):
+    """
+    Regressions against the baseline, one message each. Routes with fewer than
+    min_samples requests in either run are skipped; their percentiles are noise.
+    """
+    for key in ('config', 'users', 'requests', 'concurrency', 'mock_latency_median'):
+        if report.get(key) != baseline.get(key):
+            logger.warning(f"The baseline was recorded with {key}={baseline.get(key)}, this run used {report.get(key)}")
+
+    regressions = []
+    for scenario, result in report["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base is None:
+            continue
+        if result["requests_per_second"] < base["requests_per_second"] * (1 - tolerance):
+            regressions.append(f"{scenario}: {result['requests_per_second']} requests/s, baseline {base['requests_per_second']}")
+        for route, stats in result["routes"].items():
+            base_route = base["routes"].get(route)
+            if base_route is None or min(stats["requests"], base_route["requests"]) < min_samples:
+                continue
+            for key in ('p50', 'p95', 'p99'):
+                if stats[key] > base_route[key] * (1 + tolerance) and stats[key] - base_route[key] >= min_delta:
+                    regressions.append(f"{scenario} {route}: {key} {stats[key]}s, baseline {base_route[key]}s")
+            if failure_rate(stats) > failure_rate(base_route) + 0.01:
+                regressions.append(f"{scenario} {route}: {failure_rate(stats):.1%} failed, baseline {failure_rate(base_route):.1%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against a disposable MySQL and the mock AI provider")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--config', default='gthread:4x16', help="Server configuration, WORKER_CLASS:WORKERS[xTHREADS] as in bench_server.py")
+    parser.add_argument('--requests', type=int, default=500, help="Flows per scenario (a flow is one to three requests)")
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent clients")
+    parser.add_argument('--users', type=int, default=1000, help="Synthetic users to seed")
+    parser.add_argument('--mysql', choices=['auto', 'local', 'docker', 'external'], default='auto')
+    parser.add_argument('--db-name', default='smartcareer_loadtest', help="Database created for the run")
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline to compare with (default: loadtest_baseline.json, if it exists)")
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown relative to the baseline")
+    parser.add_argument('--min-delta', type=float, default=0.02, help="Latency differences below this many seconds are never regressions")
+    parser.add_argument('--min-samples', type=int, default=20, help="Routes with fewer requests than this are not compared")
+    parser.add_argument('--report', help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    data = SyntheticData()
+    data.add_users(0, args.users, random.Random(f"{args.seed}-data"), 0.2)
+    dataset = Dataset(args.users, sorted(data.attachments))
+    flows = {scenario: build_flows(scenario, args.requests, dataset, args.seed) for scenario in args.scenarios}
+    # The users whose password or email the flows change
+    data.add_users(args.users, dataset.accounts, random.Random(f"{args.seed}-accounts"), 0.0)
+
+    database = DisposableMySQL(args.mysql)
+    upload_dir = tempfile.mkdtemp(prefix='smartcareer-uploads-')
+    server = None
+    process = None
+    scenarios = {}
+    try:
+        server = database.start()
+        create_database(server, args.db_name)
+        seed_database(server, args.db_name, data, upload_dir)
+
+        # gunicorn inherits these (see bench_server.server_env)
+        os.environ.update({
+            'DB_HOST': server['host'],
+            'DB_PORT': str(server['port']),
+            'DB_USER': server['user'],
+            'DB_PASSWORD': server['password'],
+            'DB_NAME': args.db_name,
+            'UPLOAD_FOLDER': upload_dir,
+        })
+        log_path = os.path.join(BASE_DIR, f"loadtest_{args.config.replace(':', '_')}.log")
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            logger.info(f"Starting gunicorn with {args.config} (log: {log_path})")
+            process, url = start_server(args.config, args.port, log_file)
+            for scenario in args.scenarios:
+                results, elapsed = run_flows(url, flows[scenario], args.concurrency)
+                scenarios[scenario] = summarize(results, elapsed)
+                logger.info(f"{scenario}: {scenarios[scenario]['requests_per_second']} requests/s, "
+                            f"{scenarios[scenario]['failed']} failed")
+    finally:
+        if process is not None:
+            stop_server(process)
+        if server is not None and database.kind == 'external':
+            try:
+                drop_database(server, args.db_name)
+            except mysql.connector.Error as e:
+                logger.error(f"Could not drop {args.db_name}: {e}")
+        database.stop()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    report = {
+        "config": args.config,
+        "users": args.users,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "seed": args.seed,
+        "mock_latency_median": float(os.getenv('AI_MOCK_LATENCY_MEDIAN', config.AI_MOCK_LATENCY_MEDIAN)),
+        "scenarios": scenarios,
+    }
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.report}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        logger.info(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance, args.min_delta, args.min_samples)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    logger.info(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
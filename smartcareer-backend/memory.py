@@ -0,0 +1,320 @@
+"""
+Memory inspection and RSS growth alarm
+
+The RSS monitor counts requests and reads the process's resident set size
+every MEMORY_RSS_CHECK_EVERY requests (one small read of /proc/self/statm).
+After MEMORY_RSS_WARMUP_REQUESTS, while the caches are still filling up, it
+logs a warning and counts an alarm whenever RSS grew by more than
+MEMORY_RSS_ALARM_BYTES_PER_REQUEST per request since the previous check.
+With MEMORY_TRACE_ON_ALARM the first alarm also starts tracemalloc and takes
+a snapshot, so the growth that follows can be diffed against it.
+
+The inspector (/api/admin/memory) reports RSS, the entries held by the
+caches, limiters and queues that live as long as the worker, and
+tracemalloc's top allocation sites. Tracing can be started and stopped at
+runtime (or at startup with PYTHONTRACEMALLOC=<frames>); while it runs every
+allocation costs more and the traces take memory of their own, so leave it
+off unless you are looking for a leak. Snapshots are kept in memory, at most
+MEMORY_MAX_SNAPSHOTS of them, and can be diffed against each other or the
+current state.
+
+Everything here is per process: under gunicorn each request to the admin
+endpoints is answered by one worker, whose pid is in the report.
+"""
+
+import datetime
+import gc
+import itertools
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+from collections import Counter, OrderedDict
+import config
+
+try:
+    import resource
+except ImportError:  # Windows; RSS is then unknown unless /proc exists
+    resource = None
+
+logger = logging.getLogger('memory')
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# Our own and the import system's allocations are noise in the top sites
+TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+class TracingNotStarted(Exception):
+    """Raised when a snapshot is asked for while tracemalloc is not tracing"""
+
+def rss_bytes():
+    """Resident set size of this process in bytes, or None where it can't be read"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        # Without /proc only the peak is available: kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return None
+
+class RssMonitor:
+    """Watches RSS growth per request and raises an alarm when it is too steep"""
+
+    def __init__(self, check_every=None, alarm_bytes_per_request=None, warmup_requests=None):
+        self.check_every = check_every or config.MEMORY_RSS_CHECK_EVERY
+        self.alarm_bytes_per_request = alarm_bytes_per_request or config.MEMORY_RSS_ALARM_BYTES_PER_REQUEST
+        self.warmup_requests = config.MEMORY_RSS_WARMUP_REQUESTS if warmup_requests is None else warmup_requests
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.alarms = 0
+        self.last_alarm = None
+        self._last_check = None  # (requests, rss)
+        self._baseline = None    # (requests, rss) at the end of the warm-up
+        self._growth = None      # bytes per request between the last two checks
+
+    def record_request(self):
+        # Not locked: a lost increment only moves the next check by a request
+        self.requests += 1
+        if self.requests % self.check_every == 0:
+            self.check()
+
+    def check(self):
+        """Read RSS and compare its growth since the previous check with the threshold"""
+        rss = rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            requests = self.requests
+            previous, self._last_check = self._last_check, (requests, rss)
+            if requests < self.warmup_requests:
+                return
+            if self._baseline is None:
+                self._baseline = (requests, rss)
+            if previous is None or requests <= previous[0]:
+                return
+            self._growth = (rss - previous[1]) / (requests - previous[0])
+            if self._growth <= self.alarm_bytes_per_request:
+                return
+            self.alarms += 1
+            first_alarm = self.alarms == 1
+            self.last_alarm = {
+                "at": datetime.datetime.now().isoformat(timespec='seconds'),
+                "requests": requests,
+                "rss_bytes": rss,
+                "bytes_per_request": round(self._growth)
+            }
+        logger.warning("RSS grew %.0f bytes per request over the last %s requests (now %.1f MiB, alarm above %s)",
+                       self._growth, requests - previous[0], rss / 1048576, self.alarm_bytes_per_request)
+        if first_alarm and config.MEMORY_TRACE_ON_ALARM and not tracemalloc.is_tracing():
+            start_tracing()
+            take_snapshot('rss alarm')
+
+    def stats(self):
+        with self._lock:
+            requests = self.requests
+            baseline = self._baseline
+            last_check = self._last_check
+            since_warmup = None
+            if baseline is not None and last_check is not None and last_check[0] > baseline[0]:
+                since_warmup = round((last_check[1] - baseline[1]) / (last_check[0] - baseline[0]))
+            return {
+                "requests": requests,
+                "check_every": self.check_every,
+                "warmup_requests": self.warmup_requests,
+                "alarm_bytes_per_request": self.alarm_bytes_per_request,
+                "bytes_per_request": round(self._growth) if self._growth is not None else None,
+                "bytes_per_request_since_warmup": since_warmup,
+                "alarms": self.alarms,
+                "last_alarm": self.last_alarm
+            }
+
+monitor = RssMonitor()
+
+def record_request():
+    monitor.record_request()
+
+_snapshots = OrderedDict()  # id -> (taken_at, label, snapshot)
+_snapshot_ids = itertools.count(1)
+_snapshots_lock = threading.Lock()
+
+def start_tracing(frames=None):
+    """Start tracemalloc, keeping `frames` frames per allocation; returns False if it was already tracing"""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames or config.MEMORY_TRACE_FRAMES)
+    logger.warning("Memory tracing started with %s frames per allocation", tracemalloc.get_traceback_limit())
+    return True
+
+def stop_tracing():
+    """Stop tracemalloc and free its traces; snapshots already taken are kept"""
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    logger.warning("Memory tracing stopped")
+    return True
+
+def take_snapshot(label=None):
+    """Snapshot the traced allocations; returns the snapshot id"""
+    if not tracemalloc.is_tracing():
+        raise TracingNotStarted("Memory tracing is not running")
+    snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    with _snapshots_lock:
+        snapshot_id = next(_snapshot_ids)
+        _snapshots[snapshot_id] = (datetime.datetime.now().isoformat(timespec='seconds'), label, snapshot)
+        while len(_snapshots) > config.MEMORY_MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot_id
+
+def _get_snapshot(snapshot_id):
+    with _snapshots_lock:
+        entry = _snapshots.get(snapshot_id)
+    if entry is None:
+        raise KeyError(snapshot_id)
+    return entry[2]
+
+def _check_group_by(group_by):
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+
+def _site(stat, group_by):
+    site = {
+        "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}" if group_by != 'filename' else stat.traceback[0].filename,
+        "size": stat.size,
+        "count": stat.count
+    }
+    if group_by == 'traceback':
+        site["traceback"] = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        site["size_diff"] = stat.size_diff
+        site["count_diff"] = stat.count_diff
+    return site
+
+def top_sites(snapshot_id, group_by='lineno', limit=None):
+    """The allocation sites holding the most memory in a snapshot (KeyError if there is no such snapshot)"""
+    _check_group_by(group_by)
+    snapshot = _get_snapshot(snapshot_id)
+    stats = snapshot.statistics(group_by)
+    return {
+        "id": snapshot_id,
+        "group_by": group_by,
+        "traced_bytes": sum(stat.size for stat in stats),
+        "sites": [_site(stat, group_by) for stat in stats[:limit or config.MEMORY_TOP_SITES]]
+    }
+
+def diff(snapshot_id, to_id=None, group_by='lineno', limit=None):
+    """
+    The sites whose memory grew most from one snapshot to another, or to
+    now when to_id is None
+    """
+    _check_group_by(group_by)
+    old = _get_snapshot(snapshot_id)
+    if to_id is None:
+        if not tracemalloc.is_tracing():
+            raise TracingNotStarted("Memory tracing is not running")
+        new = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+    else:
+        new = _get_snapshot(to_id)
+    stats = new.compare_to(old, group_by)
+    return {
+        "from": snapshot_id,
+        "to": to_id if to_id is not None else "now",
+        "group_by": group_by,
+        "size_diff": sum(stat.size_diff for stat in stats),
+        "sites": [_site(stat, group_by) for stat in stats[:limit or config.MEMORY_TOP_SITES]]
+    }
+
+def known_structures():
+    """Entries held by the caches, limiters and queues that live as long as the worker"""
+    import ai_provider
+    import compression
+    import metrics
+    import quota
+    import resilience
+    import structured_logging
+
+    structures = {}
+    # Only a provider that is already loaded; loading one here could call the model API
+    provider = ai_provider.loaded_provider()
+    if provider is not None:
+        name = provider.__name__
+        status = provider.status()
+        cache = status.get('cache')
+        if cache:
+            structures[f"{name}.response_cache"] = {"entries": cache['size'], "max_entries": cache['maxsize']}
+            structures[f"{name}.negative_cache"] = {"entries": cache['negative_size'], "max_entries": cache['maxsize']}
+        limiter = status.get('rate_limiter')
+        if limiter:
+            structures[f"{name}.rate_limiter.users"] = {"entries": limiter['tracked_users'], "max_entries": limiter['max_tracked_users']}
+        for task, stats in (status.get('similarity_cache') or {}).items():
+            structures[f"{name}.similarity_cache.{task}"] = {"entries": stats['size'], "max_entries": stats['maxsize']}
+        for key in ('single_flight', 'async_single_flight'):
+            if status.get(key):
+                structures[f"{name}.{key}"] = {"entries": status[key]['in_flight'], "max_entries": None}
+
+    cache = compression.cache_stats()
+    structures["compression.cache"] = {"entries": cache['entries'], "bytes": cache['bytes'], "max_bytes": cache['max_bytes']}
+    structures["metrics.registry"] = {"entries": metrics.registry.size(), "max_entries": None}
+    structures["resilience.breakers"] = {"entries": len(resilience.breaker_stats()), "max_entries": None}
+    if config.AI_QUOTA:
+        ledger = quota.ledger.stats()
+        structures["quota.counters"] = {"entries": ledger['tracked_counters'], "max_entries": None}
+        structures["quota.overrides"] = {"entries": ledger['overrides'], "max_entries": None}
+    structures["structured_logging.queue"] = {"entries": structured_logging.stats()['queued'], "max_entries": config.LOG_QUEUE_SIZE}
+    return structures
+
+def object_types(limit=20):
+    """The most common types among the objects the garbage collector tracks"""
+    counts = Counter(type(obj).__name__ for obj in gc.get_objects())
+    return dict(counts.most_common(limit))
+
+def tracing_stats():
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    traced, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": True,
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_bytes": traced,
+        "peak_traced_bytes": peak,
+        "tracemalloc_bytes": tracemalloc.get_tracemalloc_memory()
+    }
+
+def snapshot_list():
+    with _snapshots_lock:
+        return [{"id": snapshot_id, "taken_at": taken_at, "label": label}
+                for snapshot_id, (taken_at, label, _) in _snapshots.items()]
+
+def report():
+    """Everything /api/admin/memory shows for this process"""
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "rss_monitor": monitor.stats(),
+        "tracemalloc": tracing_stats(),
+        "snapshots": snapshot_list(),
+        "structures": known_structures(),
+        "gc": {"counts": gc.get_count(), "uncollectable": len(gc.garbage)},
+        "object_types": object_types()
+    }
+
+def after_fork():
+    """Start a forked worker with its own request count, RSS baseline and no snapshots"""
+    global monitor
+    monitor = RssMonitor()
+    with _snapshots_lock:
+        _snapshots.clear()
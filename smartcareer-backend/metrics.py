@@ -0,0 +1,457 @@
+"""
+Prometheus metrics for GET /metrics
+
+Request, database, model call and upload timings are recorded in a Registry
+in each process: a counter is one number and a histogram a list of bucket
+counts, updated under one lock, so recording a value costs a dictionary
+lookup and an addition. Figures other modules already count (cache hits,
+retries and fallbacks per model, the async MySQL pool, compression) are read
+from their stats() when a snapshot is taken instead of being counted twice.
+
+Each worker process has its own registry. With METRICS_DIR set, every worker
+writes a snapshot there each METRICS_FLUSH_INTERVAL seconds and when it
+exits, and /metrics adds up the snapshots of all workers, whichever worker
+answers the scrape. Counters of workers that have exited (recycled after
+GUNICORN_MAX_REQUESTS) are folded into one retired snapshot so totals never
+go backwards; their gauges are dropped.
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import mysql.connector
+import config
+
+try:
+    import fcntl
+except ImportError:  # Windows; snapshots of exited workers are then merged without a lock
+    fcntl = None
+
+logger = logging.getLogger('metrics')
+
+PREFIX = 'smartcareer_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+AI_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 12, 20, 30, 60)
+UPLOAD_BUCKETS = (10000, 100000, 500000, 1000000, 2000000, 5000000, 10000000)
+
+# name (without PREFIX) -> (type, help, histogram buckets)
+METRICS = {
+    'http_requests_total': ('counter', "HTTP requests by route, method and status", None),
+    'http_request_duration_seconds': ('histogram', "Time until the response was ready to send (streamed bodies: until the first byte)", LATENCY_BUCKETS),
+    'db_connect_duration_seconds': ('histogram', "Time to open a MySQL connection", DB_BUCKETS),
+    'db_connect_errors_total': ('counter', "MySQL connections that could not be opened", None),
+    'db_connections_open': ('gauge', "MySQL connections opened and not closed yet", None),
+    'db_query_duration_seconds': ('histogram', "Time spent in cursor.execute() by caller and statement", DB_BUCKETS),
+    'db_query_errors_total': ('counter', "Statements that raised an error", None),
+    'db_pool_connections': ('gauge', "Connections in the async endpoints' MySQL pools by state", None),
+    'db_pool_max_connections': ('gauge', "Most connections the async endpoints' MySQL pools may open", None),
+    'ai_call_duration_seconds': ('histogram', "Model call attempts by model and outcome", AI_BUCKETS),
+    'ai_retries_total': ('counter', "Model calls retried after a transient error", None),
+    'ai_fallbacks_total': ('counter', "Calls routed to the fallback model while the circuit was open", None),
+    'ai_circuit_open': ('gauge', "Workers whose circuit breaker for the model is open", None),
+    'cache_hits_total': ('counter', "Cache lookups that found an entry", None),
+    'cache_misses_total': ('counter', "Cache lookups that found nothing", None),
+    'cache_hit_ratio': ('gauge', "Hits over lookups since the workers started", None),
+    'cache_entries': ('gauge', "Entries held in the cache", None),
+    'upload_size_bytes': ('histogram', "Sizes of stored uploads", UPLOAD_BUCKETS),
+    'compression_input_bytes_total': ('counter', "Response bytes before compression", None),
+    'compression_output_bytes_total': ('counter', "Response bytes after compression", None),
+    'memory_rss_bytes': ('gauge', "Resident memory of the worker processes", None),
+    'memory_rss_alarms_total': ('counter', "RSS checks that found more growth per request than MEMORY_RSS_ALARM_BYTES_PER_REQUEST", None),
+    'workers': ('gauge', "Worker processes included in this scrape", None),
+}
+
+STATEMENTS = {'select', 'insert', 'update', 'delete', 'replace', 'create', 'alter'}
+
+class Registry:
+    """Counters, gauges and histograms of one process, keyed by (name, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}      # (name, labels) -> number, for counters and gauges
+        self._histograms = {}  # (name, labels) -> [count per bucket..., count above the last, sum]
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = METRICS[name][2]
+        index = bisect.bisect_left(buckets, value)
+        key = (name, labels)
+        with self._lock:
+            counts = self._histograms.get(key)
+            if counts is None:
+                counts = self._histograms[key] = [0] * (len(buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def size(self):
+        """Number of series recorded so far"""
+        with self._lock:
+            return len(self._values) + len(self._histograms)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "values": [[name, labels, value] for (name, labels), value in self._values.items()],
+                "histograms": [[name, labels, list(counts)] for (name, labels), counts in self._histograms.items()]
+            }
+
+registry = Registry()
+
+_writer = None
+_writer_lock = threading.Lock()
+_stop = threading.Event()
+
+def _ensure_writer():
+    # The snapshot thread starts with the first recorded value, so the app can be created before a fork
+    global _writer
+    if _writer is None and config.METRICS_DIR:
+        with _writer_lock:
+            if _writer is None:
+                os.makedirs(config.METRICS_DIR, exist_ok=True)
+                _writer = threading.Thread(target=_write_loop, name='metrics-writer', daemon=True)
+                _writer.start()
+                atexit.register(shutdown)
+
+def inc(name, labels=(), amount=1):
+    if config.METRICS:
+        registry.inc(name, labels, amount)
+        _ensure_writer()
+
+def observe(name, value, labels=()):
+    if config.METRICS:
+        registry.observe(name, value, labels)
+        _ensure_writer()
+
+def observe_request(route, method, status, seconds):
+    observe('http_request_duration_seconds', seconds, (('route', route), ('method', method)))
+    inc('http_requests_total', (('route', route), ('method', method), ('status', str(status))))
+
+def observe_ai_call(model_name, outcome, seconds):
+    observe('ai_call_duration_seconds', seconds, (('model', model_name), ('outcome', outcome)))
+
+def observe_upload(kind, size):
+    observe('upload_size_bytes', size, (('kind', kind),))
+
+def count_cache(cache, hit):
+    inc('cache_hits_total' if hit else 'cache_misses_total', (('cache', cache),))
+
+def statement_type(operation):
+    words = str(operation).lstrip()[:8].split(None, 1)
+    statement = words[0].lower() if words else ''
+    return statement if statement in STATEMENTS else 'other'
+
+class TimedCursor:
+    """A MySQL cursor whose execute() and executemany() calls are timed"""
+
+    def __init__(self, cursor, source):
+        self._cursor = cursor
+        self._source = source
+
+    def _timed(self, method, operation, args, kwargs):
+        started = time.perf_counter()
+        try:
+            return method(operation, *args, **kwargs)
+        except Exception:
+            inc('db_query_errors_total', (('source', self._source),))
+            raise
+        finally:
+            observe('db_query_duration_seconds', time.perf_counter() - started,
+                    (('source', self._source), ('statement', statement_type(operation))))
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.execute, operation, args, kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(self._cursor.executemany, operation, args, kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+class TimedConnection:
+    """A MySQL connection that hands out TimedCursors and counts itself as open until closed"""
+
+    def __init__(self, conn, source):
+        self._conn = conn
+        self._source = source
+        self._open = True
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self._source)
+
+    def close(self):
+        if self._open:
+            self._open = False
+            inc('db_connections_open', (('source', self._source),), -1)
+        return self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+def connect_mysql(source, **kwargs):
+    """mysql.connector.connect() that records the connect time, open connections and query timings"""
+    if not config.METRICS:
+        return mysql.connector.connect(**kwargs)
+    labels = (('source', source),)
+    started = time.perf_counter()
+    try:
+        conn = mysql.connector.connect(**kwargs)
+    except Exception:
+        inc('db_connect_errors_total', labels)
+        raise
+    observe('db_connect_duration_seconds', time.perf_counter() - started, labels)
+    inc('db_connections_open', labels)
+    return TimedConnection(conn, source)
+
+def _cache_values(cache, hits, misses, entries):
+    labels = (('cache', cache),)
+    return [['cache_hits_total', labels, hits], ['cache_misses_total', labels, misses], ['cache_entries', labels, entries]]
+
+def collect():
+    """Figures kept by other modules, as [name, labels, value] entries"""
+    import ai_provider
+    import compression
+    import memory
+    import resilience
+
+    values = []
+    for model_name, stats in resilience.breaker_stats().items():
+        labels = (('model', model_name),)
+        values.append(['ai_retries_total', labels, stats['retries']])
+        values.append(['ai_fallbacks_total', labels, stats['fallbacks']])
+        values.append(['ai_circuit_open', labels, 1 if stats['state'] == 'open' else 0])
+
+    # Only a provider that is already loaded; loading one here could call the model API
+    provider = ai_provider.loaded_provider()
+    if provider is not None:
+        status = provider.status()
+        cache = status.get('cache')
+        if cache:
+            values += _cache_values('ai_response', cache['hits'] + cache['persistent_hits'], cache['misses'], cache['size'])
+        for task, stats in (status.get('similarity_cache') or {}).items():
+            values += _cache_values(f'similarity_{task}', stats['hits'], stats['lookups'] - stats['hits'], stats['size'])
+
+    stats = compression.metrics.as_dict()
+    values += _cache_values('compression', stats['cache_hits'], stats['cache_misses'], compression.cache_stats()['entries'])
+    values.append(['compression_input_bytes_total', (), stats['bytes_in']])
+    values.append(['compression_output_bytes_total', (), stats['bytes_out']])
+
+    # The pool only exists in ASGI workers; don't import aiomysql anywhere else
+    async_db = sys.modules.get('async_db')
+    pool = async_db.pool_stats() if async_db is not None else None
+    if pool is not None:
+        values.append(['db_pool_connections', (('pool', 'async'), ('state', 'idle')), pool['free']])
+        values.append(['db_pool_connections', (('pool', 'async'), ('state', 'in_use')), pool['size'] - pool['free']])
+        values.append(['db_pool_max_connections', (('pool', 'async'),), pool['max']])
+
+    rss = memory.rss_bytes()
+    if rss is not None:
+        values.append(['memory_rss_bytes', (), rss])
+    values.append(['memory_rss_alarms_total', (), memory.monitor.alarms])
+    return values
+
+def snapshot():
+    """This process's metrics, JSON-serializable"""
+    data = registry.snapshot()
+    try:
+        data["values"] += collect()
+    except Exception as e:
+        logger.error("Could not collect metrics: %s", e)
+    data["pid"] = os.getpid()
+    return data
+
+def _key(name, labels):
+    # Labels come back from JSON as lists of lists
+    return name, tuple(tuple(label) for label in labels)
+
+def merge(snapshots):
+    """Add up snapshots: ({(name, labels): value}, {(name, labels): histogram counts})"""
+    values, histograms = {}, {}
+    for data in snapshots:
+        for name, labels, value in data["values"]:
+            key = _key(name, labels)
+            values[key] = values.get(key, 0) + value
+        for name, labels, counts in data["histograms"]:
+            key = _key(name, labels)
+            total = histograms.get(key)
+            histograms[key] = list(counts) if total is None else [a + b for a, b in zip(total, counts)]
+    return values, histograms
+
+def _snapshot_path(pid):
+    return os.path.join(config.METRICS_DIR, f"worker_{pid}.json")
+
+def _write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_snapshot():
+    data = snapshot()
+    _write_json(_snapshot_path(data["pid"]), data)
+    return data
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _retire(retired, data):
+    """Fold an exited worker's counters and histograms into the retired snapshot"""
+    counters = [entry for entry in data["values"] if METRICS.get(entry[0], ('gauge',))[0] == 'counter']
+    values, histograms = merge([retired, {"values": counters, "histograms": data["histograms"]}])
+    return {
+        "values": [[name, labels, value] for (name, labels), value in values.items()],
+        "histograms": [[name, labels, counts] for (name, labels), counts in histograms.items()]
+    }
+
+def shared_snapshots():
+    """Snapshots of every live worker in METRICS_DIR plus the retired totals"""
+    own = write_snapshot()
+    snapshots = [own]
+    retired_path = os.path.join(config.METRICS_DIR, 'retired.json')
+    with open(os.path.join(config.METRICS_DIR, '.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            # Released when the file is closed
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        retired = _read_json(retired_path) or {"values": [], "histograms": []}
+        exited = []
+        for path in glob.glob(os.path.join(config.METRICS_DIR, 'worker_*.json')):
+            pid = int(os.path.basename(path)[len('worker_'):-len('.json')])
+            if pid == own["pid"]:
+                continue
+            data = _read_json(path)
+            if data is None:
+                continue
+            if _is_alive(pid):
+                snapshots.append(data)
+            else:
+                retired = _retire(retired, data)
+                exited.append(path)
+        if exited:
+            _write_json(retired_path, retired)
+            for path in exited:
+                os.remove(path)
+    return snapshots, retired
+
+def clear_snapshots():
+    """Remove the snapshots of an earlier run of the server, before its workers start"""
+    for path in glob.glob(os.path.join(config.METRICS_DIR, '*.json')):
+        os.remove(path)
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    if config.METRICS_DIR:
+        snapshots, retired = shared_snapshots()
+        workers = len(snapshots)
+        snapshots.append(retired)
+    else:
+        snapshots, workers = [snapshot()], 1
+    values, histograms = merge(snapshots)
+    values[('workers', ())] = workers
+
+    # Ratios only make sense over the added-up counts
+    for (name, labels), hits in list(values.items()):
+        if name == 'cache_hits_total':
+            lookups = hits + values.get(('cache_misses_total', labels), 0)
+            values[('cache_hit_ratio', labels)] = round(hits / lookups, 4) if lookups else 0.0
+
+    series = {}
+    for (name, labels), value in values.items():
+        series.setdefault(name, []).append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), counts in histograms.items():
+        lines = series.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(METRICS[name][2] + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(float(counts[-1]))}")
+        lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {cumulative}")
+
+    output = []
+    for name, (kind, help_text, _) in METRICS.items():
+        if name in series:
+            output.append(f"# HELP {PREFIX}{name} {help_text}")
+            output.append(f"# TYPE {PREFIX}{name} {kind}")
+            output.extend(sorted(series[name]) if kind != 'histogram' else series[name])
+    return '\n'.join(output) + '\n'
+
+def _write_loop():
+    # Write once right away, so a new worker shows up in the next scrape
+    while True:
+        try:
+            write_snapshot()
+        except Exception as e:
+            logger.error("Could not write metrics snapshot: %s", e)
+        if _stop.wait(config.METRICS_FLUSH_INTERVAL):
+            return
+
+def after_fork():
+    """Start a forked worker with empty metrics and no snapshot thread"""
+    global registry, _writer, _writer_lock, _stop
+    registry = Registry()
+    _writer = None
+    _writer_lock = threading.Lock()
+    _stop = threading.Event()
+
+def shutdown():
+    """Stop the snapshot thread and write a last snapshot, so the worker's counts outlive it"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is None:
+        return
+    _stop.set()
+    try:
+        write_snapshot()
+    except Exception as e:
+        logger.error("Could not write metrics snapshot: %s", e)
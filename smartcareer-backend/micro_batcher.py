@@ -0,0 +1,122 @@
+"""
+Micro-batching of concurrent calls
+
+Callers submitting items under the same key (e.g. the same model) within a
+short window are grouped into one batch and sent with a single call. The first
+caller of a batch is its leader: it waits up to `max_wait` seconds for others
+to join (or until the batch holds `max_batch_size` items), sends the batch and
+hands every caller its own result or the batch's exception.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger('micro_batcher')
+
+class Batch:
+    """Items collected for one send"""
+
+    def __init__(self, key):
+        self.key = key
+        self.items = []
+        self.deadlines = []
+        self.results = None
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+    def latest_deadline(self):
+        """The deadline of the caller willing to wait longest; the send may use all of it"""
+        deadlines = [d for d in self.deadlines if d is not None]
+        return max(deadlines, key=lambda d: d.remaining()) if deadlines else None
+
+class MicroBatcher:
+    """Group concurrent submit() calls per key into calls of send_batch(key, items, deadline)"""
+
+    def __init__(self, name, send_batch, max_batch_size, max_wait):
+        self.name = name
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self._open = {}
+
+        self.batches = 0
+        self.items = 0
+        self.full_batches = 0
+        self.largest_batch = 0
+        self.errors = 0
+
+    def submit(self, key, item, deadline=None):
+        """
+        Add `item` to the open batch for `key` and return its result. Raises the
+        batch's exception, or TimeoutError if `deadline` passes first.
+        """
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = Batch(key)
+                self._open[key] = batch
+            index = len(batch.items)
+            batch.items.append(item)
+            batch.deadlines.append(deadline)
+            if len(batch.items) >= self.max_batch_size:
+                # Closed: later callers start a new batch
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            self._run(batch)
+        else:
+            timeout = deadline.remaining() if deadline is not None else None
+            if not batch.done.wait(timeout):
+                raise TimeoutError(f"Timed out waiting for a batched {self.name} call")
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
+
+    def _run(self, batch):
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            if self._open.get(batch.key) is batch:
+                del self._open[batch.key]
+            size = len(batch.items)
+
+        started = time.monotonic()
+        try:
+            results = self.send_batch(batch.key, list(batch.items), batch.latest_deadline())
+            if len(results) != size:
+                raise ValueError(f"Batched {self.name} call returned {len(results)} results for {size} items")
+            batch.results = results
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.largest_batch = max(self.largest_batch, size)
+            if size >= self.max_batch_size:
+                self.full_batches += 1
+            if batch.error is not None:
+                self.errors += 1
+        logger.info("Sent batch of %s %s items for %s in %.2fs", size, self.name, batch.key, time.monotonic() - started)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000),
+                "open_batches": len(self._open),
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "full_batches": self.full_batches,
+                "errors": self.errors
+            }
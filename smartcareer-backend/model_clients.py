@@ -0,0 +1,317 @@
+"""
+Model clients used by the Gemini AI service
+
+A model client does one thing: send a prompt to a model and return the text,
+either all at once (generate, or agenerate on an asyncio event loop) or in
+chunks (stream). Caching, rate limiting,
+retries, breakers and parsing stay in ai_service_gemini, so they behave the
+same whichever client is plugged in:
+  - GeminiModelClient    the real Gemini API
+  - MockModelClient      canned answers with seeded latency and error rates,
+                         for offline development and load tests
+  - RecordingModelClient calls Gemini and writes every answer to a fixture file
+  - ReplayModelClient    answers from those fixture files, no network needed
+
+config.AI_PROVIDER picks the client (gemini, mock, record or replay).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import config
+
+logger = logging.getLogger('model_clients')
+
+class ServiceUnavailable(Exception):
+    """Simulated transient provider error (retryable, like a real 503)"""
+    code = 503
+
+class FixtureNotFound(Exception):
+    """Raised in replay mode when no fixture was recorded for a prompt"""
+
+def fixture_key(prompt, model_name):
+    return hashlib.sha256(f"{model_name}\n{prompt}".encode('utf-8')).hexdigest()
+
+class GeminiModelClient:
+    """The Gemini API through google-generativeai"""
+
+    name = 'gemini'
+
+    def __init__(self):
+        import google.generativeai as genai
+        self.genai = genai
+
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            logger.error("Gemini API key not found in environment variables")
+            raise ValueError("Missing GEMINI_API_KEY in .env file")
+        elif api_key == 'your_api_key_here':
+            logger.error("Default API key detected. Please update with actual Gemini API key")
+            raise ValueError("Please update GEMINI_API_KEY in .env file with your actual API key")
+
+        genai.configure(api_key=api_key)
+
+        # Test the API key by making a simple request
+        model = genai.GenerativeModel(config.DEFAULT_MODEL)
+        test_response = model.generate_content("Test")
+        if test_response and test_response.text:
+            logger.info("Gemini client initialized and tested successfully")
+        else:
+            raise ValueError("API key validation failed")
+
+    def generate(self, prompt, model_name, generation_config, timeout):
+        model = self.genai.GenerativeModel(model_name)
+        response = model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": timeout}
+        )
+        if not response or not response.text:
+            logger.error("Empty response received from Gemini API")
+            raise Exception("Empty response from AI service")
+        return response.text
+
+    async def agenerate(self, prompt, model_name, generation_config, timeout):
+        model = self.genai.GenerativeModel(model_name)
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=generation_config,
+            request_options={"timeout": timeout}
+        )
+        if not response or not response.text:
+            logger.error("Empty response received from Gemini API")
+            raise Exception("Empty response from AI service")
+        return response.text
+
+    def stream(self, prompt, model_name, generation_config, timeout):
+        model = self.genai.GenerativeModel(model_name)
+        response = model.generate_content(
+            prompt,
+            generation_config=generation_config,
+            stream=True,
+            request_options={"timeout": timeout}
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+MOCK_RESUME_FEEDBACK = [
+    {
+        "general": "Your profile shows steady hands-on experience. Lead with measurable results and keep each entry focused on your own contribution.",
+        "strengths": "• Practical internship experience\n• Relevant technical skills\n• Evidence of continuous learning",
+        "improvements": "• Quantify the impact of your work\n• Add links to projects\n• Tailor the summary to each role"
+    },
+    {
+        "general": "A solid early-career profile. The skills section is strong, but the experience entries need more detail about outcomes.",
+        "strengths": "• Clear progression between roles\n• Certifications back up your skills\n• Good mix of team and solo work",
+        "improvements": "• Describe results, not tasks\n• Group skills by area\n• Remove outdated entries"
+    },
+]
+MOCK_CAREER_ADVICE = [
+    {
+        "certifications": "AWS Cloud Practitioner, Google Data Analytics",
+        "skills": "SQL, Python, data visualization, communication",
+        "tips": "• Build a portfolio project\n• Network with alumni\n• Practice behavioral interviews"
+    },
+    {
+        "certifications": "Scrum Master (PSM I), Azure Fundamentals",
+        "skills": "System design, testing, Git, public speaking",
+        "tips": "• Contribute to open source\n• Ask for referrals\n• Prepare STAR stories"
+    },
+]
+MOCK_ROADMAPS = [
+    "Junior Data Analyst\n\nLearn SQL and dashboards. Analyze real datasets and build a portfolio with 2-3 projects.\n\n"
+    "Data Analyst\n\nOwn reporting for a team. Automate pipelines in Python and present insights to stakeholders.\n\n"
+    "Senior Data Analyst\n\nLead analytics projects, mentor juniors and define metrics with product managers.",
+    "Junior Software Developer\n\nMaster one language and Git. Ship small features and learn code review.\n\n"
+    "Software Developer\n\nDesign components end to end, write tests and improve performance of services.\n\n"
+    "Senior Software Developer\n\nLead technical design, mentor the team and drive reliability improvements.",
+]
+
+class MockModelClient:
+    """
+    Deterministic local stand-in for Gemini.
+
+    The answer depends only on the prompt. Latency is log-normal around
+    AI_MOCK_LATENCY_MEDIAN, and a share of calls fail with a retryable error
+    or a timeout; both come from one RNG seeded with AI_MOCK_SEED.
+    """
+
+    name = 'mock'
+
+    def __init__(self, latency_median=None, latency_sigma=None, error_rate=None, timeout_rate=None, seed=None):
+        self.latency_median = config.AI_MOCK_LATENCY_MEDIAN if latency_median is None else latency_median
+        self.latency_sigma = config.AI_MOCK_LATENCY_SIGMA if latency_sigma is None else latency_sigma
+        self.error_rate = config.AI_MOCK_ERROR_RATE if error_rate is None else error_rate
+        self.timeout_rate = config.AI_MOCK_TIMEOUT_RATE if timeout_rate is None else timeout_rate
+        self._random = random.Random(config.AI_MOCK_SEED if seed is None else seed)
+        self._lock = threading.Lock()
+        logger.info("Using mock model client (median latency %ss, error rate %s, timeout rate %s)",
+                    self.latency_median, self.error_rate, self.timeout_rate)
+
+    def response_for(self, prompt):
+        """Canned answer for whichever task the prompt asks for"""
+        choice = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+        if '"certifications"' in prompt:
+            return json.dumps(MOCK_CAREER_ADVICE[choice % len(MOCK_CAREER_ADVICE)], ensure_ascii=False)
+        if '"general"' in prompt:
+            return json.dumps(MOCK_RESUME_FEEDBACK[choice % len(MOCK_RESUME_FEEDBACK)], ensure_ascii=False)
+        return MOCK_ROADMAPS[choice % len(MOCK_ROADMAPS)]
+
+    def _draw(self):
+        """Latency and outcome ('ok', 'error' or 'timeout') for one call"""
+        with self._lock:
+            latency = self.latency_median * math.exp(self.latency_sigma * self._random.gauss(0, 1))
+            roll = self._random.random()
+        if roll < self.timeout_rate:
+            return latency, 'timeout'
+        if roll < self.timeout_rate + self.error_rate:
+            return latency, 'error'
+        return latency, 'ok'
+
+    def _wait(self, latency, outcome, timeout, model_name):
+        if outcome == 'timeout' or (timeout is not None and latency > timeout):
+            time.sleep(timeout if timeout is not None else latency)
+            raise TimeoutError(f"Mock model {model_name} timed out")
+        time.sleep(latency)
+        if outcome == 'error':
+            raise ServiceUnavailable(f"Mock model {model_name} unavailable")
+
+    def generate(self, prompt, model_name, generation_config, timeout):
+        latency, outcome = self._draw()
+        self._wait(latency, outcome, timeout, model_name)
+        return self.response_for(prompt)
+
+    async def agenerate(self, prompt, model_name, generation_config, timeout):
+        latency, outcome = self._draw()
+        if outcome == 'timeout' or (timeout is not None and latency > timeout):
+            await asyncio.sleep(timeout if timeout is not None else latency)
+            raise TimeoutError(f"Mock model {model_name} timed out")
+        await asyncio.sleep(latency)
+        if outcome == 'error':
+            raise ServiceUnavailable(f"Mock model {model_name} unavailable")
+        return self.response_for(prompt)
+
+    def stream(self, prompt, model_name, generation_config, timeout):
+        latency, outcome = self._draw()
+        # A third of the latency goes to the first chunk, the rest is spread over the others
+        self._wait(latency / 3, outcome, timeout, model_name)
+        text = self.response_for(prompt)
+        chunks = [text[i:i + 40] for i in range(0, len(text), 40)]
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(latency * 2 / 3 / len(chunks))
+            yield chunk
+
+class RecordingModelClient:
+    """Wraps another client and saves each answer to AI_FIXTURE_DIR"""
+
+    name = 'record'
+
+    def __init__(self, client, fixture_dir=None):
+        self.client = client
+        self.fixture_dir = fixture_dir or config.AI_FIXTURE_DIR
+        os.makedirs(self.fixture_dir, exist_ok=True)
+        logger.info("Recording model responses to %s", self.fixture_dir)
+
+    def _save(self, prompt, model_name, response, latency, chunks=None):
+        fixture = {
+            "model": model_name,
+            "prompt": prompt,
+            "response": response,
+            "latency": round(latency, 3),
+        }
+        if chunks is not None:
+            fixture["chunks"] = chunks
+        path = os.path.join(self.fixture_dir, f"{fixture_key(prompt, model_name)}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def generate(self, prompt, model_name, generation_config, timeout):
+        started = time.monotonic()
+        response = self.client.generate(prompt, model_name, generation_config, timeout)
+        self._save(prompt, model_name, response, time.monotonic() - started)
+        return response
+
+    async def agenerate(self, prompt, model_name, generation_config, timeout):
+        started = time.monotonic()
+        response = await self.client.agenerate(prompt, model_name, generation_config, timeout)
+        self._save(prompt, model_name, response, time.monotonic() - started)
+        return response
+
+    def stream(self, prompt, model_name, generation_config, timeout):
+        started = time.monotonic()
+        chunks = []
+        for chunk in self.client.stream(prompt, model_name, generation_config, timeout):
+            chunks.append(chunk)
+            yield chunk
+        self._save(prompt, model_name, "".join(chunks), time.monotonic() - started, chunks=chunks)
+
+class ReplayModelClient:
+    """Answers from recorded fixtures, optionally at the recorded latency"""
+
+    name = 'replay'
+
+    def __init__(self, fixture_dir=None, replay_latency=None):
+        self.fixture_dir = fixture_dir or config.AI_FIXTURE_DIR
+        self.replay_latency = config.AI_REPLAY_LATENCY if replay_latency is None else replay_latency
+        logger.info("Replaying model responses from %s", self.fixture_dir)
+
+    def _load(self, prompt, model_name):
+        path = os.path.join(self.fixture_dir, f"{fixture_key(prompt, model_name)}.json")
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise FixtureNotFound(f"No recorded response for this prompt and model {model_name}")
+
+    def _sleep(self, seconds, timeout, model_name):
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Replayed call to {model_name} exceeded the timeout")
+        time.sleep(seconds)
+
+    def generate(self, prompt, model_name, generation_config, timeout):
+        fixture = self._load(prompt, model_name)
+        if self.replay_latency:
+            self._sleep(fixture.get("latency", 0), timeout, model_name)
+        return fixture["response"]
+
+    async def agenerate(self, prompt, model_name, generation_config, timeout):
+        fixture = self._load(prompt, model_name)
+        latency = fixture.get("latency", 0) if self.replay_latency else 0
+        if timeout is not None and latency > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"Replayed call to {model_name} exceeded the timeout")
+        await asyncio.sleep(latency)
+        return fixture["response"]
+
+    def stream(self, prompt, model_name, generation_config, timeout):
+        fixture = self._load(prompt, model_name)
+        chunks = fixture.get("chunks") or [fixture["response"]]
+        delay = fixture.get("latency", 0) / len(chunks) if self.replay_latency else 0
+        for chunk in chunks:
+            if delay:
+                self._sleep(delay, timeout, model_name)
+            yield chunk
+
+def create_model_client(provider=None):
+    """Build the model client for config.AI_PROVIDER (or `provider`)"""
+    provider = provider or config.AI_PROVIDER
+    if provider == 'gemini':
+        return GeminiModelClient()
+    if provider == 'mock':
+        return MockModelClient()
+    if provider == 'record':
+        return RecordingModelClient(GeminiModelClient())
+    if provider == 'replay':
+        return ReplayModelClient()
+    raise ValueError(f"Unknown model client for AI provider: {provider}")
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Batch Precomputation of AI Results for SmartCareer
+
+Generates every user's resume feedback, career advice and roadmap ahead of
+time (nightly, or before a cohort launch) so the app serves them from
+ai_precomputed_results instead of calling the model while the user waits.
+
+  - users are streamed from MySQL with an unbuffered (server-side) cursor, so
+    memory use does not grow with the number of users
+  - a task is skipped when the user's current profile fingerprint already has
+    a stored result younger than AI_PRECOMPUTE_MAX_AGE
+  - users are processed on a bounded thread pool; every model call still goes
+    through the provider's rate limiter, so the batch stays inside
+    MAX_REQUESTS_PER_MINUTE together with everything else in this process
+  - progress is checkpointed after each user; --resume continues after the
+    last user below which everything was processed
+  - the run ends with a report of throughput, latency percentiles and
+    estimated token cost (--report also writes it as JSON)
+
+Usage:
+  python precompute_all.py [--concurrency 4] [--resume] [--limit 1000] [--report report.json]
+  python precompute_all.py --provider mock      # benchmark against the local mock model
+
+Note: Make sure your MySQL server is running and the AI tables exist
+(python update_database.py) before running the batch.
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector
+import config
+import ai_jobs
+import ai_precompute
+import prompt_builder
+from deadline import Deadline
+
+logging.basicConfig(
+    level=logging.INFO,
+    format=config.LOG_FORMAT,
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger('precompute_all')
+
+stop_event = threading.Event()
+
+def stream_users(start_after=0, fetch_size=500):
+    """Yield (user_id, email) in id order without loading the whole table"""
+    # consume_results lets the connection close cleanly when we stop early
+    conn = mysql.connector.connect(**config.DB_CONFIG, consume_results=True)
+    try:
+        # Unbuffered: rows are read from the server as we go
+        cursor = conn.cursor(buffered=False)
+        # The server waits on us while the pool is busy; don't let it drop the result set
+        cursor.execute("SET SESSION net_write_timeout = 3600")
+        cursor.execute("SELECT id, email FROM users WHERE id > %s ORDER BY id", (start_after,))
+        while not stop_event.is_set():
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+        cursor.close()
+    finally:
+        conn.close()
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+class Checkpoint:
+    """
+    Tracks the highest user id below which every user has been processed.
+    Users finish out of order on the pool, so ids are only released from the
+    front of the submission order.
+    """
+
+    def __init__(self, path, write_interval=5.0):
+        self.path = path
+        self.write_interval = write_interval
+        self.position = 0
+        self._lock = threading.Lock()
+        self._submitted = deque()
+        self._finished = set()
+        self._last_write = 0.0
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.position = json.load(f).get('last_user_id', 0)
+        except FileNotFoundError:
+            self.position = 0
+        return self.position
+
+    def submitted(self, user_id):
+        with self._lock:
+            self._submitted.append(user_id)
+
+    def finished(self, user_id):
+        with self._lock:
+            self._finished.add(user_id)
+            while self._submitted and self._submitted[0] in self._finished:
+                self.position = self._submitted.popleft()
+                self._finished.discard(self.position)
+            if time.monotonic() - self._last_write >= self.write_interval:
+                self._write()
+
+    def save(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"last_user_id": self.position, "updated_at": time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+        os.replace(tmp_path, self.path)
+        self._last_write = time.monotonic()
+
+class BatchStats:
+    """Counters and per-task latencies shared by the pool threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.users = 0
+        self.users_up_to_date = 0
+        self.users_missing = 0
+        self.generated = 0
+        self.up_to_date = 0
+        self.failed = 0
+        self.output_tokens = 0
+        self.latencies = {task: [] for task in ai_jobs.AI_TASKS}
+
+    def record_user(self, outcome):
+        with self._lock:
+            self.users += 1
+            if outcome == 'up_to_date':
+                self.users_up_to_date += 1
+            elif outcome == 'missing':
+                self.users_missing += 1
+
+    def record_task(self, task, outcome, seconds=None, result=None):
+        with self._lock:
+            if outcome == 'generated':
+                self.generated += 1
+                self.latencies[task].append(seconds)
+                self.output_tokens += prompt_builder.estimate_tokens(json.dumps(result, ensure_ascii=False))
+            elif outcome == 'up_to_date':
+                self.up_to_date += 1
+            else:
+                self.failed += 1
+
+    def report(self, input_tokens, provider):
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            tasks = {}
+            all_latencies = []
+            for task, values in self.latencies.items():
+                values = sorted(values)
+                all_latencies.extend(values)
+                tasks[task] = {
+                    "generated": len(values),
+                    "p50": round(percentile(values, 50), 3),
+                    "p95": round(percentile(values, 95), 3),
+                    "p99": round(percentile(values, 99), 3),
+                    "max": round(values[-1], 3) if values else 0.0,
+                }
+            all_latencies.sort()
+
+            input_cost = input_tokens / 1_000_000 * config.AI_INPUT_COST_PER_MILLION_TOKENS
+            output_cost = self.output_tokens / 1_000_000 * config.AI_OUTPUT_COST_PER_MILLION_TOKENS
+            return {
+                "provider": provider,
+                "elapsed_seconds": round(elapsed, 2),
+                "users": self.users,
+                "users_up_to_date": self.users_up_to_date,
+                "users_missing": self.users_missing,
+                "tasks_generated": self.generated,
+                "tasks_up_to_date": self.up_to_date,
+                "tasks_failed": self.failed,
+                "users_per_second": round(self.users / elapsed, 2) if elapsed else 0.0,
+                "generations_per_second": round(self.generated / elapsed, 2) if elapsed else 0.0,
+                "latency": {
+                    "p50": round(percentile(all_latencies, 50), 3),
+                    "p95": round(percentile(all_latencies, 95), 3),
+                    "p99": round(percentile(all_latencies, 99), 3),
+                    "tasks": tasks,
+                },
+                # Estimates: tokens from prompt/answer length, cache hits counted as if billed
+                "estimated_cost": {
+                    "input_tokens": input_tokens,
+                    "output_tokens": self.output_tokens,
+                    "usd": round(input_cost + output_cost, 4),
+                },
+            }
+
+def process_user(email, handlers, stats, force=False):
+    """
+    Generate and store whichever of the user's results are missing or stale.
+    Returns False if the batch was stopped before every task was handled.
+    """
+    user_data = ai_precompute.read_profile(email)
+    if user_data is None:
+        stats.record_user('missing')
+        return True
+
+    fingerprint = ai_precompute.profile_fingerprint(user_data)
+    generated_any = False
+    for task, handler in handlers.items():
+        if stop_event.is_set():
+            return False
+        if not force and ai_precompute.get_result(email, task, fingerprint) is not None:
+            stats.record_task(task, 'up_to_date')
+            continue
+
+        generated_any = True
+        started = time.monotonic()
+        try:
+            result = handler(user_data, deadline=Deadline(config.AI_WORKER_JOB_TIMEOUT))
+            if not ai_precompute.store_result(user_data, task, fingerprint, result):
+                raise RuntimeError("generation returned the fallback response")
+            stats.record_task(task, 'generated', time.monotonic() - started, result)
+        except Exception as e:
+            logger.error(f"Could not precompute {task} for {email}: {e}")
+            stats.record_task(task, 'failed')
+
+    stats.record_user('generated' if generated_any else 'up_to_date')
+    return True
+
+def run(args):
+    # The provider is chosen before it is imported, so --provider mock needs no API key
+    if args.provider:
+        config.AI_PROVIDER = args.provider
+    import ai_provider
+    handlers = ai_provider.get_task_handlers()
+    if args.tasks:
+        handlers = {task: handlers[task] for task in args.tasks}
+
+    checkpoint = Checkpoint(args.checkpoint)
+    start_after = checkpoint.load() if args.resume else 0
+    if start_after:
+        logger.info(f"Resuming after user id {start_after}")
+
+    stats = BatchStats()
+    tokens_before = sum(task["tokens"] for task in prompt_builder.prompt_stats()["tasks"].values())
+    # At most this many users are queued or running at once, so the cursor is
+    # only read as fast as the pool drains
+    slots = threading.BoundedSemaphore(args.concurrency * 2)
+
+    def work(user_id, email):
+        try:
+            # A user that was stopped or failed holds the checkpoint back, so --resume starts from them
+            if process_user(email, handlers, stats, force=args.force):
+                checkpoint.finished(user_id)
+        except Exception as e:
+            logger.error(f"Could not process user {user_id}: {e}")
+        finally:
+            slots.release()
+
+    logger.info(f"Precomputing {', '.join(handlers)} with concurrency={args.concurrency} "
+                f"(provider {config.AI_PROVIDER})")
+    with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix='precompute') as pool:
+        for count, (user_id, email) in enumerate(stream_users(start_after, args.fetch_size), 1):
+            if args.limit and count > args.limit:
+                break
+            while not slots.acquire(timeout=1):
+                if stop_event.is_set():
+                    break
+            if stop_event.is_set():
+                break
+            checkpoint.submitted(user_id)
+            pool.submit(work, user_id, email)
+            if count % 100 == 0:
+                logger.info(f"Queued {count} users, {stats.generated} results generated so far")
+    checkpoint.save()
+
+    input_tokens = sum(task["tokens"] for task in prompt_builder.prompt_stats()["tasks"].values()) - tokens_before
+    report = stats.report(input_tokens, config.AI_PROVIDER)
+    report["checkpoint"] = checkpoint.position
+    return report
+
+def handle_signal(signum, frame):
+    logger.info(f"Received signal {signum}, stopping after in-flight users")
+    stop_event.set()
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute AI results for every SmartCareer user")
+    parser.add_argument('--concurrency', type=int, default=config.AI_WORKER_CONCURRENCY,
+                        help="Users processed in parallel")
+    parser.add_argument('--provider', choices=('gemini', 'huggingface', 'mock', 'record', 'replay'),
+                        help="AI provider to use (default: AI_PROVIDER)")
+    parser.add_argument('--tasks', nargs='+', choices=ai_jobs.AI_TASKS,
+                        help="Only precompute these tasks")
+    parser.add_argument('--limit', type=int, default=0,
+                        help="Stop after this many users (0 = all)")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenerate results even if they are up to date")
+    parser.add_argument('--checkpoint', default=config.AI_PRECOMPUTE_CHECKPOINT,
+                        help="File the progress is saved to")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue after the user id saved in the checkpoint")
+    parser.add_argument('--fetch-size', type=int, default=500,
+                        help="Rows read from the user cursor at a time")
+    parser.add_argument('--report', help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    try:
+        report = run(args)
+    except Exception as e:
+        logger.error(f"Batch precompute failed: {e}")
+        sys.exit(1)
+
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+On-demand request profiling
+
+With PROFILER=true, create_app() installs hooks that profile a request when it
+is sampled (PROFILER_SAMPLE_RATE) or when it carries "X-Profile: 1" together
+with the admin token. Only the thread serving that request is profiled:
+  cprofile  every function call (cProfile); exact call counts and times, but
+            each call costs more, so fast functions look slower than they are
+  sample    the thread's stack every PROFILER_SAMPLE_INTERVAL seconds from a
+            helper thread; little overhead, and the stacks can be drawn as a
+            flame graph
+"X-Profile: cprofile" or "X-Profile: sample" picks the mode for one request.
+At most one request per process is profiled at a time.
+
+Each report is a JSON file with the request, its duration and the top
+functions, next to the raw profile: a .prof file (pstats; snakeviz,
+flameprof) or a .folded file of collapsed stacks (flamegraph.pl,
+speedscope). PROFILER_DIR keeps the newest PROFILER_MAX_REPORTS reports;
+older ones are deleted. Reports are listed at /api/admin/profiles.
+
+With PROFILER=false the hooks are not installed at all.
+"""
+
+import cProfile
+import datetime
+import glob
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+import config
+
+logger = logging.getLogger('profiler')
+
+MODES = ('cprofile', 'sample')
+REPORT_ID = re.compile(r'^\d+-\d+-[0-9a-f]{6}$')
+
+# Only one profile per process at a time: profiles would slow each other down,
+# and since Python 3.12 only one cProfile can be active anyway
+_active = threading.Lock()
+
+def requested_mode(header):
+    """The mode asked for by an X-Profile header value, or None"""
+    if not header:
+        return None
+    header = header.strip().lower()
+    if header in MODES:
+        return header
+    return config.PROFILER_MODE if header in ('1', 'true', 'yes') else None
+
+class StackSampler:
+    """Counts one thread's stacks from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+class RequestProfile:
+    """The profile of one request, started by start() and ended by finish() or stop()"""
+
+    def __init__(self, route, mode, trigger):
+        self.route = route
+        self.mode = mode
+        self.trigger = trigger
+        self.id = f"{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self._profile = None
+        self._sampler = None
+        self._stopped = False
+        if mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler(threading.get_ident(), config.PROFILER_SAMPLE_INTERVAL)
+            self._sampler.start()
+
+    def stop(self):
+        """Stop profiling; returns the seconds profiled, or None if it was already stopped"""
+        if self._stopped:
+            return None
+        self._stopped = True
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._sampler.stop()
+        _active.release()
+        return time.perf_counter() - self._started
+
+    def finish(self, method, path, status):
+        """
+        Stop profiling and save the report in the background, unless a sampled
+        request was too fast to be interesting. Returns True if it is saved.
+        """
+        seconds = self.stop()
+        if seconds is None:
+            return False
+        if self.trigger == 'sampled' and seconds < config.PROFILER_MIN_SECONDS:
+            return False
+        meta = {
+            "id": self.id,
+            "route": self.route,
+            "method": method,
+            "path": path,
+            "status": status,
+            "mode": self.mode,
+            "trigger": self.trigger,
+            "seconds": round(seconds, 4),
+            "started_at": datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            "pid": os.getpid()
+        }
+        # Building the report takes a while for a big profile; the response shouldn't wait for it
+        threading.Thread(target=self._save, args=(meta,), name='profile-writer', daemon=True).start()
+        return True
+
+    def _save(self, meta):
+        try:
+            os.makedirs(config.PROFILER_DIR, exist_ok=True)
+            base = os.path.join(config.PROFILER_DIR, self.id)
+            if self._profile is not None:
+                stats = pstats.Stats(self._profile)
+                stats.dump_stats(f"{base}.prof")
+                meta.update(cprofile_summary(stats, config.PROFILER_TOP_FUNCTIONS))
+            else:
+                with open(f"{base}.folded", 'w', encoding='utf-8') as f:
+                    for stack, count in self._sampler.stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+                meta.update(sample_summary(self._sampler.stacks, config.PROFILER_TOP_FUNCTIONS))
+            # The JSON file is written last; a report is listed once it exists
+            with open(f"{base}.json.tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(f"{base}.json.tmp", f"{base}.json")
+            logger.info("Saved %s profile %s of %s %s (%.3fs)", self.mode, self.id, meta['method'], meta['path'], meta['seconds'])
+            prune()
+        except Exception as e:
+            logger.error("Could not save profile %s: %s", self.id, e)
+
+def start(route, mode=None):
+    """
+    Start profiling the current request if it was requested (mode from
+    requested_mode()) or is sampled. Returns a RequestProfile, or None.
+    """
+    if mode is not None:
+        trigger = 'requested'
+    elif config.PROFILER_SAMPLE_RATE > 0 and random.random() < config.PROFILER_SAMPLE_RATE:
+        trigger, mode = 'sampled', config.PROFILER_MODE
+    else:
+        return None
+    if not _active.acquire(blocking=False):
+        if trigger == 'requested':
+            logger.warning("Not profiling %s: another request is being profiled", route)
+        return None
+    try:
+        return RequestProfile(route, mode, trigger)
+    except Exception:
+        _active.release()
+        raise
+
+def _function_name(func):
+    filename, line, name = func
+    return f"{name} ({os.path.basename(filename)}:{line})" if line else name
+
+def cprofile_summary(stats, limit):
+    """Top functions by cumulative and by own time"""
+    def top(sort_key):
+        stats.sort_stats(sort_key)
+        functions = []
+        for func in stats.fcn_list[:limit]:
+            primitive_calls, calls, own_time, cumulative_time, _ = stats.stats[func]
+            functions.append({
+                "function": _function_name(func),
+                "file": func[0],
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "own_seconds": round(own_time, 6),
+                "cumulative_seconds": round(cumulative_time, 6)
+            })
+        return functions
+
+    return {
+        "total_calls": stats.total_calls,
+        "top_cumulative": top('cumulative'),
+        "top_own": top('tottime')
+    }
+
+def sample_summary(stacks, limit):
+    """Top functions by samples on the stack (inclusive) and at its top (own)"""
+    own = Counter()
+    inclusive = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            inclusive[frame] += count
+    total = sum(stacks.values())
+
+    def top(counter):
+        return [{"function": frame, "samples": count, "share": round(count / total, 4)}
+                for frame, count in counter.most_common(limit)]
+
+    return {
+        "samples": total,
+        "interval": config.PROFILER_SAMPLE_INTERVAL,
+        "top_cumulative": top(inclusive),
+        "top_own": top(own)
+    }
+
+def _report_paths(report_id):
+    base = os.path.join(config.PROFILER_DIR, report_id)
+    return [f"{base}.json", f"{base}.prof", f"{base}.folded"]
+
+def prune(max_reports=None):
+    """Delete the oldest reports beyond PROFILER_MAX_REPORTS (ids start with the time, so names sort by age)"""
+    max_reports = config.PROFILER_MAX_REPORTS if max_reports is None else max_reports
+    reports = sorted(glob.glob(os.path.join(config.PROFILER_DIR, '*.json')),
+                     key=lambda path: int(os.path.basename(path).split('-', 1)[0]))
+    for path in reports[:max(len(reports) - max_reports, 0)]:
+        for report_path in _report_paths(os.path.basename(path)[:-len('.json')]):
+            try:
+                os.remove(report_path)
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+
+def list_reports():
+    """Summaries of the stored reports, newest first"""
+    reports = []
+    for path in glob.glob(os.path.join(config.PROFILER_DIR, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        reports.append({key: report.get(key) for key in
+                        ('id', 'route', 'method', 'path', 'status', 'mode', 'trigger', 'seconds', 'started_at', 'pid')})
+    reports.sort(key=lambda report: int(report['id'].split('-', 1)[0]), reverse=True)
+    return reports
+
+def load_report(report_id):
+    """The full report, or None if there is no such report"""
+    if not REPORT_ID.match(report_id):
+        return None
+    try:
+        with open(_report_paths(report_id)[0], encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def raw_report_path(report_id):
+    """Path of the .prof or .folded file of a report, or None"""
+    if not REPORT_ID.match(report_id):
+        return None
+    for path in _report_paths(report_id)[1:]:
+        if os.path.exists(path):
+            return path
+    return None
+
+def settings():
+    return {
+        "enabled": config.PROFILER,
+        "mode": config.PROFILER_MODE,
+        "sample_rate": config.PROFILER_SAMPLE_RATE,
+        "min_seconds": config.PROFILER_MIN_SECONDS,
+        "max_reports": config.PROFILER_MAX_REPORTS,
+        "active": _active.locked()
+    }
@@ -0,0 +1,312 @@
+"""
+Prompt building with a token budget for the AI services
+
+Every task prompt is a preamble, one canonical rendering of the user's profile
+and the task instructions. The profile is what grows with heavy users, so it is
+fitted into what is left of config.AI_PROMPT_TOKEN_BUDGET:
+  - repeated entries and repeated sentences are dropped
+  - long descriptions are cut at a word boundary
+  - experiences are ranked (most recent and most relevant to the user's skills
+    first) and the lowest ranked ones are shortened to their header line or
+    left out once the budget is used up
+
+Tokens are estimated from the character count, which is close enough for
+budgeting without pulling a tokenizer into the web process.
+"""
+
+import logging
+import math
+import re
+import threading
+import config
+
+logger = logging.getLogger('prompt_builder')
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+ISO_DATE_RE = re.compile(r'\b(\d{4})-(\d{1,2})(?:-\d{1,2})?\b')
+MONTH_YEAR_RE = re.compile(r'\b([A-Za-z]{3})[a-z]*\.?\s+(\d{4})\b')
+YEAR_RE = re.compile(r'\b(19\d{2}|20\d{2})\b')
+ONGOING_RE = re.compile(r'\b(present|current|now|ongoing)\b', re.IGNORECASE)
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+WORD_RE = re.compile(r'[a-z0-9+#]+')
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+def estimate_tokens(text):
+    """Rough token count for a piece of text"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / config.AI_CHARS_PER_TOKEN)
+
+def normalize_text(text):
+    """Collapse whitespace; None becomes an empty string"""
+    return ' '.join(str(text).split()) if text is not None else ''
+
+def truncate_text(text, max_chars):
+    """Cut text to at most max_chars, at a word boundary, marking the cut"""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1].rsplit(' ', 1)[0].rstrip(' ,;:')
+    return cut + '…'
+
+def recency_key(text):
+    """
+    Sort key (year, month) for the latest date mentioned in a date string, so
+    'Jun 2022 - Present' or '2023-05-01' can be compared. (0, 0) if undated.
+    """
+    if not text:
+        return (0, 0)
+    text = str(text)
+    if ONGOING_RE.search(text):
+        return (9999, 0)
+
+    dates = [(int(year), int(month)) for year, month in ISO_DATE_RE.findall(text)]
+    for month, year in MONTH_YEAR_RE.findall(text):
+        if month.lower() in MONTHS:
+            dates.append((int(year), MONTHS[month.lower()]))
+    if not dates:
+        dates = [(int(year), 0) for year in YEAR_RE.findall(text)]
+    return max(dates) if dates else (0, 0)
+
+def get_skills(user_data):
+    """Skills as a de-duplicated list of strings (the app sends a list, a comma separated string or nothing)"""
+    skills = user_data.get('skills') or []
+    if isinstance(skills, str):
+        skills = skills.split(',')
+
+    unique = []
+    seen = set()
+    for skill in skills:
+        skill = normalize_text(skill)
+        if skill and skill.lower() not in seen:
+            seen.add(skill.lower())
+            unique.append(skill)
+    return unique
+
+class Experience:
+    """One internship or milestone reduced to a header line and a description"""
+
+    def __init__(self, header, description, date_text):
+        self.header = header
+        self.description = description
+        self.recency = recency_key(date_text)
+        self.relevance = 0.0
+        self.rank = 0.0
+
+    def render(self, number, with_description=True):
+        if with_description and self.description:
+            return f"{number}. {self.header}: {self.description}"
+        return f"{number}. {self.header}"
+
+def parse_experience(exp):
+    """Turn an internship/milestone dict (or a plain string) into an Experience, or None"""
+    if isinstance(exp, dict):
+        if 'company' in exp:  # It's an internship
+            company = normalize_text(exp.get('company')) or 'Unknown'
+            role = normalize_text(exp.get('role')) or 'Unknown'
+            dates = normalize_text(exp.get('dates'))
+            header = f"{role} at {company}" + (f" ({dates})" if dates else "")
+            return Experience(header, normalize_text(exp.get('description')), dates)
+        if 'title' in exp:  # It's a milestone
+            title = normalize_text(exp.get('title')) or 'Unknown'
+            date = normalize_text(exp.get('date'))
+            header = title + (f" ({date})" if date else "")
+            return Experience(header, normalize_text(exp.get('description')), date)
+        return None
+    text = normalize_text(exp)
+    return Experience(text, '', text) if text else None
+
+def prepare_experiences(experiences, skill_words):
+    """Parse, de-duplicate and rank a list of experiences"""
+    prepared = []
+    seen_entries = set()
+    for exp in experiences or []:
+        item = parse_experience(exp)
+        if item is None:
+            continue
+
+        entry_key = (item.header.lower(), item.description.lower())
+        if entry_key in seen_entries:
+            continue
+        seen_entries.add(entry_key)
+
+        if skill_words:
+            words = set(WORD_RE.findall(f"{item.header} {item.description}".lower()))
+            item.relevance = len(words & skill_words) / len(skill_words)
+        prepared.append(item)
+
+    # Most recent first: the newest entry scores 1, the oldest dated one close to 0
+    by_date = sorted(prepared, key=lambda e: e.recency)
+    for position, item in enumerate(by_date, 1):
+        recency = position / len(by_date) if item.recency != (0, 0) else 0.0
+        item.rank = recency + item.relevance
+    prepared.sort(key=lambda e: (e.rank, e.recency), reverse=True)
+    return prepared
+
+def compact_descriptions(items):
+    """
+    Drop sentences an entry ranked higher already said (copy-pasted
+    descriptions) and cut what is left to AI_PROMPT_MAX_DESCRIPTION_CHARS
+    """
+    seen_sentences = set()
+    for item in sorted(items, key=lambda e: (e.rank, e.recency), reverse=True):
+        sentences = []
+        for sentence in SENTENCE_RE.split(item.description):
+            key = sentence.lower().strip(' .!?')
+            if key and key not in seen_sentences:
+                seen_sentences.add(key)
+                sentences.append(sentence)
+        item.description = truncate_text(' '.join(sentences), config.AI_PROMPT_MAX_DESCRIPTION_CHARS)
+        if item.description.lower() == item.header.lower():
+            item.description = ''
+
+def render_section(items, levels):
+    """Render a ranked list; levels[i] is 2 (full), 1 (header only) or 0 (left out)"""
+    lines = []
+    omitted = 0
+    for item, level in zip(items, levels):
+        if level == 0:
+            omitted += 1
+            continue
+        lines.append(item.render(len(lines) + 1, with_description=level == 2))
+    if omitted:
+        lines.append(f"({omitted} more not shown)")
+    return "\n".join(lines) if lines else "None"
+
+def render_profile(user_data, max_tokens=None):
+    """
+    Canonical profile block shared by every task prompt.
+
+    Returns (text, details). With `max_tokens` the lowest ranked experiences are
+    shortened and then left out until the block fits.
+    """
+    skills = get_skills(user_data)
+    skill_words = set(WORD_RE.findall(' '.join(skills).lower()))
+    internships = prepare_experiences(user_data.get('internships'), skill_words)
+    milestones = prepare_experiences(user_data.get('milestones'), skill_words)
+    compact_descriptions(internships + milestones)
+
+    def render(internship_levels, milestone_levels):
+        # No email or other identifiers: identical profiles share one cache entry
+        return f"""USER PROFILE:
+INTERNSHIPS:
+{render_section(internships, internship_levels)}
+
+SKILLS:
+{', '.join(skills) if skills else 'Not provided'}
+
+MILESTONES:
+{render_section(milestones, milestone_levels)}"""
+
+    internship_levels = [2] * len(internships)
+    milestone_levels = [2] * len(milestones)
+    text = render(internship_levels, milestone_levels)
+
+    if max_tokens is not None and estimate_tokens(text) > max_tokens:
+        # Walk both lists from the lowest ranked entry upwards, first dropping
+        # descriptions, then whole entries
+        ranked = sorted(
+            [(item.rank, internship_levels, i) for i, item in enumerate(internships)] +
+            [(item.rank, milestone_levels, i) for i, item in enumerate(milestones)],
+            key=lambda entry: entry[0]
+        )
+        for target_level in (1, 0):
+            for _, levels, i in ranked:
+                if levels[i] <= target_level:
+                    continue
+                levels[i] = target_level
+                text = render(internship_levels, milestone_levels)
+                if estimate_tokens(text) <= max_tokens:
+                    break
+            if estimate_tokens(text) <= max_tokens:
+                break
+
+    levels = internship_levels + milestone_levels
+    return text, {
+        "experiences": len(levels),
+        "shortened": levels.count(1),
+        "omitted": levels.count(0),
+    }
+
+def format_experiences(experiences):
+    """Format a list of experiences (internships or milestones) into a string, without any budgeting"""
+    if not experiences:
+        return "None"
+
+    formatted = []
+    for idx, exp in enumerate(experiences, 1):
+        if isinstance(exp, dict):
+            if 'company' in exp:  # It's an internship
+                company = exp.get('company', 'Unknown')
+                role = exp.get('role', 'Unknown')
+                dates = exp.get('dates', 'Unknown')
+                description = exp.get('description', 'No description provided')
+                formatted.append(f"{idx}. {role} at {company} ({dates}): {description}")
+            elif 'title' in exp:  # It's a milestone
+                title = exp.get('title', 'Unknown')
+                date = exp.get('date', 'Unknown')
+                description = exp.get('description', 'No description provided')
+                formatted.append(f"{idx}. {title} ({date}): {description}")
+
+    return "\n".join(formatted) if formatted else "None"
+
+def estimate_unbudgeted_tokens(preamble, user_data, instructions):
+    """Tokens the prompt would have taken with every experience written out in full"""
+    skills = user_data.get('skills') or []
+    if isinstance(skills, str):
+        skills = [skills]
+    full_profile = f"""USER PROFILE:
+Email: {user_data.get('email', 'Not provided')}
+
+INTERNSHIPS:
+{format_experiences(user_data.get('internships', []))}
+
+SKILLS:
+{', '.join(str(skill) for skill in skills) or 'Not provided'}
+
+MILESTONES:
+{format_experiences(user_data.get('milestones', []))}"""
+    return estimate_tokens(f"{preamble}\n\n{full_profile}\n\n{instructions}")
+
+def build_prompt(task, preamble, user_data, instructions, budget=None):
+    """
+    Assemble preamble, budgeted profile and instructions into one prompt and
+    record how many tokens the budgeting saved.
+    """
+    budget = config.AI_PROMPT_TOKEN_BUDGET if budget is None else budget
+    fixed_tokens = estimate_tokens(f"{preamble}\n\n\n\n{instructions}")
+    profile, details = render_profile(user_data, max_tokens=max(budget - fixed_tokens, 0))
+    prompt = f"{preamble}\n\n{profile}\n\n{instructions}"
+
+    tokens = estimate_tokens(prompt)
+    saved = max(estimate_unbudgeted_tokens(preamble, user_data, instructions) - tokens, 0)
+    record_prompt(task, tokens, saved, details)
+    logger.info("%s prompt: ~%s tokens, ~%s saved (%s shortened, %s omitted of %s experiences)",
+                task, tokens, saved, details['shortened'], details['omitted'], details['experiences'])
+    return prompt
+
+def record_prompt(task, tokens, saved, details):
+    with _stats_lock:
+        stats = _stats.setdefault(task, {
+            "prompts": 0, "tokens": 0, "tokens_saved": 0, "shortened": 0, "omitted": 0, "max_tokens": 0
+        })
+        stats["prompts"] += 1
+        stats["tokens"] += tokens
+        stats["tokens_saved"] += saved
+        stats["shortened"] += details["shortened"]
+        stats["omitted"] += details["omitted"]
+        stats["max_tokens"] = max(stats["max_tokens"], tokens)
+
+def prompt_stats():
+    """Per-task prompt size and savings since the process started"""
+    with _stats_lock:
+        tasks = {}
+        for task, stats in _stats.items():
+            tasks[task] = dict(stats)
+            tasks[task]["avg_tokens"] = round(stats["tokens"] / stats["prompts"], 1)
+            tasks[task]["avg_tokens_saved"] = round(stats["tokens_saved"] / stats["prompts"], 1)
+    return {"budget": config.AI_PROMPT_TOKEN_BUDGET, "tasks": tasks}
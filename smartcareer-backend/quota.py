@@ -0,0 +1,432 @@
+"""
+Per-user daily AI quotas
+
+Each user may run config.AI_QUOTA_DAILY_LIMITS[task] AI generations per task
+per day; admins can override that per user in `ai_quota_overrides`. Counting
+happens in memory so enforcing a quota never touches MySQL on the request
+path; a background thread does that:
+  - it loads the overrides when it starts
+  - the first time a user/task is seen on a given day, it reads that day's
+    count from the `ai_quota_ledger` table
+  - every AI_QUOTA_FLUSH_INTERVAL seconds it adds the queued increments to the
+    ledger in one batched statement, then re-reads today's counts, so each
+    process also sees what other processes used, and reloads the overrides
+
+A generation is charged up front, so concurrent requests can't overrun the
+limit, and refunded unless a model actually answered: answers from a cache,
+from an identical in-flight request or the fallback response cost nothing.
+The AI handlers meter that with start_metering(); the providers call
+record_model_call() when a model answers. Profile edits that queue
+precompute jobs are counted under the PRECOMPUTE task, once per round.
+
+Until a user's count has been read, and between two flushes, several
+processes can each let a user slightly past the limit; for capping spend that
+is close enough.
+"""
+
+import atexit
+import contextvars
+import datetime
+import logging
+import threading
+import time
+import mysql.connector
+import config
+import metrics
+
+logger = logging.getLogger('quota')
+
+# Override rows with task '*' apply to every task
+ALL_TASKS = '*'
+
+# Task charged for each round of regeneration jobs a profile edit queues (ai_precompute.py)
+PRECOMPUTE = 'precompute'
+
+CREATE_AI_QUOTA_LEDGER_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_quota_ledger (
+        email VARCHAR(255) NOT NULL,
+        task VARCHAR(32) NOT NULL,
+        day DATE NOT NULL,
+        used INT NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL,
+        PRIMARY KEY (email, task, day),
+        KEY idx_ai_quota_ledger_day (day)
+    )
+"""
+
+CREATE_AI_QUOTA_OVERRIDES_TABLE = """
+    CREATE TABLE IF NOT EXISTS ai_quota_overrides (
+        email VARCHAR(255) NOT NULL,
+        task VARCHAR(32) NOT NULL,
+        daily_limit INT NOT NULL,
+        reason VARCHAR(255),
+        updated_at DATETIME NOT NULL,
+        PRIMARY KEY (email, task)
+    )
+"""
+
+class Meter:
+    """Model calls that answered for one request"""
+
+    def __init__(self):
+        self.model_calls = 0
+
+# Shared by the threads a request's calls run on (hedging, asyncio.to_thread
+# copy the context, and with it the same Meter)
+_meter = contextvars.ContextVar('quota_meter', default=None)
+
+def start_metering():
+    """Count the model calls made for the current request from here on"""
+    meter = Meter()
+    _meter.set(meter)
+    return meter
+
+def record_model_call():
+    """Called by the providers when a model answered; counts for the request being metered, if any"""
+    meter = _meter.get()
+    if meter is not None:
+        meter.model_calls += 1
+
+class QuotaExceeded(Exception):
+    """Raised when a user has used up a task's daily quota"""
+
+    def __init__(self, status):
+        super().__init__(f"Daily AI quota of {status['limit']} exceeded for {status['task']}")
+        self.status = status
+
+def get_db_connection():
+    try:
+        return metrics.connect_mysql('quota', **config.DB_CONFIG)
+    except mysql.connector.Error as err:
+        logger.error("Database connection error: %s", err)
+        raise
+
+def seconds_until_reset(now=None):
+    """Seconds until the quota day ends (local midnight)"""
+    now = now or datetime.datetime.now()
+    tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+    return int((tomorrow - now).total_seconds())
+
+class QuotaLedger:
+    """In-memory quota counters with write-behind flushes to MySQL"""
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval or config.AI_QUOTA_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._used = {}       # (email, task, day) -> count including our unflushed increments
+        self._pending = {}    # (email, task, day) -> increments not yet in the ledger
+        self._overrides = {}  # (email, task) -> daily limit (negative: unlimited)
+        self._unread = set()  # keys whose count hasn't been read from the ledger yet
+        self._started = False
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+        self.consumed = 0
+        self.refunded = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+
+    def _ensure_started(self):
+        """Start the flush thread on first use (after any fork); it loads the overrides"""
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._thread = threading.Thread(target=self._flush_loop, name='quota-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def after_fork(self):
+        """Start over in a forked worker: the parent's flush thread and queued increments stay with the parent"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._started = False
+        self._used = {}
+        self._pending = {}
+        self._unread = set()
+
+    def limit_for(self, email, task):
+        """The user's daily limit for a task, or None if unlimited"""
+        override = self._overrides.get((email, task), self._overrides.get((email, ALL_TASKS)))
+        limit = override if override is not None else config.AI_QUOTA_DAILY_LIMITS.get(task, config.AI_QUOTA_DAILY_LIMIT)
+        return None if limit < 0 else limit
+
+    def _status(self, email, task, used):
+        limit = self.limit_for(email, task)
+        return {
+            "task": task,
+            "limit": limit,
+            "used": used,
+            "remaining": None if limit is None else max(limit - used, 0),
+            "reset_seconds": seconds_until_reset(),
+        }
+
+    def _track(self, key):
+        """
+        Start counting a key the first time it is seen; the flush thread reads
+        its count from the ledger. Call with the lock held.
+        """
+        if key not in self._used:
+            self._used[key] = 0
+            self._unread.add(key)
+            self._wake.set()
+
+    def consume(self, email, task):
+        """Count one generation, or raise QuotaExceeded. Returns the quota status after it."""
+        self._ensure_started()
+        email = email.strip().lower()
+        key = (email, task, datetime.date.today())
+        with self._lock:
+            self._track(key)
+            used = self._used[key]
+            status = self._status(email, task, used)
+            if status["limit"] is not None and used >= status["limit"]:
+                self.rejected += 1
+                raise QuotaExceeded(status)
+            self._used[key] = used + 1
+            self._pending[key] = self._pending.get(key, 0) + 1
+            self.consumed += 1
+            return self._status(email, task, used + 1)
+
+    def refund(self, email, task):
+        """Give back one generation counted by consume(). Returns the quota status after it."""
+        email = email.strip().lower()
+        key = (email, task, datetime.date.today())
+        with self._lock:
+            self._track(key)
+            if self._used[key] == 0:
+                # Charged yesterday: today's count has nothing to give back
+                return self._status(email, task, 0)
+            used = self._used[key] - 1
+            self._used[key] = used
+            # Negative when the increment was flushed already; the ledger takes it back at the next flush
+            pending = self._pending.get(key, 0) - 1
+            if pending:
+                self._pending[key] = pending
+            else:
+                self._pending.pop(key, None)
+            self.refunded += 1
+            return self._status(email, task, used)
+
+    def refund_charge(self, email, task, day):
+        """
+        Give back one generation charged on `day`, possibly by another process
+        (ai_worker.py refunding a job the web tier charged). Unlike refund() it
+        doesn't need this process to have counted the charge; the ledger takes
+        it back at the next flush.
+        """
+        if day != datetime.date.today():
+            # Charged yesterday: today's count has nothing to give back
+            return
+        self._ensure_started()
+        email = email.strip().lower()
+        key = (email, task, day)
+        with self._lock:
+            self._track(key)
+            self._used[key] = max(self._used[key] - 1, 0)
+            self._pending[key] = self._pending.get(key, 0) - 1
+            self.refunded += 1
+
+    def peek(self, email, task):
+        """The quota status without using any of it"""
+        self._ensure_started()
+        email = email.strip().lower()
+        key = (email, task, datetime.date.today())
+        with self._lock:
+            self._track(key)
+            return self._status(email, task, self._used[key])
+
+    def _flush_loop(self):
+        self._load_overrides()
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            woken = self._wake.wait(max(next_flush - time.monotonic(), 0))
+            if self._stop.is_set():
+                # close() does the last flush
+                return
+            if woken:
+                self._wake.clear()
+                self._read_unread()
+            if time.monotonic() >= next_flush:
+                self.flush()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def _read_unread(self):
+        """Read today's counts for the users seen since the last read"""
+        with self._lock:
+            unread, self._unread = self._unread, set()
+        try:
+            self._refresh_used(sorted({email for email, _, _ in unread}))
+        except mysql.connector.Error as err:
+            # Fail open: the quota caps spend, it shouldn't take the AI features down with MySQL.
+            # The next flush reads these users' counts again.
+            logger.warning("Could not read quota ledger: %s", err)
+
+    def flush(self):
+        """Write queued increments to the ledger, then refresh today's counts and the overrides"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            today = datetime.date.today()
+            # Yesterday's counters are no longer needed once flushed
+            for key in [key for key in self._used if key[2] < today and key not in pending]:
+                del self._used[key]
+
+        if pending:
+            try:
+                conn = get_db_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.executemany("""
+                        INSERT INTO ai_quota_ledger (email, task, day, used, updated_at)
+                        VALUES (%s, %s, %s, %s, NOW())
+                        ON DUPLICATE KEY UPDATE used = used + VALUES(used), updated_at = NOW()
+                    """, [(email, task, day, count) for (email, task, day), count in pending.items()])
+                    conn.commit()
+                    cursor.close()
+                finally:
+                    conn.close()
+            except mysql.connector.Error as err:
+                logger.error("Quota ledger flush failed, will retry: %s", err)
+                with self._lock:
+                    for key, count in pending.items():
+                        self._pending[key] = self._pending.get(key, 0) + count
+                    self.flush_errors += 1
+                return
+
+            with self._lock:
+                self.flushes += 1
+                self.rows_flushed += len(pending)
+
+        try:
+            self._refresh_used()
+            self._load_overrides()
+        except mysql.connector.Error as err:
+            logger.warning("Could not refresh quota counters: %s", err)
+
+    def _refresh_used(self, emails=None, chunk_size=500):
+        """Pick up what other processes used today for the given users, or all users this process has seen"""
+        today = datetime.date.today()
+        if emails is None:
+            with self._lock:
+                emails = sorted({email for email, _, day in self._used if day == today})
+        if not emails:
+            return
+
+        rows = []
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(emails), chunk_size):
+                chunk = emails[start:start + chunk_size]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f"""
+                    SELECT email, task, used FROM ai_quota_ledger
+                    WHERE day = %s AND email IN ({placeholders})
+                """, (today, *chunk))
+                rows.extend(cursor.fetchall())
+            cursor.close()
+        finally:
+            conn.close()
+
+        with self._lock:
+            for email, task, used in rows:
+                key = (email, task, today)
+                if key in self._used:
+                    # Increments made since this flush started aren't in the ledger yet
+                    self._used[key] = used + self._pending.get(key, 0)
+
+    def _load_overrides(self):
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT email, task, daily_limit FROM ai_quota_overrides")
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+        except mysql.connector.Error as err:
+            logger.warning("Could not load quota overrides: %s", err)
+            return
+        with self._lock:
+            self._overrides = {(email, task): limit for email, task, limit in rows}
+
+    def set_override(self, email, task, daily_limit, reason=None):
+        """Give a user a different daily limit for one task (or ALL_TASKS); negative means unlimited"""
+        email = email.strip().lower()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO ai_quota_overrides (email, task, daily_limit, reason, updated_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE daily_limit = VALUES(daily_limit), reason = VALUES(reason), updated_at = NOW()
+            """, (email, task, daily_limit, reason))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        # Other processes pick it up at their next flush
+        with self._lock:
+            self._overrides[(email, task)] = daily_limit
+
+    def delete_override(self, email, task):
+        email = email.strip().lower()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM ai_quota_overrides WHERE email = %s AND task = %s", (email, task))
+            deleted = cursor.rowcount
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        with self._lock:
+            self._overrides.pop((email, task), None)
+        return deleted > 0
+
+    def usage(self, email, tasks):
+        """Today's quota status of every task for one user, plus their overrides"""
+        email = email.strip().lower()
+        with self._lock:
+            for task in tasks:
+                self._track((email, task, datetime.date.today()))
+        # An admin page, not the request path: read the current counts now
+        self._refresh_used([email])
+        statuses = {task: self.peek(email, task) for task in tasks}
+        with self._lock:
+            overrides = {task: limit for (override_email, task), limit in self._overrides.items()
+                         if override_email == email}
+        return {"email": email, "tasks": statuses, "overrides": overrides}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked_counters": len(self._used),
+                "pending_increments": sum(self._pending.values()),
+                "overrides": len(self._overrides),
+                "flush_interval": self.flush_interval,
+                "consumed": self.consumed,
+                "refunded": self.refunded,
+                "rejected": self.rejected,
+                "flushes": self.flushes,
+                "rows_flushed": self.rows_flushed,
+                "flush_errors": self.flush_errors
+            }
+
+    def close(self):
+        """Stop the flush thread and write what is still queued"""
+        if not self._started:
+            return
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+ledger = QuotaLedger()
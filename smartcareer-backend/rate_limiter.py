@@ -0,0 +1,211 @@
+"""
+Thread-safe token bucket rate limiting for the AI services
+
+Each limiter has a global bucket and one bucket per user. A call takes one token
+from both. When no token is available the caller can wait for a refill in a
+bounded queue until its deadline instead of failing straight away.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from functools import wraps
+from cachetools import LRUCache
+
+logger = logging.getLogger('rate_limiter')
+
+class RateLimitExceeded(Exception):
+    """Raised when a call can't get a token before its deadline"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Bucket refilled continuously at `rate` tokens per second up to `capacity`; not locked itself"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until_token(self):
+        """Seconds until one whole token is available (0 if it already is)"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Global plus per-user token buckets guarded by one lock"""
+
+    def __init__(self, name, per_minute, per_user_per_minute=None,
+                 max_queue=0, max_wait=0.0, max_users=10000):
+        self.name = name
+        self.per_minute = per_minute
+        self.per_user_per_minute = per_user_per_minute
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._global = TokenBucket(per_minute / 60.0, per_minute)
+        # Least recently seen users are dropped first; a dropped user simply
+        # starts again with a full bucket
+        self._users = LRUCache(maxsize=max_users)
+        self._cond = threading.Condition()
+        self._waiting = 0
+
+        self.acquired = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def _user_bucket(self, user_key):
+        if user_key is None or not self.per_user_per_minute:
+            return None
+        bucket = self._users.get(user_key)
+        if bucket is None:
+            bucket = TokenBucket(self.per_user_per_minute / 60.0, self.per_user_per_minute)
+            self._users[user_key] = bucket
+        return bucket
+
+    def _try_take(self, user_key, now, include_global=True):
+        """Take a token from every applicable bucket, or return the seconds to wait"""
+        buckets = [self._global] if include_global else []
+        user_bucket = self._user_bucket(user_key)
+        if user_bucket is not None:
+            buckets.append(user_bucket)
+
+        wait = 0.0
+        for bucket in buckets:
+            bucket.refill(now)
+            wait = max(wait, bucket.time_until_token())
+        if wait > 0:
+            return wait
+
+        for bucket in buckets:
+            bucket.tokens -= 1
+        return 0.0
+
+    def acquire(self, user_key=None, timeout=None, include_global=True):
+        """
+        Take a token for `user_key`, waiting up to `timeout` seconds (capped at
+        max_wait) in the wait queue. Raises RateLimitExceeded if the queue is
+        full or no token frees up in time. With include_global=False only the
+        user's bucket is charged (for callers whose requests are batched and
+        pay the global token once per batch).
+        """
+        max_wait = self.max_wait if timeout is None else min(timeout, self.max_wait)
+        deadline = time.monotonic() + max(max_wait, 0)
+        queued = False
+
+        with self._cond:
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._try_take(user_key, now, include_global)
+                    if wait == 0:
+                        self.acquired += 1
+                        if queued:
+                            self.waited += 1
+                        return
+
+                    if now + wait > deadline:
+                        self.rejected += 1
+                        logger.warning("Rate limit exceeded for %s (user=%s)", self.name, user_key)
+                        raise RateLimitExceeded("Rate limit exceeded. Please try again later.", retry_after=wait)
+
+                    if not queued:
+                        if self._waiting >= self.max_queue:
+                            self.rejected += 1
+                            logger.warning("Rate limit wait queue full for %s (%s waiting)", self.name, self.max_queue)
+                            raise RateLimitExceeded("Rate limit exceeded. Please try again later.", retry_after=wait)
+                        self._waiting += 1
+                        queued = True
+
+                    self._cond.wait(wait)
+            finally:
+                if queued:
+                    self._waiting -= 1
+
+    async def acquire_async(self, user_key=None, timeout=None, include_global=True):
+        """
+        acquire() for coroutines: waits with asyncio.sleep instead of blocking
+        the thread. Shares the buckets and the wait queue with acquire().
+        """
+        max_wait = self.max_wait if timeout is None else min(timeout, self.max_wait)
+        deadline = time.monotonic() + max(max_wait, 0)
+        queued = False
+
+        try:
+            while True:
+                with self._cond:
+                    now = time.monotonic()
+                    wait = self._try_take(user_key, now, include_global)
+                    if wait == 0:
+                        self.acquired += 1
+                        if queued:
+                            self.waited += 1
+                        return
+
+                    if now + wait > deadline:
+                        self.rejected += 1
+                        logger.warning("Rate limit exceeded for %s (user=%s)", self.name, user_key)
+                        raise RateLimitExceeded("Rate limit exceeded. Please try again later.", retry_after=wait)
+
+                    if not queued:
+                        if self._waiting >= self.max_queue:
+                            self.rejected += 1
+                            logger.warning("Rate limit wait queue full for %s (%s waiting)", self.name, self.max_queue)
+                            raise RateLimitExceeded("Rate limit exceeded. Please try again later.", retry_after=wait)
+                        self._waiting += 1
+                        queued = True
+
+                await asyncio.sleep(wait)
+        finally:
+            if queued:
+                with self._cond:
+                    self._waiting -= 1
+
+    def limit(self, func):
+        """
+        Decorator taking a token before each call. The wrapped function accepts
+        optional `user_key` and `wait_timeout` (seconds) keywords.
+        """
+        @wraps(func)
+        def wrapper(*args, user_key=None, wait_timeout=None, **kwargs):
+            self.acquire(user_key, timeout=wait_timeout)
+            return func(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._global.refill(now)
+            return {
+                "name": self.name,
+                "global_tokens": round(self._global.tokens, 2),
+                "global_capacity": self._global.capacity,
+                "per_minute": self.per_minute,
+                "per_user_per_minute": self.per_user_per_minute,
+                "tracked_users": len(self._users),
+                "max_tracked_users": self._users.maxsize,
+                "queue_depth": self._waiting,
+                "max_queue": self.max_queue,
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "rejected": self.rejected
+            }
+
+    def user_tokens(self, user_key):
+        """Tokens currently available to one user (None if per-user limits are off)"""
+        with self._cond:
+            bucket = self._users.get(user_key) if self.per_user_per_minute else None
+            if bucket is None:
+                return self.per_user_per_minute
+            bucket.refill(time.monotonic())
+            return round(bucket.tokens, 2)
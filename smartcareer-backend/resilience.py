@@ -0,0 +1,282 @@
+"""
+Resilient model calls: retries with backoff, per-model circuit breakers and
+automatic fallback to config.FALLBACK_MODEL
+
+A breaker watches the last AI_BREAKER_WINDOW calls to a model. It opens when
+too many of them failed or were slow. While it is open, calls go to the
+fallback model. After AI_BREAKER_OPEN_SECONDS a single trial call is let
+through (half-open), and its outcome closes or re-opens the breaker.
+"""
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+import config
+import metrics
+import quota
+from deadline import DeadlineExceeded
+
+logger = logging.getLogger('resilience')
+
+# Provider errors worth retrying, by class name so this module doesn't depend
+# on any particular SDK (google.api_core, requests, ...)
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'Aborted', 'RetryError',
+    'Timeout', 'ConnectTimeout', 'ReadTimeout', 'ConnectionError',
+}
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class CircuitOpenError(Exception):
+    """Raised when neither the primary nor the fallback model is accepting calls"""
+
+def is_retryable(error):
+    """Return True for transient provider errors (throttling, 5xx, timeouts, network)"""
+    if isinstance(error, DeadlineExceeded):
+        # Our own request budget ran out; retrying can't help
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, 'code', None) or getattr(error, 'status_code', None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt, base_delay=None, max_delay=None):
+    """Exponential backoff with full jitter for the given (0-based) attempt"""
+    base_delay = config.AI_RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = config.AI_RETRY_MAX_DELAY if max_delay is None else max_delay
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker for one model"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, window=None, min_calls=None, error_rate=None,
+                 slow_call_seconds=None, slow_call_rate=None, open_seconds=None):
+        self.name = name
+        self.min_calls = min_calls or config.AI_BREAKER_MIN_CALLS
+        self.error_rate = error_rate or config.AI_BREAKER_ERROR_RATE
+        self.slow_call_seconds = slow_call_seconds or config.AI_BREAKER_SLOW_CALL_SECONDS
+        self.slow_call_rate = slow_call_rate or config.AI_BREAKER_SLOW_CALL_RATE
+        self.open_seconds = open_seconds or config.AI_BREAKER_OPEN_SECONDS
+
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window or config.AI_BREAKER_WINDOW)  # (ok, latency)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+        self.total_calls = 0
+        self.total_failures = 0
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self):
+        """Return True if a call may go to this model right now"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency):
+        self._record(True, latency)
+
+    def record_failure(self, latency):
+        self._record(False, latency)
+
+    def release(self):
+        """Forget a call that ended without telling us anything about provider health"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _record(self, ok, latency):
+        with self._lock:
+            now = time.monotonic()
+            self.total_calls += 1
+            if not ok:
+                self.total_failures += 1
+            slow = latency >= self.slow_call_seconds
+
+            if self._current_state(now) == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if ok and not slow:
+                    logger.info("Circuit for %s closed after successful trial call", self.name)
+                    self._state = self.CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+
+            self._calls.append((ok, latency))
+            if self._state == self.CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for call_ok, _ in self._calls if not call_ok)
+                slow_calls = sum(1 for _, call_latency in self._calls if call_latency >= self.slow_call_seconds)
+                if failures / len(self._calls) >= self.error_rate or slow_calls / len(self._calls) >= self.slow_call_rate:
+                    self._open(now)
+
+    def _open(self, now):
+        logger.warning("Circuit for %s opened for %ss", self.name, self.open_seconds)
+        self._state = self.OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.times_opened += 1
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            window = list(self._calls)
+            return {
+                "model": self.name,
+                "state": state,
+                "window_calls": len(window),
+                "window_failures": sum(1 for ok, _ in window if not ok),
+                "window_avg_latency": round(sum(latency for _, latency in window) / len(window), 3) if window else None,
+                "total_calls": self.total_calls,
+                "total_failures": self.total_failures,
+                "times_opened": self.times_opened
+            }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+# Per-model retry and fallback counters
+_counters = {}
+_counters_lock = threading.Lock()
+
+def get_breaker(model_name):
+    with _breakers_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = CircuitBreaker(model_name)
+            _breakers[model_name] = breaker
+        return breaker
+
+def _count(model_name, counter):
+    with _counters_lock:
+        counts = _counters.setdefault(model_name, {"retries": 0, "fallbacks": 0})
+        counts[counter] += 1
+
+def select_model(model_name, fallback_model=None):
+    """
+    Pick the model to call: the primary while its breaker allows it, otherwise
+    the fallback. Raises CircuitOpenError if neither is available.
+    """
+    if get_breaker(model_name).allow_request():
+        return model_name
+    if fallback_model and fallback_model != model_name and get_breaker(fallback_model).allow_request():
+        logger.warning("Circuit for %s is open, routing to fallback model %s", model_name, fallback_model)
+        _count(model_name, "fallbacks")
+        return fallback_model
+    raise CircuitOpenError(f"Circuit open for {model_name} and no fallback available")
+
+def call_with_resilience(func, model_name, fallback_model=None, max_attempts=None, deadline=None):
+    """
+    Call func(model) with retries, backoff and circuit breaking.
+
+    Returns (result, model_used). Retryable provider errors count against the
+    model's breaker and are retried after a jittered exponential backoff; other
+    errors are raised immediately. With a deadline, no attempt or backoff
+    sleep is started once the remaining budget is too small.
+    """
+    max_attempts = max_attempts or config.AI_MAX_RETRIES
+    for attempt in range(max_attempts):
+        if deadline is not None:
+            deadline.check(f"calling {model_name}")
+        model = select_model(model_name, fallback_model)
+        breaker = get_breaker(model)
+        started = time.monotonic()
+        try:
+            result = func(model)
+        except Exception as e:
+            latency = time.monotonic() - started
+            metrics.observe_ai_call(model, 'error', latency)
+            if not is_retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure(latency)
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and delay + config.AI_MIN_CALL_BUDGET > deadline.remaining():
+                logger.warning("Not retrying %s: only %.2fs of the deadline left", model, deadline.remaining())
+                raise
+            _count(model, "retries")
+            logger.warning("Retryable error from %s (attempt %s/%s), retrying in %.2fs: %s",
+                           model, attempt + 1, max_attempts, delay, e)
+            time.sleep(delay)
+            continue
+
+        latency = time.monotonic() - started
+        metrics.observe_ai_call(model, 'ok', latency)
+        quota.record_model_call()
+        breaker.record_success(latency)
+        return result, model
+
+async def acall_with_resilience(func, model_name, fallback_model=None, max_attempts=None, deadline=None):
+    """call_with_resilience() for a coroutine function func(model); backoff waits don't block the thread"""
+    max_attempts = max_attempts or config.AI_MAX_RETRIES
+    for attempt in range(max_attempts):
+        if deadline is not None:
+            deadline.check(f"calling {model_name}")
+        model = select_model(model_name, fallback_model)
+        breaker = get_breaker(model)
+        started = time.monotonic()
+        try:
+            result = await func(model)
+        except Exception as e:
+            latency = time.monotonic() - started
+            metrics.observe_ai_call(model, 'error', latency)
+            if not is_retryable(e):
+                breaker.release()
+                raise
+            breaker.record_failure(latency)
+            if attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and delay + config.AI_MIN_CALL_BUDGET > deadline.remaining():
+                logger.warning("Not retrying %s: only %.2fs of the deadline left", model, deadline.remaining())
+                raise
+            _count(model, "retries")
+            logger.warning("Retryable error from %s (attempt %s/%s), retrying in %.2fs: %s",
+                           model, attempt + 1, max_attempts, delay, e)
+            await asyncio.sleep(delay)
+            continue
+
+        latency = time.monotonic() - started
+        metrics.observe_ai_call(model, 'ok', latency)
+        quota.record_model_call()
+        breaker.record_success(latency)
+        return result, model
+
+def breaker_stats():
+    """Breaker state and retry/fallback counters for every model called so far"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    with _counters_lock:
+        counters = {model: dict(counts) for model, counts in _counters.items()}
+    stats = {}
+    for breaker in breakers:
+        stats[breaker.name] = breaker.stats()
+        stats[breaker.name].update(counters.get(breaker.name, {"retries": 0, "fallbacks": 0}))
+    return stats
@@ -0,0 +1,222 @@
+"""
+Similarity cache for AI results
+
+Many users have nearly the same profile (the same campus internships, the same
+certificates), so their feedback, advice and roadmaps would be nearly the same
+too. Each profile is reduced to a set of features - skills, roles, companies
+and milestone titles, plus the words in roles and titles - hashed into a fixed
+size vector. Vectors are weighted by TF-IDF over the stored profiles, so common
+features ("intern", "python") count less than distinctive ones, and compared by
+cosine similarity with NumPy. A stored result is reused when the best match
+clears config.AI_SIMILARITY_THRESHOLD.
+
+The weighted, normalized matrix is rebuilt by store() (the IDF weights change
+with every stored profile), so a lookup is a single matrix-vector product and
+runs outside the lock.
+
+Every reuse is logged and kept in a bounded audit trail with the similarity
+score and hashed user identifiers.
+"""
+
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+import config
+
+logger = logging.getLogger('similarity_cache')
+
+def normalize_feature(text):
+    return ' '.join(str(text).lower().split()) if text else ''
+
+def hash_user(email):
+    """Short stable identifier for the audit trail, so emails aren't stored"""
+    if not email:
+        return None
+    return hashlib.sha256(email.strip().lower().encode('utf-8')).hexdigest()[:12]
+
+def profile_features(user_data):
+    """The set of features that decide whether two profiles get the same answer"""
+    features = set()
+
+    def add(kind, text, words=False):
+        text = normalize_feature(text)
+        if not text:
+            return
+        features.add(f"{kind}:{text}")
+        if words:
+            features.update(f"{kind}_word:{word}" for word in text.split() if len(word) > 2)
+
+    skills = user_data.get('skills') or []
+    if isinstance(skills, str):
+        skills = skills.split(',')
+    for skill in skills:
+        add('skill', skill)
+
+    for exp in user_data.get('internships') or []:
+        if isinstance(exp, dict):
+            add('role', exp.get('role'), words=True)
+            add('company', exp.get('company'))
+        else:
+            add('internship', exp, words=True)
+
+    for exp in user_data.get('milestones') or []:
+        if isinstance(exp, dict):
+            add('milestone', exp.get('title'), words=True)
+        else:
+            add('milestone', exp, words=True)
+
+    return features
+
+class SimilarityCache:
+    """Fixed-capacity store of (feature vector, result) pairs for one task"""
+
+    def __init__(self, task, dimensions=None, maxsize=None, threshold=None, ttl=None):
+        self.task = task
+        self.dimensions = dimensions or config.AI_SIMILARITY_DIMENSIONS
+        self.maxsize = maxsize or config.AI_SIMILARITY_CACHE_SIZE
+        self.threshold = config.AI_SIMILARITY_THRESHOLD if threshold is None else threshold
+        self.ttl = ttl or config.CACHE_TIMEOUT
+
+        self._lock = threading.Lock()
+        # Row i holds the hashed feature counts of slot i; slots are reused round-robin
+        self._vectors = np.zeros((self.maxsize, self.dimensions), dtype=np.float32)
+        self._doc_freq = np.zeros(self.dimensions, dtype=np.float32)
+        # Rows of _vectors weighted by _idf_weights and scaled to unit length; replaced, never modified in place
+        self._idf_weights = np.ones(self.dimensions, dtype=np.float32)
+        self._normalized = np.zeros((self.maxsize, self.dimensions), dtype=np.float32)
+        self._expires = np.zeros(self.maxsize, dtype=np.float64)
+        self._entries = [None] * self.maxsize
+        self._slots = {}  # profile fingerprint -> slot
+        self._next = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+    def vectorize(self, features):
+        """Signed feature hashing into a dense vector"""
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in features:
+            digest = hashlib.md5(feature.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    def _idf(self):
+        stored = len(self._slots)
+        return np.log((1.0 + stored) / (1.0 + self._doc_freq)) + 1.0
+
+    def _reweight(self):
+        """Recompute the IDF weights and the normalized matrix; called with the lock held"""
+        idf = self._idf().astype(np.float32)
+        weighted = self._vectors * idf
+        norms = np.linalg.norm(weighted, axis=1)
+        norms[norms == 0] = np.inf
+        weighted /= norms[:, None]
+        self._idf_weights = idf
+        self._normalized = weighted
+
+    def lookup(self, user_data):
+        """Return (result, similarity, match) for the most similar stored profile, or None"""
+        features = profile_features(user_data)
+        if not features:
+            return None
+        query = self.vectorize(features)
+
+        with self._lock:
+            self.lookups += 1
+            live = self._expires > time.time()
+            if not live.any():
+                return None
+            # store() replaces these rather than writing to them, so they stay consistent after the lock is released
+            idf, normalized, entries = self._idf_weights, self._normalized, list(self._entries)
+
+        weighted_query = query * idf
+        query_norm = np.linalg.norm(weighted_query)
+        if query_norm == 0:
+            return None
+        similarities = normalized @ (weighted_query / query_norm)
+        similarities[~live] = -1.0
+
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            return None
+
+        entry = entries[best]
+        result = copy.deepcopy(entry['result'])
+        with self._lock:
+            self.hits += 1
+
+        match = {
+            "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "task": self.task,
+            "similarity": round(similarity, 4),
+            "user": hash_user(user_data.get('email')),
+            "matched_user": entry['user'],
+            "matched_profile": entry['fingerprint'],
+            "matched_at": entry['stored_at'],
+        }
+        record_match(match)
+        logger.info("Reusing %s of profile %s (similarity %.3f) for user %s",
+                    self.task, entry['fingerprint'], similarity, match['user'])
+        return result, similarity, match
+
+    def store(self, user_data, result):
+        """Remember a result for this profile, replacing an older one for the same profile"""
+        features = profile_features(user_data)
+        if not features:
+            return
+        vector = self.vectorize(features)
+        fingerprint = hashlib.sha256('\n'.join(sorted(features)).encode('utf-8')).hexdigest()[:16]
+
+        with self._lock:
+            slot = self._slots.get(fingerprint)
+            if slot is None:
+                slot = self._next
+                self._next = (self._next + 1) % self.maxsize
+                old = self._entries[slot]
+                if old is not None:
+                    self._slots.pop(old['fingerprint'], None)
+            self._doc_freq -= self._vectors[slot] != 0
+            self._vectors[slot] = vector
+            self._doc_freq += vector != 0
+            self._expires[slot] = time.time() + self.ttl
+            self._entries[slot] = {
+                "fingerprint": fingerprint,
+                "user": hash_user(user_data.get('email')),
+                "stored_at": time.strftime('%Y-%m-%d %H:%M:%S'),
+                "result": copy.deepcopy(result),
+            }
+            self._slots[fingerprint] = slot
+            self._reweight()
+            self.stores += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "task": self.task,
+                "size": len(self._slots),
+                "maxsize": self.maxsize,
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "stores": self.stores,
+                "hit_ratio": round(self.hits / self.lookups, 4) if self.lookups else 0.0
+            }
+
+_audit_lock = threading.Lock()
+_audit = deque(maxlen=config.AI_SIMILARITY_AUDIT_SIZE)
+
+def record_match(match):
+    with _audit_lock:
+        _audit.append(match)
+
+def recent_matches():
+    """Most recent reuses first"""
+    with _audit_lock:
+        return list(reversed(_audit))
@@ -0,0 +1,108 @@
+"""
+Single-flight request coalescing
+
+When several threads ask for the same key at once, only the first one runs the
+call. The others wait on its future and receive the same result or exception.
+AsyncSingleFlight does the same for coroutines on one event loop.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into a single execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, timeout=None, **kwargs):
+        """
+        Run func(*args, **kwargs) unless an identical call is already in flight.
+
+        `timeout` bounds how long a follower waits for the leader's result; the
+        leader itself is not interrupted.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            try:
+                return future.result(timeout)
+            except FutureTimeoutError:
+                raise TimeoutError(f"Timed out after {timeout:.2f}s waiting for an identical in-flight request")
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executed": self.executed,
+                "coalesced": self.coalesced
+            }
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines; use one instance per event loop"""
+
+    def __init__(self):
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, timeout=None, **kwargs):
+        """Await func(*args, **kwargs) unless an identical call is already in flight"""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                # Shielded: a follower giving up must not cancel the leader's call
+                return await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timed out after {timeout:.2f}s waiting for an identical in-flight request")
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.executed += 1
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so a call without followers doesn't log "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced
+        }
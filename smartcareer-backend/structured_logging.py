@@ -0,0 +1,327 @@
+"""
+Structured logging for the web app
+
+configure() sends every log record through a bounded queue to a background
+thread. That thread formats each record as one JSON object per line (or as
+LOG_FORMAT text) and writes it, so a request thread only pays for building
+the record. Debug and info records from a request are kept for a sampled
+share of requests, with a rate per route (LOG_SAMPLE_RATE and
+LOG_ROUTE_SAMPLE_RATES). Warnings and errors are always kept. Values that
+look like secrets are redacted and long values are truncated before they are
+written; wrap whole payloads in Payload() so that work is only done for
+records that are written.
+
+The level and the sample rates can be changed while the server runs through
+/api/admin/logging. With LOG_SETTINGS_FILE set, a change is also saved there
+and every worker process picks it up within LOG_SETTINGS_POLL seconds.
+"""
+
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+import config
+
+logger = logging.getLogger('structured_logging')
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+REDACTED = '[REDACTED]'
+
+# Keys whose values are never written, matched as substrings (current_password, X-Admin-Token, ...)
+SENSITIVE_KEYS = ('password', 'passwd', 'secret', 'token', 'api_key', 'apikey', 'authorization', 'cookie')
+# The same keys inside an already formatted message: key=value, key: value, 'key': 'value'
+SENSITIVE_TEXT = re.compile(
+    r"(?i)((?:password|passwd|secret|token|api_key|apikey|authorization|cookie)[\w-]*[\"']?\s*[:=]\s*)"
+    r"(\"[^\"]*\"|'[^']*'|[^\s,;&}]+)"
+)
+
+# Argument types that can't change between the log call and the background write
+IMMUTABLE_ARGS = (str, int, float, bool, type(None), bytes)
+
+# Attributes every LogRecord has; anything else came from `extra=` and is written as a field
+RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime', 'taskName'}
+
+_route = contextvars.ContextVar('log_route', default=None)
+_request_id = contextvars.ContextVar('log_request_id', default=None)
+_sampled = contextvars.ContextVar('log_sampled', default=True)
+
+def truncate(text, limit=None):
+    limit = config.LOG_MAX_FIELD_LENGTH if limit is None else limit
+    if limit and len(text) > limit:
+        return f"{text[:limit]}... [{len(text) - limit} more chars]"
+    return text
+
+def redact_text(text):
+    """Blank out key=value style secrets in formatted text"""
+    return SENSITIVE_TEXT.sub(lambda m: m.group(1) + REDACTED, text)
+
+def is_sensitive(key):
+    key = str(key).lower()
+    return any(name in key for name in SENSITIVE_KEYS)
+
+def redact(value, depth=0):
+    """A copy of value with secret-looking keys redacted and long strings truncated"""
+    if depth > 5:
+        return truncate(str(value))
+    if isinstance(value, dict) or hasattr(value, 'items'):
+        return {str(key): REDACTED if is_sensitive(key) else redact(item, depth + 1) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item, depth + 1) for item in value]
+    if isinstance(value, str):
+        return truncate(value)
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return truncate(str(value))
+
+class Payload:
+    """Log argument that is redacted, truncated and serialized only if its record is written"""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(redact(self.value), default=str, ensure_ascii=False)
+
+    __repr__ = __str__
+
+class LogSettings:
+    """The runtime-adjustable level and sample rates, shared with other workers through LOG_SETTINGS_FILE"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.level = config.LOG_LEVEL
+        self.sample_rate = config.LOG_SAMPLE_RATE
+        self.route_sample_rates = dict(config.LOG_ROUTE_SAMPLE_RATES)
+        self._file_mtime = None
+        self._next_poll = 0.0
+
+    def sample_rate_for(self, route):
+        return self.route_sample_rates.get(route, self.sample_rate)
+
+    def should_sample(self, route):
+        rate = self.sample_rate_for(route)
+        return rate >= 1.0 or random.random() < rate
+
+    def as_dict(self):
+        return {
+            "level": self.level,
+            "sample_rate": self.sample_rate,
+            "route_sample_rates": dict(self.route_sample_rates)
+        }
+
+    def update(self, level=None, sample_rate=None, route_sample_rates=None, persist=True):
+        """Validate and apply new settings; raises ValueError on a bad value"""
+        if level is not None:
+            level = str(level).upper()
+            if level not in LEVELS:
+                raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+        for rate in [sample_rate] + list((route_sample_rates or {}).values()):
+            if rate is not None and not 0.0 <= float(rate) <= 1.0:
+                raise ValueError("Sample rates must be between 0 and 1")
+
+        with self._lock:
+            if level is not None:
+                self.level = level
+            if sample_rate is not None:
+                self.sample_rate = float(sample_rate)
+            if route_sample_rates is not None:
+                self.route_sample_rates = {route: float(rate) for route, rate in route_sample_rates.items()}
+            self.apply()
+            if persist and config.LOG_SETTINGS_FILE:
+                self._save()
+        return self.as_dict()
+
+    def apply(self):
+        logging.getLogger().setLevel(self.level)
+
+    def _save(self):
+        path = config.LOG_SETTINGS_FILE
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f)
+        os.replace(temp_path, path)
+        self._file_mtime = os.stat(path).st_mtime
+
+    def poll(self):
+        """Pick up settings another worker saved; at most one stat() per LOG_SETTINGS_POLL seconds"""
+        if not config.LOG_SETTINGS_FILE:
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + config.LOG_SETTINGS_POLL
+        try:
+            mtime = os.stat(config.LOG_SETTINGS_FILE).st_mtime
+            if mtime == self._file_mtime:
+                return
+            with open(config.LOG_SETTINGS_FILE, encoding='utf-8') as f:
+                saved = json.load(f)
+            self.update(persist=False, **{key: saved.get(key) for key in ('level', 'sample_rate', 'route_sample_rates')})
+            self._file_mtime = mtime
+            logger.info("Applied logging settings from %s: %s", config.LOG_SETTINGS_FILE, self.as_dict())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Could not read logging settings from %s: %s", config.LOG_SETTINGS_FILE, e)
+
+settings = LogSettings()
+
+# Records not written: sampled out, or dropped because the queue was full
+_counters = {"sampled_out": 0, "dropped": 0}
+_counters_lock = threading.Lock()
+
+def _count(key):
+    # Incremented from every request thread
+    with _counters_lock:
+        _counters[key] += 1
+
+def start_request(route):
+    """Tag this request's records with the route and a request id, and decide whether its info logs are kept"""
+    settings.poll()
+    _route.set(route)
+    _request_id.set(uuid.uuid4().hex[:12])
+    _sampled.set(settings.should_sample(route))
+
+def end_request():
+    _route.set(None)
+    _request_id.set(None)
+    _sampled.set(True)
+
+class SamplingFilter(logging.Filter):
+    """
+    Drop debug/info records of requests that were not sampled. Runs in the
+    thread that logs, before the record is queued: the sampling decision and the
+    route and request id are context variables of that thread's request.
+    """
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and not _sampled.get():
+            _count("sampled_out")
+            return False
+        record.route = _route.get()
+        record.request_id = _request_id.get()
+        return True
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the writer thread and never blocks the caller"""
+
+    def prepare(self, record):
+        args = record.args
+        values = args.values() if isinstance(args, dict) else (args or ())
+        # Interpolate now only if an argument could change before the writer formats it
+        if not all(isinstance(value, IMMUTABLE_ARGS) for value in values):
+            record.msg = record.getMessage()
+            record.args = None
+        # Tracebacks hold frames that must not outlive the call
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        _ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(redact_text(record.getMessage())),
+            "pid": record.process,
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and value is not None:
+                entry[key] = REDACTED if is_sensitive(key) else redact(value)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    """LOG_FORMAT text with the same redaction and truncation as the JSON output"""
+
+    def formatMessage(self, record):
+        record.message = truncate(redact_text(record.message))
+        return super().formatMessage(record)
+
+_handler = None
+_listener = None
+_listener_lock = threading.Lock()
+
+def _ensure_listener():
+    # The writer thread starts with the first record, so configure() can run before a fork
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                listener = logging.handlers.QueueListener(_handler.queue, _handler.writer)
+                listener.start()
+                _listener = listener
+
+def configure():
+    """Send all logging through the background writer; later calls do nothing"""
+    global _handler
+    if _handler is not None:
+        return
+
+    writer = logging.StreamHandler(sys.stderr)
+    writer.setFormatter(JsonFormatter() if config.LOG_JSON else TextFormatter(config.LOG_FORMAT))
+    handler = BackgroundQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE))
+    handler.writer = writer
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    _handler = handler
+    settings.apply()
+    atexit.register(shutdown)
+
+def after_fork():
+    """The writer thread doesn't survive a fork; give the new process its own queue and thread"""
+    global _listener
+    if _handler is None:
+        return
+    _handler.queue = queue.Queue(config.LOG_QUEUE_SIZE)
+    _listener = None
+
+def shutdown():
+    """Write what is still queued and stop the writer thread"""
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+
+def stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {
+        "settings": settings.as_dict(),
+        "json": config.LOG_JSON,
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "sampled_out": counters["sampled_out"],
+        "dropped": counters["dropped"]
+    }
@@ -0,0 +1,87 @@
+"""
+Batched Hugging Face calls against the local stand-in (hf_stand_in.py)
+
+Run with: python -m pytest test_hf_batching.py
+"""
+
+import threading
+import pytest
+import config
+import ai_service_hf
+import hf_stand_in
+from deadline import Deadline
+from micro_batcher import MicroBatcher
+from rate_limiter import RateLimiter, RateLimitExceeded
+
+BATCH_SIZE = 4
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    server, stats = hf_stand_in.start_server(0, latency=0.05)
+    monkeypatch.setattr(config, 'AI_HF_API_URL', f"http://127.0.0.1:{server.server_address[1]}/models")
+    monkeypatch.setenv('HF_API_KEY', 'stand-in')
+    monkeypatch.setattr(ai_service_hf, 'limiter', RateLimiter('test', per_minute=1000))
+    yield server, stats
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def batcher():
+    # A long wait, so a batch is only sent early when it is full
+    return MicroBatcher('huggingface', ai_service_hf.send_batch, max_batch_size=BATCH_SIZE, max_wait=1.0)
+
+def submit_concurrently(batcher, count):
+    """Submit "caller-<i>" prompts from `count` threads at once; returns each caller's result or exception"""
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def call(i):
+        start.wait()
+        try:
+            results[i] = batcher.submit(ai_service_hf.DEFAULT_MODEL, f"Prompt [marker:caller-{i}]", Deadline(10))
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_single_prompt_is_sent_unbatched(stand_in):
+    server, stats = stand_in
+    texts = ai_service_hf.request_completions(ai_service_hf.DEFAULT_MODEL, ["Prompt [marker:alone]"], Deadline(10))
+    assert texts == ["answer to alone"]
+    assert stats.snapshot()["batch_sizes"] == {"1": 1}
+
+def test_each_caller_gets_its_own_answer(stand_in, batcher):
+    server, stats = stand_in
+    results = submit_concurrently(batcher, 10)
+
+    assert results == [f"answer to caller-{i}" for i in range(10)]
+    # ceil(10 / 4) requests: two full batches and the rest
+    assert stats.snapshot() == {"requests": 3, "inputs": 10, "batch_sizes": {"2": 1, "4": 2}}
+    assert batcher.stats()["batches"] == 3
+
+@pytest.mark.parametrize('status', [500, 429])
+def test_failed_batch_reaches_every_caller(stand_in, batcher, status):
+    server, stats = stand_in
+    server.fail_status = status
+    results = submit_concurrently(batcher, 6)
+
+    assert all(isinstance(result, Exception) and f"Status {status}" in str(result) for result in results)
+    assert stats.snapshot()["requests"] == 2
+    assert batcher.stats()["errors"] == 2
+
+def test_rate_limited_batch_reaches_every_caller(stand_in, batcher, monkeypatch):
+    server, stats = stand_in
+    # One global token: the first batch to be sent takes it, the other is rejected
+    monkeypatch.setattr(ai_service_hf, 'limiter', RateLimiter('test', per_minute=1))
+    results = submit_concurrently(batcher, 2 * BATCH_SIZE)
+
+    answered = [i for i, result in enumerate(results) if isinstance(result, str)]
+    rejected = [i for i, result in enumerate(results) if isinstance(result, RateLimitExceeded)]
+    assert len(answered) == len(rejected) == BATCH_SIZE
+    assert all(results[i] == f"answer to caller-{i}" for i in answered)
+    assert stats.snapshot()["requests"] == 1
@@ -123,10 +123,48 @@ def update_user_profiles_table():
             conn.close()
             logger.info("Database connection closed")
 
+def create_table_if_missing(table_name, create_sql):
+    """Create a table from its CREATE TABLE statement if it does not exist yet"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        if not check_table_exists(cursor, table_name):
+            logger.info(f"Creating {table_name} table...")
+            cursor.execute(create_sql)
+            conn.commit()
+            logger.info(f"{table_name} table created successfully")
+        else:
+            logger.info(f"{table_name} table already exists")
+        
+    except Exception as e:
+        logger.error(f"Error creating {table_name} table: {e}")
+        raise
+    finally:
+        if 'cursor' in locals():
+            cursor.close()
+        if 'conn' in locals() and conn.is_connected():
+            conn.close()
+
+def update_ai_tables():
+    """Create the tables used by the AI job queue, response cache, precomputed results and quotas"""
+    from ai_jobs import CREATE_AI_JOBS_TABLE
+    from ai_cache import CREATE_AI_RESPONSE_CACHE_TABLE
+    from ai_precompute import CREATE_AI_PROFILE_STATE_TABLE, CREATE_AI_PRECOMPUTED_RESULTS_TABLE
+    from quota import CREATE_AI_QUOTA_LEDGER_TABLE, CREATE_AI_QUOTA_OVERRIDES_TABLE
+    
+    create_table_if_missing('ai_jobs', CREATE_AI_JOBS_TABLE)
+    create_table_if_missing('ai_response_cache', CREATE_AI_RESPONSE_CACHE_TABLE)
+    create_table_if_missing('ai_profile_state', CREATE_AI_PROFILE_STATE_TABLE)
+    create_table_if_missing('ai_precomputed_results', CREATE_AI_PRECOMPUTED_RESULTS_TABLE)
+    create_table_if_missing('ai_quota_ledger', CREATE_AI_QUOTA_LEDGER_TABLE)
+    create_table_if_missing('ai_quota_overrides', CREATE_AI_QUOTA_OVERRIDES_TABLE)
+
 if __name__ == "__main__":
     try:
         logger.info("Starting database update process...")
         update_user_profiles_table()
+        update_ai_tables()
         logger.info("Database update completed successfully")
     except Exception as e:
         logger.error(f"Database update failed: {e}")
@@ -0,0 +1,54 @@
+"""
+Production entry point for SmartCareer
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preloading (GUNICORN_PRELOAD, the default) gunicorn imports this module
+once in its master process, so the routes, the AI provider and heavy libraries
+are loaded a single time and shared copy-on-write by every worker. State that
+does not survive a fork (model clients with open channels, thread pools,
+background threads) is rebuilt in each worker by reinit_after_fork(), which
+gunicorn.conf.py calls from its post_fork hook.
+"""
+
+import logging
+import os
+import config
+import ai_provider
+import ai_precompute
+import hedging
+import memory
+import metrics
+import quota
+import structured_logging
+from app import create_app
+
+logger = logging.getLogger('wsgi')
+
+app = create_app()
+
+def warm_up():
+    """Load the AI provider before the workers fork"""
+    try:
+        ai_provider.get_provider()
+        logger.info("AI provider %s loaded before forking", config.AI_PROVIDER)
+    except Exception as e:
+        # Same as without preloading: the AI endpoints report the error when called
+        logger.error("Could not load AI provider %s: %s", config.AI_PROVIDER, e)
+
+def reinit_after_fork():
+    """Give a newly forked worker its own log writer, model client, thread pools, quota flush thread, metrics and RSS baseline"""
+    structured_logging.after_fork()
+    metrics.after_fork()
+    memory.after_fork()
+    ai_provider.after_fork()
+    hedging.after_fork()
+    ai_precompute.after_fork()
+    quota.ledger.after_fork()
+    logger.info("Worker %s re-initialized after fork", os.getpid())
+
+def on_worker_exit():
+    """Write queued quota increments, metrics and log records before a worker exits (shutdown or max_requests recycling)"""
+    quota.ledger.close()
+    metrics.shutdown()
+    structured_logging.shutdown()